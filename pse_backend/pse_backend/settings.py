@@ -83,6 +83,8 @@ CRONJOBS = [
     ('45 11 * * *', 'satellite_app.cron.pull_navigation_satellites'),
     ('0 12 * * *', 'satellite_app.cron.pull_scientific_satellites'),
     ('15 11 * * *', 'satellite_app.cron.pull_country_names'),
+    # After all satellites were pulled
+    ('30 12 * * *', 'satellite_app.cron.screen_conjunctions'),
 ]
 
 LOGGING = {
@@ -215,6 +217,34 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
+# Directory for data generated by the cronjobs, such as the cached
+# downloads from Celestrak and the prebuilt responses of the API.
+DATA_DIR = os.getenv('DATA_DIR', os.path.join(BASE_DIR, 'data'))
+FETCH_CACHE_DIR = os.path.join(DATA_DIR, 'celestrak')
+SNAPSHOT_DIR = os.path.join(DATA_DIR, 'snapshots')
+
+# Cache shared by all workers, so that every worker serves the same cached
+# responses. Uses Redis when 'REDIS_URL' is given, and a directory in the
+# data directory otherwise. The cache keys of the endpoints contain the
+# dataset version, so a new version is served as soon as it is published.
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(DATA_DIR, 'cache'),
+            'OPTIONS': {'MAX_ENTRIES': 1000},
+        }
+    }
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -0,0 +1,156 @@
+"""
+File description:
+Contains the packed binary format of the satellite catalogue, as served by
+the 'catalog' endpoint. Instead of TLE strings it holds the numeric orbital
+elements of every satellite in a fixed-width record, so that clients can
+read them straight into typed arrays without parsing anything.
+
+All values are little-endian. A catalogue consists of:
+- A header of 24 bytes, see HEADER_DTYPE.
+- One record per satellite, see RECORD_DTYPE. Angles are in degrees, the
+    mean motion is in revolutions per day and the epoch is a Unix timestamp.
+- A string table with the UTF-8 encoded names of the satellites. Every
+    record points to its name with 'name_offset' and 'name_length'.
+"""
+
+import numpy as np
+
+from satellite_app import tle
+from satellite_app.models import MinorCategory
+
+
+MAGIC = b'SATC'
+FORMAT_VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S4'),
+    ('format_version', '<u2'),
+    ('record_size', '<u2'),
+    ('count', '<u4'),
+    ('dataset_version', '<u4'),
+    ('strings_size', '<u4'),
+    ('reserved', '<u4'),
+])
+
+# The fields are ordered so that every field is aligned to its own size
+RECORD_DTYPE = np.dtype([
+    ('epoch', '<f8'),
+    ('mean_motion', '<f8'),
+    ('catalog_number', '<u4'),
+    ('category_mask', '<u4'),
+    ('eccentricity', '<f4'),
+    ('inclination', '<f4'),
+    ('raan', '<f4'),
+    ('arg_perigee', '<f4'),
+    ('mean_anomaly', '<f4'),
+    ('bstar', '<f4'),
+    ('name_offset', '<u4'),
+    ('name_length', '<u2'),
+    ('launch_year', '<i2'),
+])
+
+ELEMENT_FIELDS = ['epoch', 'mean_motion', 'eccentricity', 'inclination',
+                  'raan', 'arg_perigee', 'mean_anomaly', 'bstar']
+
+
+def category_mask(categories):
+    """
+    Returns the category bitmask of a list of category names.
+    """
+    mask = 0
+    for category in categories:
+        if category in MinorCategory.MinorCategoryChoices.values:
+            mask |= MinorCategory.bit(category)
+    return mask
+
+
+class CatalogBuilder:
+    """
+    Collects satellites one at a time and packs them
+    into a binary catalogue at the end.
+    """
+
+    def __init__(self):
+        self.columns = {field: [] for field in
+                        ELEMENT_FIELDS + ['catalog_number', 'category_mask',
+                                          'launch_year']}
+        self.names = []
+
+    def add(self, sat, categories):
+        """
+        Adds a satellite and the names of its categories. If its TLE
+        can't be read, its orbital elements are stored as NaN.
+        """
+        try:
+            sat_elements = tle.elements(sat.line1, sat.line2)
+        except ValueError:
+            sat_elements = dict.fromkeys(ELEMENT_FIELDS, float('nan'))
+
+        for field in ELEMENT_FIELDS:
+            self.columns[field].append(sat_elements[field])
+        self.columns['catalog_number'].append(sat.satellite_catalog_number)
+        self.columns['category_mask'].append(category_mask(categories))
+        self.columns['launch_year'].append(sat.launch_year)
+        self.names.append(sat.name.encode('utf-8'))
+
+    def pack(self, dataset_version):
+        """
+        Returns the collected satellites as a binary catalogue.
+        """
+        records = np.zeros(len(self.names), dtype=RECORD_DTYPE)
+        for field, values in self.columns.items():
+            records[field] = values
+        return pack(records, self.names, dataset_version)
+
+
+def pack(records, names, dataset_version):
+    """
+    Packs an array of records and the encoded names belonging to them
+    into a binary catalogue.
+    """
+    lengths = np.fromiter((len(name) for name in names), dtype=np.uint32,
+                          count=len(names))
+    records['name_length'] = lengths
+    records['name_offset'] = np.cumsum(lengths) - lengths
+    strings = b''.join(names)
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = MAGIC
+    header['format_version'] = FORMAT_VERSION
+    header['record_size'] = RECORD_DTYPE.itemsize
+    header['count'] = len(records)
+    header['dataset_version'] = dataset_version
+    header['strings_size'] = len(strings)
+
+    return header.tobytes() + records.tobytes() + strings
+
+
+def unpack(data):
+    """
+    Splits a binary catalogue into its header, its records
+    and the encoded names of the records.
+    """
+    header = np.frombuffer(data, dtype=HEADER_DTYPE, count=1)[0]
+    if header['magic'] != MAGIC:
+        raise ValueError('Not a binary satellite catalogue')
+
+    start = HEADER_DTYPE.itemsize
+    records = np.frombuffer(data, dtype=RECORD_DTYPE,
+                            count=header['count'], offset=start)
+
+    strings = data[start + records.nbytes:]
+    names = [strings[offset:offset + length] for offset, length in
+             zip(records['name_offset'].tolist(),
+                 records['name_length'].tolist())]
+    return header, records, names
+
+
+def select(data, mask):
+    """
+    Returns a binary catalogue with only the satellites of 'data'
+    that belong to at least one of the categories in 'mask'.
+    """
+    header, records, names = unpack(data)
+    keep = np.flatnonzero(records['category_mask'] & mask)
+    return pack(records[keep].copy(), [names[i] for i in keep],
+                header['dataset_version'])
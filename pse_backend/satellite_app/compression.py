@@ -0,0 +1,63 @@
+"""
+File description:
+Contains the content encodings (compression) of the API responses. The
+snapshots are compressed once when they are built, in every encoding that is
+available here; other bodies are compressed when they are served. Brotli is
+optional: without the 'brotli' package, only gzip is offered.
+"""
+
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# The encodings that can be served, in order of preference, with the file
+# extension of their precompressed files
+ENCODINGS = {'br': '.br', 'gzip': '.gz'} if brotli else {'gzip': '.gz'}
+
+# Compression levels for bodies that are compressed once per dataset version
+# ('build') and for bodies that are compressed while serving a request
+BUILD_LEVELS = {'br': 11, 'gzip': 9}
+SERVE_LEVELS = {'br': 5, 'gzip': 6}
+
+
+def compress(data, encoding, build=False):
+    """
+    Compresses bytes with the given encoding. Uses the (slow) highest
+    compression level when 'build' is given.
+    """
+    level = (BUILD_LEVELS if build else SERVE_LEVELS)[encoding]
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    # A fixed mtime keeps the output (and thus its ETag) deterministic
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def negotiate(accept_encoding):
+    """
+    Picks the encoding to use for a request from the value of its
+    'Accept-Encoding' header. Returns None if the body should
+    not be compressed.
+    """
+    qualities = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    best = None
+    best_quality = 0.0
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
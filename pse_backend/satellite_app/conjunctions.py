@@ -0,0 +1,300 @@
+"""
+File description:
+Contains the conjunction screening of the satellites: finding the close
+approaches between any two satellites over a time window. Comparing every
+pair of satellites at every time is far too slow for the whole catalogue, so
+the pairs are pruned in three steps at every time step of the window:
+1. Spatial hashing: only the pairs that are close enough to possibly meet
+   within half a step are found, with the uniform grid of spatial.py.
+2. Apogee/perigee sieve: two satellites whose ranges of distances to the
+   center of the Earth don't overlap can never meet.
+3. Orbital-plane sieve: two satellites can only meet where their orbits
+   cross, near the line where their orbital planes intersect, so two
+   orbits that are far apart along that line can never meet either.
+The closest approach of the remaining pairs is estimated from their relative
+motion, and the approaches that are close enough are refined with SGP4.
+
+The time steps are spread over a pool of processes. The results of a
+screening are stored as Conjunction rows of the screened dataset version,
+and replace the results of earlier screenings.
+"""
+
+import json
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import django
+import numpy as np
+from django.db import transaction
+
+from satellite_app import propagation, spatial
+from satellite_app.models import Conjunction, DatasetVersion
+
+
+# Sets up the logger (see /logs/cron.logs)
+cron_logger = logging.getLogger('cron')
+
+# Default distance (in km) of a conjunction, and seconds covered by a
+# screening
+DEFAULT_CONJUNCTION_DISTANCE = 5.0
+CONJUNCTION_DURATION = 24 * 3600
+
+# Retrieves the distance and the number of processes from environment
+# variables
+CONJUNCTION_DISTANCE = float(os.getenv('CONJUNCTION_DISTANCE',
+                                       DEFAULT_CONJUNCTION_DISTANCE))
+CONJUNCTION_WORKERS = max(1, int(os.getenv('CONJUNCTION_WORKERS',
+                                           os.cpu_count() or 1)))
+
+# Seconds between two time steps, and number of time steps screened at a
+# time by a process
+CONJUNCTION_STEP = 20
+CONJUNCTION_CHUNK_STEPS = 45
+
+# Highest relative speed (in km/s) of two satellites, for two satellites
+# in low orbits flying head-on
+MAX_RELATIVE_SPEED = 16.0
+
+# Margins (in km) of the sieves and of the estimated closest approaches,
+# for the difference between the mean and the real orbits
+RADIAL_MARGIN = 30.0
+PLANE_MARGIN = 10.0
+APPROACH_MARGIN = 2.0
+
+# Orbital planes at a smaller angle (sine) than this are seen as the same
+# plane, which the orbital-plane sieve can't prune
+COPLANAR_SINE = 0.1
+
+# Approaches of a pair found at times closer than this many seconds are the
+# same approach
+APPROACH_WINDOW = 2 * CONJUNCTION_STEP
+
+# Iterations of the refinement of the closest approach with SGP4
+REFINE_ITERATIONS = 8
+
+# Gravitational parameter of the Earth (km^3/s^2), as used by SGP4 (WGS72)
+EARTH_MU = 398600.8
+
+
+def radial_ranges(satrecs):
+    """
+    Returns the perigee and apogee distances (km, from the center of the
+    Earth) of SGP4 records.
+    """
+    mean_motion = np.array([satrec.no_kozai for satrec in satrecs]) / 60
+    eccentricity = np.array([satrec.ecco for satrec in satrecs])
+    with np.errstate(divide='ignore'):
+        semi_major_axis = (EARTH_MU / mean_motion ** 2) ** (1 / 3)
+    return (semi_major_axis * (1 - eccentricity),
+            semi_major_axis * (1 + eccentricity))
+
+
+def plane_sieve(positions, velocities, first, second, distance):
+    """
+    Returns which pairs of satellites (rows 'first' and 'second' of the
+    positions and velocities) have orbits that come within 'distance'
+    (plus a margin) of each other where their orbital planes intersect,
+    or have nearly the same orbital plane.
+    """
+    momentum = np.cross(positions, velocities)
+    normals = momentum / np.linalg.norm(momentum, axis=1)[:, None]
+    # The eccentricity vector and the semi-latus rectum of every orbit
+    eccentricity = (np.cross(velocities, momentum) / EARTH_MU
+                    - positions / np.linalg.norm(positions, axis=1)[:, None])
+    semi_latus = np.einsum('ij,ij->i', momentum, momentum) / EARTH_MU
+
+    nodes = np.cross(normals[first], normals[second])
+    sine = np.linalg.norm(nodes, axis=1)
+    coplanar = sine < COPLANAR_SINE
+    nodes = nodes / np.where(coplanar, 1.0, sine)[:, None]
+
+    # The distances of both orbits from the center of the Earth along
+    # both directions of the line of nodes
+    first_along = np.einsum('ij,ij->i', eccentricity[first], nodes)
+    second_along = np.einsum('ij,ij->i', eccentricity[second], nodes)
+    gaps = np.minimum(
+        np.abs(semi_latus[first] / (1 + first_along)
+               - semi_latus[second] / (1 + second_along)),
+        np.abs(semi_latus[first] / (1 - first_along)
+               - semi_latus[second] / (1 - second_along)))
+    return coplanar | (gaps <= distance + PLANE_MARGIN)
+
+
+def _screen_steps(lines, timestamps, distance):
+    """
+    Screens the satellites with the given TLEs at the given times, and
+    returns the estimated approaches closer than 'distance' (plus a
+    margin): the rows of both satellites, the time and the distance.
+    Runs in a separate process.
+    """
+    propagator = propagation.Propagator(range(len(lines)), lines,
+                                        [0] * len(lines))
+    positions, velocities = propagator.propagate(timestamps)
+    perigees = np.full(len(lines), np.nan)
+    apogees = np.full(len(lines), np.nan)
+    perigees[propagator.valid], apogees[propagator.valid] = radial_ranges(
+        propagator.satrecs)
+
+    # Two satellites that are this far apart can still meet within half a
+    # step, so the grid cells are this large
+    reach = distance + MAX_RELATIVE_SPEED * CONJUNCTION_STEP / 2
+    found = []
+    for index, timestamp in enumerate(np.asarray(timestamps).tolist()):
+        r, v = positions[:, index], velocities[:, index]
+        first, second, _ = spatial.UniformGrid(r, reach).pairs(reach)
+
+        keep = ((perigees[first] - apogees[second]
+                 <= distance + RADIAL_MARGIN)
+                & (perigees[second] - apogees[first]
+                   <= distance + RADIAL_MARGIN))
+        first, second = first[keep], second[keep]
+        keep = plane_sieve(r, v, first, second, distance)
+        first, second = first[keep], second[keep]
+
+        # The closest approach within half a step, moving in straight lines
+        relative_position = r[second] - r[first]
+        relative_velocity = v[second] - v[first]
+        speed_squared = np.einsum('ij,ij->i', relative_velocity,
+                                  relative_velocity)
+        offset = np.clip(
+            -np.einsum('ij,ij->i', relative_position, relative_velocity)
+            / np.maximum(speed_squared, 1e-12),
+            -CONJUNCTION_STEP / 2, CONJUNCTION_STEP / 2)
+        miss = np.linalg.norm(relative_position
+                              + relative_velocity * offset[:, None], axis=1)
+        keep = miss <= distance + APPROACH_MARGIN
+        found.append(np.stack([
+            np.minimum(first, second)[keep], np.maximum(first, second)[keep],
+            timestamp + offset[keep], miss[keep]], axis=1))
+
+    return np.concatenate(found) if found else np.empty((0, 4))
+
+
+def refine_approach(first, second, timestamp):
+    """
+    Refines the time of the closest approach of two SGP4 records near a
+    Unix timestamp with Newton's method on their relative distance.
+    Returns the time, the distance (km) and the relative speed (km/s),
+    or None if the satellites can't be propagated.
+    """
+    for iteration in range(REFINE_ITERATIONS):
+        jd, fraction = propagation.julian_dates(timestamp)
+        states = [satrec.sgp4(float(jd), float(fraction))
+                  for satrec in (first, second)]
+        if states[0][0] or states[1][0]:
+            return None
+        relative_position = np.subtract(states[1][1], states[0][1])
+        relative_velocity = np.subtract(states[1][2], states[0][2])
+        speed_squared = float(relative_velocity @ relative_velocity)
+        step = (-float(relative_position @ relative_velocity) / speed_squared
+                if speed_squared else 0.0)
+        if abs(step) < 1e-3 or iteration == REFINE_ITERATIONS - 1:
+            break
+        # Never step further than the steps of the screening
+        timestamp += max(-CONJUNCTION_STEP, min(CONJUNCTION_STEP, step))
+    return (timestamp, float(np.linalg.norm(relative_position)),
+            math.sqrt(speed_squared))
+
+
+def merge_approaches(found):
+    """
+    Merges the estimated approaches of the same pair of satellites at
+    nearly the same time (found at consecutive steps) into the closest
+    one. Returns the approaches ordered by pair and time.
+    """
+    if not len(found):
+        return found
+    found = found[np.lexsort((found[:, 2], found[:, 1], found[:, 0]))]
+    new_approach = np.ones(len(found), dtype=bool)
+    new_approach[1:] = ((found[1:, 0] != found[:-1, 0])
+                        | (found[1:, 1] != found[:-1, 1])
+                        | (found[1:, 2] - found[:-1, 2] > APPROACH_WINDOW))
+    groups = np.cumsum(new_approach)
+    order = np.lexsort((found[:, 3], groups))
+    firsts = np.flatnonzero(np.diff(groups[order], prepend=0))
+    return found[order[firsts]]
+
+
+def screen(catalog_numbers, lines, start, duration=None, distance=None,
+           workers=None):
+    """
+    Screens the satellites with the given catalog numbers and TLEs for
+    conjunctions closer than 'distance' km, from 'start' (a Unix
+    timestamp) for 'duration' seconds. Returns a list of conjunctions as
+    tuples of both catalog numbers (lowest first), the Unix timestamp,
+    the distance (km) and the relative speed (km/s), ordered by time.
+    """
+    duration = duration or CONJUNCTION_DURATION
+    distance = distance or CONJUNCTION_DISTANCE
+    workers = workers or CONJUNCTION_WORKERS
+
+    timestamps = start + CONJUNCTION_STEP * np.arange(
+        duration // CONJUNCTION_STEP + 1)
+    chunks = [timestamps[offset:offset + CONJUNCTION_CHUNK_STEPS]
+              for offset in range(0, len(timestamps),
+                                  CONJUNCTION_CHUNK_STEPS)]
+    if workers == 1 or len(chunks) <= 1:
+        found = [_screen_steps(lines, chunk, distance) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=django.setup) as executor:
+            found = list(executor.map(_screen_steps, [lines] * len(chunks),
+                                      chunks, [distance] * len(chunks)))
+    found = merge_approaches(np.concatenate(found))
+
+    propagator = propagation.Propagator(catalog_numbers, lines,
+                                        [0] * len(lines))
+    satrecs = dict(zip(propagator.valid.tolist(), propagator.satrecs))
+    conjunctions = []
+    for first, second, timestamp, _ in found.tolist():
+        refined = refine_approach(satrecs[int(first)], satrecs[int(second)],
+                                  timestamp)
+        if refined is None or refined[1] > distance:
+            continue
+        conjunctions.append((
+            int(propagator.catalog_numbers[int(first)]),
+            int(propagator.catalog_numbers[int(second)])) + refined)
+
+    conjunctions.sort(key=lambda conjunction: conjunction[2])
+    return conjunctions
+
+
+def screen_snapshot(snapshot, start=None, duration=None, distance=None,
+                    workers=None):
+    """
+    Screens the satellites of a snapshot for conjunctions from 'start' (a
+    Unix timestamp, now by default) and stores them as the conjunctions of
+    its dataset version, replacing those of earlier screenings. Returns
+    the number of conjunctions.
+    """
+    if start is None:
+        start = time.time() // CONJUNCTION_STEP * CONJUNCTION_STEP
+
+    items = snapshot.items()
+    lines = []
+    for catalog_number in snapshot.catalog_numbers:
+        item = json.loads(items[catalog_number])
+        lines.append((item['line1'], item['line2']))
+    screen_start = time.time()
+    conjunctions = screen(snapshot.catalog_numbers, lines, start, duration,
+                          distance, workers)
+
+    version = DatasetVersion.objects.get(version=snapshot.version)
+    with transaction.atomic():
+        Conjunction.objects.all().delete()
+        Conjunction.objects.bulk_create(
+            Conjunction(version=version, first_catalog_number=first,
+                        second_catalog_number=second,
+                        time=datetime.fromtimestamp(timestamp, timezone.utc),
+                        distance=miss, relative_speed=speed)
+            for first, second, timestamp, miss, speed in conjunctions)
+
+    cron_logger.info("Screened dataset version " + str(snapshot.version)
+                     + " for conjunctions: found " + str(len(conjunctions))
+                     + " in " + format(time.time() - screen_start, '.1f')
+                     + " s.")
+    return len(conjunctions)
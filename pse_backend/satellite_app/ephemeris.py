@@ -0,0 +1,229 @@
+"""
+File description:
+Contains the precomputed ephemeris grid of the satellites. After every
+ingest run, all satellites of the current dataset version are propagated at
+a fixed step over the next day, spread over a pool of processes, and the
+positions are stored as a memory-mappable array file in the directory of the
+snapshot (see snapshots.py). The 'ephemeris' endpoint serves slices of it,
+so that clients can interpolate between the samples instead of running SGP4
+themselves.
+
+The grid of a snapshot is stored as
+'<version>/ephemeris-<start>-<step>.npy', where 'start' is the Unix
+timestamp of the first sample and 'step' the number of seconds between
+samples. It holds 32-bit float TEME positions (in km) with shape
+(satellites, samples, 3), with the satellites ordered by catalog number.
+"""
+
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+import numpy as np
+
+from satellite_app.propagation import Propagator
+
+
+# Sets up the logger (see /logs/cron.logs)
+cron_logger = logging.getLogger('cron')
+
+# Default seconds between two samples, and seconds covered by a grid. The
+# grid covers an hour more than a day, since the cronjobs run daily.
+DEFAULT_EPHEMERIS_STEP = 60
+EPHEMERIS_DURATION = 25 * 3600
+
+# A grid is rebuilt when it covers less than this many seconds from now
+EPHEMERIS_REFRESH = 12 * 3600
+
+# Retrieves the step and the number of processes from environment variables
+EPHEMERIS_STEP = int(os.getenv('EPHEMERIS_STEP', DEFAULT_EPHEMERIS_STEP))
+EPHEMERIS_WORKERS = max(1, int(os.getenv('EPHEMERIS_WORKERS',
+                                         os.cpu_count() or 1)))
+
+# Number of satellites propagated at a time by a process
+EPHEMERIS_CHUNK_SIZE = 500
+
+# Maximum number of samples of all satellites in a single request. The
+# default request (an hour of the whole catalogue) stays well below it.
+EPHEMERIS_MAX_SAMPLES = 4_000_000
+
+# The grids that were opened by this process, by path
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+class Ephemeris:
+    """
+    A memory-mapped ephemeris grid of a snapshot.
+    """
+
+    def __init__(self, path, catalog_numbers):
+        start, step = os.path.basename(path)[len('ephemeris-'):-4].split('-')
+        self.path = path
+        self.start = int(start)
+        self.step = int(step)
+        self.positions = np.load(path, mmap_mode='r')
+        self.catalog_numbers = np.asarray(catalog_numbers, dtype=np.int64)
+
+    @property
+    def end(self):
+        """
+        The Unix timestamp of the last sample.
+        """
+        return self.start + (self.positions.shape[1] - 1) * self.step
+
+    def window(self, start, end):
+        """
+        Returns the range of samples that covers the time window from
+        'start' to 'end' (both Unix timestamps), including the samples
+        just before and after it, or None if the grid doesn't cover any
+        of it.
+        """
+        if end < start or end < self.start or start > self.end:
+            return None
+        first = max(0, int(np.floor((start - self.start) / self.step)))
+        last = min(self.positions.shape[1] - 1,
+                   int(np.ceil((end - self.start) / self.step)))
+        return first, last + 1
+
+    def indices(self, catalog_numbers):
+        """
+        Returns the rows of the given catalog numbers that are in this
+        grid, in order of catalog number.
+        """
+        catalog_numbers = np.unique(np.asarray(catalog_numbers,
+                                               dtype=np.int64))
+        rows = np.searchsorted(self.catalog_numbers, catalog_numbers)
+        inside = rows < len(self.catalog_numbers)
+        rows = rows[inside]
+        return rows[self.catalog_numbers[rows] == catalog_numbers[inside]]
+
+    def slice(self, rows, first, last):
+        """
+        Returns the positions of the given rows (or all rows if None)
+        for the samples from 'first' up to 'last'.
+        """
+        if rows is None:
+            return np.ascontiguousarray(self.positions[:, first:last])
+        return np.ascontiguousarray(self.positions[rows, first:last])
+
+
+def grid_path(snapshot, start, step):
+    """
+    Returns the path of the ephemeris grid of a snapshot.
+    """
+    return os.path.join(snapshot.path, 'ephemeris-' + str(int(start)) + '-'
+                        + str(int(step)) + '.npy')
+
+
+def find(snapshot):
+    """
+    Returns the ephemeris grid of a snapshot, or None if it has none. The
+    grid with the newest start is used, and only opened once per process.
+    """
+    paths = glob.glob(os.path.join(snapshot.path, 'ephemeris-*.npy'))
+    if not paths:
+        return None
+    path = max(paths, key=lambda p: int(os.path.basename(p).split('-')[1]))
+
+    grid = _loaded.get(path)
+    if grid is None:
+        with _loaded_lock:
+            grid = _loaded.get(path)
+            if grid is None:
+                try:
+                    grid = Ephemeris(path, snapshot.catalog_numbers)
+                except (OSError, ValueError):
+                    return None
+                # Older grids are not needed anymore
+                _loaded.clear()
+                _loaded[path] = grid
+    return grid
+
+
+def _propagate_chunk(path, offset, lines, timestamps):
+    """
+    Propagates a chunk of satellites to all timestamps and writes their
+    positions into the grid at 'path', starting at row 'offset'. Runs in
+    a separate process.
+    """
+    positions, _ = Propagator(range(len(lines)), lines,
+                              [0] * len(lines)).propagate(timestamps)
+    grid = np.load(path, mmap_mode='r+')
+    grid[offset:offset + len(lines)] = positions
+    grid.flush()
+
+
+def build_ephemeris(snapshot, start=None, step=None, duration=None,
+                    workers=None):
+    """
+    Builds the ephemeris grid of a snapshot, starting at 'start' (a Unix
+    timestamp, now by default) and removes the older grids of all
+    versions. Returns the new grid.
+    """
+    step = step or EPHEMERIS_STEP
+    duration = duration or EPHEMERIS_DURATION
+    workers = workers or EPHEMERIS_WORKERS
+    if start is None:
+        start = time.time() // step * step
+
+    items = snapshot.items()
+    lines = []
+    for catalog_number in snapshot.catalog_numbers:
+        item = json.loads(items[catalog_number])
+        lines.append((item['line1'], item['line2']))
+    timestamps = start + step * np.arange(duration // step + 1)
+
+    path = grid_path(snapshot, start, step)
+    temporary_path = path + '.tmp'
+    np.lib.format.open_memmap(
+        temporary_path, mode='w+', dtype='<f4',
+        shape=(len(lines), len(timestamps), 3)).flush()
+
+    chunks = [(offset, lines[offset:offset + EPHEMERIS_CHUNK_SIZE])
+              for offset in range(0, len(lines), EPHEMERIS_CHUNK_SIZE)]
+    if workers == 1 or len(chunks) <= 1:
+        for offset, chunk in chunks:
+            _propagate_chunk(temporary_path, offset, chunk, timestamps)
+    else:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=django.setup) as executor:
+            futures = [executor.submit(_propagate_chunk, temporary_path,
+                                       offset, chunk, timestamps)
+                       for offset, chunk in chunks]
+            for future in futures:
+                future.result()
+
+    os.replace(temporary_path, path)
+
+    # Requests that are still reading an older grid keep their mapping
+    for old_path in glob.glob(os.path.join(os.path.dirname(snapshot.path),
+                                           '*', 'ephemeris-*.npy')):
+        if old_path != path:
+            os.remove(old_path)
+
+    return find(snapshot)
+
+
+def ensure_ephemeris(snapshot):
+    """
+    Builds the ephemeris grid of a snapshot if it has none,
+    or if its grid is about to run out.
+    """
+    grid = find(snapshot)
+    if grid is not None and grid.end - time.time() >= EPHEMERIS_REFRESH:
+        return grid
+
+    build_start = time.time()
+    grid = build_ephemeris(snapshot)
+    cron_logger.info("Built the ephemeris of dataset version "
+                     + str(snapshot.version) + " ("
+                     + str(grid.positions.shape[0]) + " satellites, "
+                     + str(grid.positions.shape[1]) + " samples) in "
+                     + format(time.time() - build_start, '.1f') + " s.")
+    return grid
@@ -0,0 +1,76 @@
+"""
+File description:
+Contains the facet counts of the satellites, served by the 'meta' endpoint:
+the number of satellites per category, country, launch year and
+classification. The counts are computed from the 'SnapshotIndex' of a dataset
+version (see filters.py) with numpy, so no aggregate queries are needed. The
+counts without a filter are computed once, when the snapshot is built (see
+snapshots.py).
+
+The counts of a facet take every filter into account except the one on that
+facet itself, so that a filter panel can show how many satellites every
+other value of the facet would add to the result.
+"""
+
+import json
+
+import numpy as np
+
+from satellite_app.models import MinorCategory
+
+
+def count_facets(index, satellite_filter):
+    """
+    Returns the number of satellites of a 'SnapshotIndex' that pass a
+    filter, and the counts of every facet (see the top of this file).
+    """
+    count = len(index.catalog_numbers)
+    rows = np.arange(count)
+    passes = {attribute: test(rows) for attribute, (_, _, test)
+              in satellite_filter.predicates(index).items()}
+
+    def kept(facet):
+        keep = np.ones(count, dtype=bool)
+        for attribute, passed in passes.items():
+            if attribute != facet:
+                keep &= passed
+        return keep
+
+    masks = index.category_masks[kept('categories')]
+    countries = np.bincount(index.countries.codes[kept('countries')],
+                            minlength=len(index.countries.values))
+    classifications = np.bincount(
+        index.classifications.codes[kept('classifications')],
+        minlength=len(index.classifications.values))
+    launch_years = np.bincount(
+        index.launch_year_codes[kept('launch_years')],
+        minlength=len(index.launch_year_values))
+
+    return int(np.count_nonzero(kept(None))), {
+        'categories': {
+            name: int(np.count_nonzero(masks & MinorCategory.bit(name)))
+            for name in index.categories},
+        'countries': {
+            value: int(countries[number]) for value, number
+            in sorted(index.countries.values.items())},
+        'launch_years': {
+            str(int(year)): int(launch_years[number])
+            for number, year in enumerate(index.launch_year_values.tolist())},
+        'classifications': {
+            value: int(classifications[number]) for value, number
+            in sorted(index.classifications.values.items())},
+    }
+
+
+def encode_meta(snapshot, satellite_filter):
+    """
+    Returns the body of the meta endpoint for the satellites of a
+    snapshot that pass a filter.
+    """
+    satellite_count, facets = count_facets(snapshot.filter_index(),
+                                           satellite_filter)
+    return json.dumps({
+        'version': snapshot.version,
+        'satellite_count': satellite_count,
+        'facets': facets,
+    }, separators=(',', ':')).encode('utf-8')
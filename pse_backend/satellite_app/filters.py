@@ -0,0 +1,308 @@
+"""
+File description:
+Contains the filters of the main endpoint on the attributes of the
+satellites: their categories, country, classification, launch year and the
+age of their TLE. The filters of a request are combined into a single
+'SatelliteFilter', which can be applied to the database (as one query, backed
+by the composite indexes of 'Satellite') or to the snapshot of a dataset
+version.
+
+On a snapshot, the filters are planned: the number of satellites matching
+every predicate is estimated from the 'SnapshotIndex' of the snapshot, the
+predicate with the fewest satellites is looked up first and only those
+satellites are checked against the other predicates. The work of a request
+therefore scales with the size of its result instead of the size of the
+catalogue.
+"""
+
+import calendar
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from django.db.models import Q
+
+from satellite_app import binary_catalog
+from satellite_app.models import Satellite
+
+
+SECONDS_PER_DAY = 86400
+
+
+def _list_param(query_params, name):
+    """
+    Returns the comma separated values of a query parameter,
+    without empty values.
+    """
+    return [value.strip() for value in query_params.get(name, '').split(',')
+            if value.strip()]
+
+
+def parse_filter(query_params, now=None):
+    """
+    Reads the filters from the query parameters of a request (see
+    README.md). 'now' is the Unix time the age of a TLE is measured from,
+    the current time by default. Raises a ValueError with a message for the
+    client if the parameters can't be used.
+    """
+    match = query_params.get('match', 'any')
+    if match not in ('any', 'all'):
+        raise ValueError("Parameter 'match' must be 'any' or 'all'.")
+
+    classifications = _list_param(query_params, 'classification')
+    known = Satellite.ClassificationChoices.values
+    if any(value not in known for value in classifications):
+        raise ValueError("Parameter 'classification' must be a list of "
+                         + ', '.join(known) + ".")
+
+    try:
+        min_launch_year = (int(query_params['min_launch_year'])
+                           if query_params.get('min_launch_year') else None)
+        max_launch_year = (int(query_params['max_launch_year'])
+                           if query_params.get('max_launch_year') else None)
+    except ValueError:
+        raise ValueError("Parameters 'min_launch_year' and 'max_launch_year'"
+                         " must be years.")
+
+    min_epoch = None
+    if query_params.get('max_age'):
+        try:
+            max_age = float(query_params['max_age'])
+            if not max_age > 0:
+                raise ValueError
+        except ValueError:
+            raise ValueError("Parameter 'max_age' must be a positive number"
+                             " of days.")
+        now = time.time() if now is None else now
+        min_epoch = now - max_age * SECONDS_PER_DAY
+
+    return SatelliteFilter(
+        categories=_list_param(query_params, 'filter'),
+        match_all=match == 'all',
+        countries=_list_param(query_params, 'country'),
+        classifications=classifications,
+        min_launch_year=min_launch_year,
+        max_launch_year=max_launch_year,
+        min_epoch=min_epoch)
+
+
+class SatelliteFilter:
+    """
+    The filters of a request. Satellites have to be in any (or with
+    'match_all', all) of the categories, have one of the countries and
+    classifications, be launched between the years (inclusive) and have a
+    TLE epoch (Unix time) of at least 'min_epoch'. Filters that are empty
+    or None are not applied.
+    """
+
+    def __init__(self, categories=(), match_all=False, countries=(),
+                 classifications=(), min_launch_year=None,
+                 max_launch_year=None, min_epoch=None):
+        self.categories = list(categories)
+        self.match_all = match_all
+        self.countries = list(countries)
+        self.classifications = list(classifications)
+        self.min_launch_year = min_launch_year
+        self.max_launch_year = max_launch_year
+        self.min_epoch = min_epoch
+
+    @property
+    def attributes(self):
+        """
+        Whether the filter has predicates other than the categories.
+        """
+        return bool(self.countries or self.classifications
+                    or self.min_launch_year is not None
+                    or self.max_launch_year is not None
+                    or self.min_epoch is not None)
+
+    def apply(self, queryset):
+        """
+        Returns the satellites of a queryset that pass the filter.
+        """
+        queryset = queryset.in_categories(
+            binary_catalog.category_mask(self.categories), self.match_all)
+        if self.countries:
+            queryset = queryset.filter(country__in=self.countries)
+        if self.classifications:
+            queryset = queryset.filter(classification__in=self.classifications)
+        if self.min_launch_year is not None:
+            queryset = queryset.filter(launch_year__gte=self.min_launch_year)
+        if self.max_launch_year is not None:
+            queryset = queryset.filter(launch_year__lte=self.max_launch_year)
+        if self.min_epoch is not None:
+            # The epoch is stored as a year and a (1-based) day of the year
+            moment = datetime.fromtimestamp(self.min_epoch, timezone.utc)
+            day = (self.min_epoch - calendar.timegm(
+                (moment.year, 1, 1, 0, 0, 0))) / SECONDS_PER_DAY + 1
+            queryset = queryset.filter(
+                Q(epoch_year__gt=moment.year)
+                | Q(epoch_year=moment.year, epoch__gte=day))
+        return queryset
+
+    def select(self, snapshot):
+        """
+        Returns the sorted catalog numbers of the satellites of a snapshot
+        that pass the filter. Category names that don't exist in the
+        snapshot are ignored, like in 'Snapshot.filtered'.
+        """
+        if not self.attributes:
+            return snapshot.filtered(self.categories, self.match_all)[0]
+
+        index = snapshot.filter_index()
+        predicates = list(self.predicates(index).values())
+
+        # The most selective predicate gives the candidates, the others
+        # only check those
+        predicates.sort(key=lambda predicate: predicate[0])
+        rows = predicates[0][1]()
+        for _, _, test in predicates[1:]:
+            if len(rows) == 0:
+                break
+            rows = rows[test(rows)]
+        return index.catalog_numbers[np.sort(rows)].tolist()
+
+    def predicates(self, index):
+        """
+        Returns the predicates of the filter on a 'SnapshotIndex' by the
+        attribute they filter on. A predicate is an (estimated size,
+        candidates, test) tuple: the number of rows it keeps, a function
+        returning those rows and a function telling which of the given
+        rows it keeps.
+        """
+        predicates = {}
+        known = [cat for cat in self.categories if cat in index.categories]
+        if known:
+            predicates['categories'] = index.category_predicate(
+                known, self.match_all)
+        if self.countries:
+            predicates['countries'] = index.countries.predicate(
+                self.countries)
+        if self.classifications:
+            predicates['classifications'] = index.classifications.predicate(
+                self.classifications)
+        if (self.min_launch_year is not None
+                or self.max_launch_year is not None):
+            predicates['launch_years'] = index.launch_years.predicate(
+                self.min_launch_year, self.max_launch_year)
+        if self.min_epoch is not None:
+            predicates['epochs'] = index.epochs.predicate(
+                self.min_epoch, None)
+        return predicates
+
+
+class ValueIndex:
+    """
+    Index on an attribute with few distinct values (like the country): the
+    rows of every value, and the value of every row as a number.
+    """
+
+    def __init__(self, members, row_count):
+        self.values = {value: number for number, value in enumerate(members)}
+        self.members = [np.asarray(rows, dtype=np.int64)
+                        for rows in members.values()]
+        self.codes = np.full(row_count, -1, dtype=np.int64)
+        for number, rows in enumerate(self.members):
+            self.codes[rows] = number
+
+    def predicate(self, values):
+        """
+        Returns the (estimated size, candidates, test) of a predicate
+        that keeps the rows with any of the values.
+        """
+        numbers = sorted(set(self.values[value] for value in values
+                             if value in self.values))
+        wanted = np.zeros(len(self.members) + 1, dtype=bool)
+        wanted[numbers] = True
+
+        def candidates():
+            return np.concatenate(
+                [self.members[number] for number in numbers]
+                + [np.zeros(0, dtype=np.int64)])
+
+        return (sum(len(self.members[number]) for number in numbers),
+                candidates, lambda rows: wanted[self.codes[rows]])
+
+
+class RangeIndex:
+    """
+    Index on a numeric attribute (like the launch year): the rows sorted
+    by their value, so that the rows in a range are a slice.
+    """
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float64)
+        # NaN values are sorted last and never match a range
+        self.order = np.argsort(self.values, kind='stable')
+        self.sorted_values = self.values[self.order]
+
+    def predicate(self, low, high):
+        """
+        Returns the (exact size, candidates, test) of a predicate that
+        keeps the rows with a value between 'low' and 'high' (inclusive,
+        unbounded if None).
+        """
+        low = -np.inf if low is None else low
+        high = np.inf if high is None else high
+        first = np.searchsorted(self.sorted_values, low, side='left')
+        last = np.searchsorted(self.sorted_values, high, side='right')
+        return (max(last - first, 0), lambda: self.order[first:last],
+                lambda rows: (self.values[rows] >= low)
+                & (self.values[rows] <= high))
+
+
+class SnapshotIndex:
+    """
+    The indexes of the attributes of the satellites of a snapshot, built
+    from its manifest and binary catalogue. Rows are the positions of the
+    satellites in the (sorted) catalog numbers of the snapshot.
+    """
+
+    def __init__(self, snapshot):
+        self.catalog_numbers = np.asarray(snapshot.catalog_numbers,
+                                          dtype=np.int64)
+        count = len(self.catalog_numbers)
+
+        def rows(members):
+            return {value: np.searchsorted(self.catalog_numbers, numbers)
+                    for value, numbers in members.items()}
+
+        self.categories = rows(snapshot.categories)
+        self.countries = ValueIndex(rows(snapshot.countries), count)
+        self.classifications = ValueIndex(
+            rows(snapshot.classifications), count)
+
+        records = binary_catalog.unpack(snapshot.catalog())[1]
+        record_rows = np.searchsorted(self.catalog_numbers,
+                                      records['catalog_number'])
+        self.category_masks = np.zeros(count, dtype=np.int64)
+        self.category_masks[record_rows] = records['category_mask']
+        launch_years = np.full(count, np.nan)
+        launch_years[record_rows] = records['launch_year']
+        self.launch_years = RangeIndex(launch_years)
+        # The distinct launch years, and the one of every row
+        self.launch_year_values, self.launch_year_codes = np.unique(
+            launch_years, return_inverse=True)
+        epochs = np.full(count, np.nan)
+        epochs[record_rows] = records['epoch']
+        self.epochs = RangeIndex(epochs)
+
+    def category_predicate(self, categories, match_all):
+        """
+        Returns the (estimated size, candidates, test) of a predicate that
+        keeps the rows in any (or all) of the given categories.
+        """
+        mask = binary_catalog.category_mask(categories)
+        members = [self.categories[cat] for cat in categories]
+
+        if match_all:
+            def test(rows):
+                return (self.category_masks[rows] & mask) == mask
+
+            # The rows of the smallest category still have to be in the
+            # other categories
+            smallest = min(members, key=len)
+            return len(smallest), lambda: smallest[test(smallest)], test
+        return (sum(len(rows) for rows in members),
+                lambda: np.unique(np.concatenate(members)),
+                lambda rows: (self.category_masks[rows] & mask) != 0)
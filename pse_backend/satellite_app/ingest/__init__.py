@@ -0,0 +1,8 @@
+"""
+File description:
+Contains the ingestion of the satellite data: downloading it from Celestrak,
+parsing it and writing it to the database. Only the cronjobs in cron.py and
+the management commands import this package. The web process never does, so
+that its workers start quickly and don't keep the ingestion code (and its
+dependencies) in memory; 'StartupTestCase' in tests.py checks this.
+"""
@@ -0,0 +1,304 @@
+"""
+File description:
+Contains the downloads of the satellite categories from Celestrak, and the
+parsing and storing of the downloaded TLEs. Used by the cronjobs in cron.py.
+"""
+
+import logging
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import requests.adapters
+
+from satellite_app import tle
+from satellite_app.ingest import fetch_cache
+from satellite_app.ingest.upsert import upsert_satellites
+from satellite_app.models import Satellite, MinorCategory
+
+from dotenv import load_dotenv
+load_dotenv()
+
+
+# Sets up the logger (see /logs/cron.logs)
+cron_logger = logging.getLogger('cron')
+
+# For ease of use
+SATCAT = MinorCategory.MinorCategoryChoices
+
+# Default maximum number of simultaneous downloads from Celestrak, and the
+# timeout of a single download (in seconds)
+DEFAULT_FETCH_CONCURRENCY = 4
+DEFAULT_FETCH_TIMEOUT = 60
+
+# Retrieves the fetch settings from environment variables. Keep the
+# concurrency low: Celestrak blocks clients that make too many requests.
+FETCH_CONCURRENCY = max(1, int(os.getenv(
+    'FETCH_CONCURRENCY',
+    DEFAULT_FETCH_CONCURRENCY)))
+FETCH_TIMEOUT = int(os.getenv(
+    'FETCH_TIMEOUT',
+    DEFAULT_FETCH_TIMEOUT))
+
+
+def determine_request_source(category):
+    """
+    Returns a URL corresponding to the given satellite
+    category. Calling this URL will fetch the
+    satellites of that category.
+    """
+
+    # The source of our data
+    API_URL = 'https://celestrak.org/NORAD/elements/gp.php?'
+
+    # Do not delete for any reason. Copy/pasting
+    # all this info was torture to me.
+    match category:
+        # Special interest
+        case SATCAT.LAST_30_DAYS:
+            request_source = API_URL + 'GROUP=last-30-days&FORMAT=tle'
+        case SATCAT.SPACE_STATIONS:
+            request_source = API_URL + 'GROUP=stations&FORMAT=tle'
+        case SATCAT.ACTIVE:
+            request_source = API_URL + 'GROUP=active&FORMAT=tle'
+
+        # Weather and earth
+        case SATCAT.WEATHER:
+            request_source = API_URL + 'GROUP=weather&FORMAT=tle'
+        case SATCAT.NOAA:
+            request_source = API_URL + 'GROUP=noaa&FORMAT=tle'
+        case SATCAT.EARTH_RESOURCES:
+            request_source = API_URL + 'GROUP=resource&FORMAT=tle'
+        case SATCAT.SEARCH_AND_RESCUE:
+            request_source = API_URL + 'GROUP=sarsat&FORMAT=tle'
+        case SATCAT.DISASTER_MONITORING:
+            request_source = API_URL + 'GROUP=dmc&FORMAT=tle'
+        case SATCAT.ARGOS:
+            request_source = API_URL + 'GROUP=argos&FORMAT=tle'
+        case SATCAT.PLANET:
+            request_source = API_URL + 'GROUP=planet&FORMAT=tle'
+        case SATCAT.SPIRE:
+            request_source = API_URL + 'GROUP=spire&FORMAT=tle'
+
+        # Communication
+        case SATCAT.ACTIVE_GEOSYNCHRONOUS:
+            request_source = API_URL + 'GROUP=geo&FORMAT=tle'
+        case SATCAT.STARLINK:
+            request_source = API_URL + 'GROUP=starlink&FORMAT=tle'
+        case SATCAT.IRIDIUM:
+            request_source = API_URL + 'GROUP=iridium&FORMAT=tle'
+        case SATCAT.INTELSAT:
+            request_source = API_URL + 'GROUP=intelsat&FORMAT=tle'
+        case SATCAT.SWARM:
+            request_source = API_URL + 'GROUP=swarm&FORMAT=tle'
+        case SATCAT.AMATEUR_RADIO:
+            request_source = API_URL + 'GROUP=amateur&FORMAT=tle'
+        case SATCAT.ONEWEB:
+            request_source = API_URL + 'GROUP=oneweb&FORMAT=tle'
+
+        # Navigation
+        case SATCAT.GNSS:
+            request_source = API_URL + 'GROUP=gnss&FORMAT=tle'
+        case SATCAT.GPS:
+            request_source = API_URL + 'GROUP=gps-ops&FORMAT=tle'
+        case SATCAT.GLONASS:
+            request_source = API_URL + 'GROUP=glo-ops&FORMAT=tle'
+        case SATCAT.GALILEO:
+            request_source = API_URL + 'GROUP=galileo&FORMAT=tle'
+        case SATCAT.BEIDOU:
+            request_source = API_URL + 'GROUP=beidou&FORMAT=tle'
+
+        # Scientific
+        case SATCAT.SPACE_AND_EARTH:
+            request_source = API_URL + 'GROUP=science&FORMAT=tle'
+        case SATCAT.GEODETICS:
+            request_source = API_URL + 'GROUP=geodetic&FORMAT=tle'
+        case SATCAT.ENGINEERING:
+            request_source = API_URL + 'GROUP=engineering&FORMAT=tle'
+
+    return request_source
+
+
+def celestrak_session():
+    """
+    Returns a 'requests' session for talking to Celestrak. The session
+    keeps its connections alive, and its pool is large enough for every
+    download that may run at the same time.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=1, pool_maxsize=FETCH_CONCURRENCY)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_category(session, category):
+    """
+    Downloads the TLEs of a given category using 'session'. The request is
+    made conditional on the cached copy of the category, which is returned
+    when Celestrak reports that nothing changed. If the download fails,
+    the cached copy is returned as well. Returns the body (in bytes), or
+    None if there is no body at all.
+    """
+
+    cron_logger.info("Fetching satellites of category '" + category + "'")
+
+    try:
+        res = session.get(determine_request_source(category),
+                          headers=fetch_cache.conditional_headers(category),
+                          timeout=FETCH_TIMEOUT)
+    except requests.RequestException as e:
+        cron_logger.error("Could not fetch category '" + category
+                          + "'. Full exception: " + str(e))
+        return _cached_body(category)
+
+    if res.status_code == 304:
+        cron_logger.info("Category '" + category + "' was not modified.")
+        return fetch_cache.load_body(category)
+
+    # In case something goes wrong, log it
+    if res.status_code != 200:
+        cron_logger.warning('Did not get an OK message from external API.'
+                            + ' Status code: ' + str(res.status_code) + '\n')
+        return _cached_body(category)
+
+    fetch_cache.save_response(category, res.content, res.headers)
+    return res.content
+
+
+def _cached_body(category):
+    """
+    Returns the cached body of a category after a failed download,
+    so that it can still be ingested if that didn't happen yet.
+    """
+    body = fetch_cache.load_body(category)
+    if body is not None:
+        cron_logger.warning("Falling back on the cached copy of category '"
+                            + category + "'.")
+    return body
+
+
+def ingest_body(category, category_object, body):
+    """
+    Writes a downloaded body to the database, unless this exact body was
+    already written during an earlier run. In that case nothing needs to
+    be parsed or written at all.
+    """
+
+    digest = fetch_cache.body_hash(body)
+    if fetch_cache.is_stored(category, digest):
+        cron_logger.info("Category '" + category + "' is unchanged since"
+                         + " the last run, skipping it.")
+        return
+
+    report = store_satellites(
+        category, category_object, body.decode('utf-8', errors='replace'))
+    if report is not None:
+        fetch_cache.mark_stored(category, digest)
+
+
+def pull_satellites(category, category_object):
+    """
+    Pulls satellites of a given category from the source
+    and puts them into our database as 'Satellite' objects.
+    'category' is a string containing the name of the
+    category, while 'category_object' is an actual
+    category database row. The string is used to fetch the
+    URL corresponding to that category while the database
+    row is used to establish a foreign-key relationship
+    between a satellite and a category.
+    """
+
+    with celestrak_session() as session:
+        body = fetch_category(session, category)
+
+    if body is not None:
+        ingest_body(category, category_object, body)
+
+
+def pull_categories(categories):
+    """
+    Pulls the satellites of several categories at once. The downloads run
+    on a thread pool of at most FETCH_CONCURRENCY threads that share one
+    session. Every finished download is put on a queue, from which this
+    thread parses it and writes it to the database while the remaining
+    downloads are still in progress.
+    """
+
+    category_objects = {
+        cat.minor_category: cat for cat in
+        MinorCategory.objects.filter(minor_category__in=categories)}
+
+    downloads = queue.Queue()
+
+    with celestrak_session() as session, \
+            ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as pool:
+        for category in categories:
+            future = pool.submit(fetch_category, session, category)
+            future.add_done_callback(
+                lambda f, category=category: downloads.put((category, f)))
+
+        # Handle the downloads in the order in which they finish
+        for _ in categories:
+            category, future = downloads.get()
+
+            try:
+                body = future.result()
+            except Exception as e:
+                cron_logger.error("Could not fetch category '" + category
+                                  + "'. Full exception: " + str(e))
+                continue
+
+            if body is None:
+                continue
+
+            if category not in category_objects:
+                cron_logger.error("Category '" + category + "' does not"
+                                  + " exist in the database. Did you run"
+                                  + " 'gen_satcats'?")
+                continue
+
+            ingest_body(category, category_objects[category], body)
+
+
+def store_satellites(category, category_object, text):
+    """
+    Parses the TLEs in 'text' (the body of a Celestrak response) and
+    writes them to the database as satellites of the given category.
+    Returns the report of the upsert, or None if it failed.
+    """
+
+    # Parses all TLEs at once, see tle.py. Invalid TLEs are skipped.
+    records, errors = tle.parse_tles(text)
+    for name, error in errors:
+        cron_logger.error("Could not parse TLE of satellite '"
+                          + name + "'. Full exception: " + error)
+
+    # Builds an (unsaved) satellite object for every TLE. All of them
+    # are then written to the database in bulk.
+    satellites = [Satellite(
+        name=record.name,
+        line1=record.line1,
+        line2=record.line2,
+        satellite_catalog_number=record.catalog_number,
+        classification=record.classification,
+        launch_year=record.launch_year,
+        epoch_year=record.epoch_year,
+        epoch=record.epoch_day,
+        revolutions=record.revolutions,
+        revolutions_per_day=record.mean_motion) for record in records]
+
+    try:
+        report = upsert_satellites(satellites, category_object)
+    except Exception as e:
+        cron_logger.error("Could not create or update satellites after"
+                          + " fetching data. Full exception: " + str(e))
+        return None
+
+    cron_logger.info("Category '" + category + "': "
+                     + str(report['inserted']) + " inserted, "
+                     + str(report['updated']) + " updated, "
+                     + str(report['unchanged']) + " unchanged, "
+                     + str(report['linked']) + " newly linked.")
+    return report
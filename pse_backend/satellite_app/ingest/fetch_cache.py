@@ -0,0 +1,125 @@
+"""
+File description:
+Contains the on-disk cache of the Celestrak downloads. For every category it
+keeps the last raw body together with a small JSON file holding the ETag and
+Last-Modified headers of that body, its hash, and the hash of the last body
+that was written to the database. The cronjobs use it to make conditional
+requests, to skip bodies that were already stored, and to fall back on the
+last body when a download fails.
+"""
+
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.utils.text import slugify
+
+
+def _paths(category):
+    """
+    Returns the paths of the cached body and of the metadata
+    file of a given category.
+    """
+    name = slugify(category)
+    return (os.path.join(settings.FETCH_CACHE_DIR, name + '.tle'),
+            os.path.join(settings.FETCH_CACHE_DIR, name + '.json'))
+
+
+def _write_atomic(path, data):
+    """
+    Writes bytes to a file via a temporary file, so that a crash
+    halfway through never leaves a truncated file behind.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as outfile:
+        outfile.write(data)
+    os.replace(tmp_path, path)
+
+
+def body_hash(body):
+    """
+    Returns the SHA-256 hash of a response body (in bytes).
+    """
+    return hashlib.sha256(body).hexdigest()
+
+
+def load_metadata(category):
+    """
+    Returns the stored metadata of a category, or an empty
+    dict if nothing was cached yet.
+    """
+    _, meta_path = _paths(category)
+    try:
+        with open(meta_path, 'r') as infile:
+            return json.load(infile)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_body(category):
+    """
+    Returns the last cached body of a category, or None.
+    """
+    body_path, _ = _paths(category)
+    try:
+        with open(body_path, 'rb') as infile:
+            return infile.read()
+    except OSError:
+        return None
+
+
+def conditional_headers(category):
+    """
+    Returns the 'If-None-Match'/'If-Modified-Since' headers to send
+    along with the next request for a category. Only returns headers
+    if the corresponding body is actually on disk.
+    """
+    metadata = load_metadata(category)
+    body_path, _ = _paths(category)
+    if not os.path.exists(body_path):
+        return {}
+
+    headers = {}
+    if metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata.get('last_modified'):
+        headers['If-Modified-Since'] = metadata['last_modified']
+    return headers
+
+
+def save_response(category, body, headers):
+    """
+    Stores a freshly downloaded body together with its
+    validators. The 'stored' hash is carried over, since this body
+    has not been written to the database yet.
+    """
+    body_path, meta_path = _paths(category)
+    metadata = load_metadata(category)
+    metadata.update({
+        'etag': headers.get('ETag'),
+        'last_modified': headers.get('Last-Modified'),
+        'hash': body_hash(body),
+    })
+    _write_atomic(body_path, body)
+    _write_atomic(meta_path, json.dumps(metadata).encode('utf-8'))
+
+
+def is_stored(category, digest):
+    """
+    Returns whether the body with the given hash is the
+    last one that was written to the database.
+    """
+    return load_metadata(category).get('stored') == digest
+
+
+def mark_stored(category, digest):
+    """
+    Records that the body with the given hash was
+    written to the database.
+    """
+    _, meta_path = _paths(category)
+    metadata = load_metadata(category)
+    metadata['stored'] = digest
+    _write_atomic(meta_path, json.dumps(metadata).encode('utf-8'))
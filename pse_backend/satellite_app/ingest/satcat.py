@@ -0,0 +1,52 @@
+"""
+File description:
+Contains the parsing of the satellite catalogue of Celestrak, from which the
+'pull_country_names' cronjob in cron.py assigns a country to every satellite.
+"""
+
+import csv
+import io
+import os
+from pathlib import Path
+
+
+# The satellite catalogue, with the owner of every satellite
+SATCAT_URL = 'https://celestrak.org/pub/satcat.csv'
+
+
+def load_country_codes():
+    """
+    Returns a dict mapping the owner codes used in the satellite catalogue
+    to country codes, read from the local country_codes CSV file.
+    """
+    DIR = Path(__file__).resolve().parent.parent
+    codes_path = os.path.join(DIR, 'util', 'country_codes.csv')
+
+    with open(codes_path, mode='r', newline='') as infile:
+        return {row['Code']: row['country_code']
+                for row in csv.DictReader(infile)}
+
+
+def parse_satcat(text, country_codes):
+    """
+    Parses the satellite catalogue (the body of Celestrak's satcat.csv) in
+    a single pass. Returns a dict mapping every catalog number to its
+    country code, and the number of entries whose owner code is unknown.
+    """
+    countries = {}
+    unknown_owners = 0
+
+    for row in csv.DictReader(io.StringIO(text)):
+        try:
+            number = int(row['NORAD_CAT_ID'])
+        except (KeyError, TypeError, ValueError):
+            continue
+
+        country = country_codes.get(row.get('OWNER'))
+        if country is None:
+            unknown_owners += 1
+            continue
+
+        countries[number] = country
+
+    return countries, unknown_owners
@@ -0,0 +1,154 @@
+"""
+File description:
+Contains the batched ingest path used by the cronjobs (see celestrak.py and
+cron.py). Instead of looking up, updating and saving every satellite one at a
+time, all satellites of a category are upserted in chunks and their category
+links are inserted in bulk, together with the category bit in the
+'category_mask' of the satellites. Country codes are assigned the same way.
+Every chunk is written in its own short transaction, so the API can keep
+reading from the database while an ingest is running.
+"""
+
+import logging
+
+from django.db import transaction
+from django.db.models import F
+
+from satellite_app.models import MinorCategory, Satellite
+
+
+# Sets up the logger (see /logs/cron.logs)
+cron_logger = logging.getLogger('cron')
+
+# Number of satellites written per query/transaction. Kept well below the
+# SQLite limit on query parameters.
+INGEST_BATCH_SIZE = 500
+
+# The fields that are taken from a TLE. 'country' is deliberately missing:
+# it is filled in by the 'pull_country_names' cronjob and should not be
+# overwritten by an ingest.
+TLE_FIELDS = [
+    'name',
+    'line1',
+    'line2',
+    'classification',
+    'launch_year',
+    'epoch_year',
+    'epoch',
+    'revolutions',
+    'revolutions_per_day',
+]
+
+
+def _chunks(items, size):
+    """
+    Splits a list into consecutive chunks of at most 'size' items.
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _tle_values(sat):
+    """
+    Returns the TLE derived values of a satellite as a tuple, so that
+    an incoming satellite can be compared to a stored row.
+    """
+    return tuple(getattr(sat, field) for field in TLE_FIELDS)
+
+
+def upsert_satellites(satellites, category_object):
+    """
+    Writes a list of (unsaved) 'Satellite' objects to the database and links
+    them to 'category_object'. New satellites are inserted, stored
+    satellites whose TLE changed are updated and all others are left alone.
+    Returns a report with the number of inserted, updated and unchanged
+    satellites, and the number of newly created category links.
+    """
+
+    # If a source lists a satellite twice, the last occurrence wins
+    incoming = {sat.satellite_catalog_number: sat for sat in satellites}
+    catalog_numbers = sorted(incoming)
+
+    report = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'linked': 0}
+
+    # The satellites that are already linked to this category, loaded once
+    through = Satellite.minor_categories.through
+    linked = set(through.objects.filter(
+        minorcategory_id=category_object.pk).values_list(
+        'satellite_id', flat=True))
+    bit = MinorCategory.bit(category_object.minor_category)
+
+    for chunk in _chunks(catalog_numbers, INGEST_BATCH_SIZE):
+        stored = {row[0]: row[1:] for row in Satellite.objects.filter(
+            satellite_catalog_number__in=chunk).values_list(
+            'satellite_catalog_number', *TLE_FIELDS)}
+
+        to_write = []
+        for number in chunk:
+            sat = incoming[number]
+            if number not in stored:
+                report['inserted'] += 1
+                to_write.append(sat)
+            elif stored[number] != _tle_values(sat):
+                report['updated'] += 1
+                to_write.append(sat)
+            else:
+                report['unchanged'] += 1
+
+        new_links = [
+            through(satellite_id=number, minorcategory_id=category_object.pk)
+            for number in chunk if number not in linked]
+
+        with transaction.atomic():
+            if to_write:
+                # A single 'INSERT ... ON CONFLICT DO UPDATE' for both
+                # the new and the changed satellites
+                Satellite.objects.bulk_create(
+                    to_write,
+                    update_conflicts=True,
+                    unique_fields=['satellite_catalog_number'],
+                    update_fields=TLE_FIELDS)
+            if new_links:
+                through.objects.bulk_create(new_links, ignore_conflicts=True)
+                # Existing bits are kept, since 'category_mask' is not one
+                # of the fields overwritten by the upsert above
+                Satellite.objects.filter(satellite_catalog_number__in=[
+                    link.satellite_id for link in new_links]).update(
+                    category_mask=F('category_mask').bitor(bit))
+
+        report['linked'] += len(new_links)
+
+    return report
+
+
+def assign_countries(countries):
+    """
+    Sets the country of the stored satellites according to 'countries', a
+    dict mapping catalog numbers to country codes. Catalog numbers that
+    aren't stored are ignored, and satellites whose country didn't change
+    are not written at all. Returns a report with the number of updated,
+    unchanged and unknown satellites.
+    """
+
+    # The current country of every stored satellite, loaded in one query
+    stored = dict(Satellite.objects.values_list(
+        'satellite_catalog_number', 'country'))
+
+    report = {'updated': 0, 'unchanged': 0, 'unfound': 0}
+    changed = []
+
+    for number, country in countries.items():
+        if number not in stored:
+            report['unfound'] += 1
+        elif stored[number] == country:
+            report['unchanged'] += 1
+        else:
+            changed.append(Satellite(
+                satellite_catalog_number=number, country=country))
+
+    for chunk in _chunks(changed, INGEST_BATCH_SIZE):
+        with transaction.atomic():
+            Satellite.objects.bulk_update(chunk, ['country'])
+        report['updated'] += len(chunk)
+
+    return report
@@ -0,0 +1,190 @@
+"""
+File description:
+Contains the graph of the links between satellites and the routing over it,
+used by the 'route' endpoint. Like in the frontend (see Graph.ts), two
+satellites are linked when they are at most LINK_DISTANCE km apart. The links
+are found with the spatial index (see spatial.py) rather than by comparing
+every pair of satellites, and the shortest route is found with A*, using the
+straight-line distance to the goal as heuristic.
+
+A graph is built for the start of a time bucket, and kept in the shared cache
+per dataset version, time bucket and category filter, so that all route
+requests in the same bucket use the same graph.
+"""
+
+import heapq
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.core.cache import cache
+
+from satellite_app import propagation, spatial
+
+
+# Maximum distance (in km) between two linked satellites, like
+# DISTANCE_FOR_SATELLITES in the frontend
+LINK_DISTANCE = 700.0
+
+# Length of a time bucket (in seconds). All times in a bucket use the graph
+# of the start of the bucket.
+LINK_TIME_BUCKET = 60
+
+# Number of graphs kept per process, next to the shared cache
+LINK_GRAPHS_KEPT = 4
+
+# The graphs that were used by this process, most recently used last
+_graphs = OrderedDict()
+_graphs_lock = threading.Lock()
+
+
+class LinkGraph:
+    """
+    The links between a set of satellites at a single time, as an
+    adjacency list in compressed sparse row form: the neighbours of the
+    satellite in row 'i' are 'indices[indptr[i]:indptr[i + 1]]', at the
+    distances in 'weights' at the same places.
+    """
+
+    def __init__(self, catalog_numbers, positions, timestamp, indptr=None,
+                 indices=None, weights=None):
+        self.catalog_numbers = np.asarray(catalog_numbers)
+        self.positions = np.asarray(positions)
+        self.timestamp = timestamp
+
+        if indptr is None:
+            first, second, distance = spatial.UniformGrid(
+                self.positions, LINK_DISTANCE).pairs(LINK_DISTANCE)
+            # Every link goes both ways
+            sources = np.concatenate([first, second])
+            order = np.argsort(sources, kind='stable')
+            indices = np.concatenate([second, first])[order]
+            weights = np.concatenate([distance, distance])[order]
+            indptr = np.searchsorted(sources[order],
+                                     np.arange(len(self.positions) + 1))
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self._as_lists = None
+
+    @property
+    def link_count(self):
+        """
+        The number of links between two satellites.
+        """
+        return len(self.indices) // 2
+
+    def arrays(self):
+        """
+        Returns the arrays that make up this graph, to be cached.
+        """
+        return {'catalog_numbers': self.catalog_numbers,
+                'positions': self.positions, 'timestamp': self.timestamp,
+                'indptr': self.indptr, 'indices': self.indices,
+                'weights': self.weights}
+
+    def _lists(self):
+        """
+        Returns the arrays of this graph as Python lists, which are much
+        faster to index one item at a time. They are made only once.
+        """
+        if self._as_lists is None:
+            self._as_lists = (self.indptr.tolist(), self.indices.tolist(),
+                              self.weights.tolist(), self.positions.tolist())
+        return self._as_lists
+
+    def nearest(self, point):
+        """
+        Returns the row of the satellite nearest to an Earth-fixed
+        position, or None if no satellite has a position.
+        """
+        distances = np.linalg.norm(self.positions - point, axis=1)
+        distances[np.isnan(distances)] = np.inf
+        row = int(np.argmin(distances)) if len(distances) else None
+        if row is None or not np.isfinite(distances[row]):
+            return None
+        return row
+
+    def shortest_path(self, source, goal):
+        """
+        Returns the rows of the satellites on the shortest route from row
+        'source' to row 'goal' (both included) and the length of that route
+        in km, or None if the satellites aren't connected.
+        """
+        indptr, indices, weights, positions = self._lists()
+        goal_position = positions[goal]
+
+        distances = {source: 0.0}
+        parents = {source: None}
+        done = set()
+        queue = [(math.dist(positions[source], goal_position), source)]
+        while queue:
+            _, row = heapq.heappop(queue)
+            if row == goal:
+                path = []
+                while row is not None:
+                    path.append(row)
+                    row = parents[row]
+                return path[::-1], distances[goal]
+            if row in done:
+                continue
+            done.add(row)
+
+            for link in range(indptr[row], indptr[row + 1]):
+                neighbour = indices[link]
+                distance = distances[row] + weights[link]
+                if neighbour not in done and distance < distances.get(
+                        neighbour, math.inf):
+                    distances[neighbour] = distance
+                    parents[neighbour] = row
+                    heapq.heappush(queue, (
+                        distance + math.dist(positions[neighbour],
+                                             goal_position), neighbour))
+        return None
+
+
+def time_bucket(timestamp):
+    """
+    Returns the start of the time bucket of a Unix timestamp.
+    """
+    return int(timestamp // LINK_TIME_BUCKET * LINK_TIME_BUCKET)
+
+
+def graph_at(timestamp, mask=0):
+    """
+    Returns the link graph of the satellites in the categories of 'mask'
+    (all satellites if 0) at the start of the time bucket of a Unix
+    timestamp, and the snapshot it was built from. Graphs are cached per
+    dataset version, time bucket and filter.
+    """
+    bucket = time_bucket(timestamp)
+    propagator, snapshot = propagation.current()
+    if snapshot is None:
+        # Without a snapshot, the satellites can change at any time
+        propagator = propagator.subset(mask)
+        return LinkGraph(propagator.catalog_numbers,
+                         propagator.ecef(bucket), bucket), None
+
+    key = ('links-v' + str(snapshot.version) + '-' + str(bucket) + '-'
+           + str(mask))
+    with _graphs_lock:
+        graph = _graphs.get(key)
+        if graph is not None:
+            _graphs.move_to_end(key)
+            return graph, snapshot
+
+    arrays = cache.get(key)
+    if arrays is not None:
+        graph = LinkGraph(**arrays)
+    else:
+        propagator = propagator.subset(mask)
+        graph = LinkGraph(propagator.catalog_numbers,
+                          propagator.ecef(bucket), bucket)
+        cache.set(key, graph.arrays(), LINK_TIME_BUCKET * 2)
+
+    with _graphs_lock:
+        _graphs[key] = graph
+        while len(_graphs) > LINK_GRAPHS_KEPT:
+            _graphs.popitem(last=False)
+    return graph, snapshot
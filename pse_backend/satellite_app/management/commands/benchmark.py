@@ -0,0 +1,262 @@
+"""
+Description: This command-script measures the throughput of the heavier
+ computations of the backend on the satellites in the database, such as
+ the batched propagation. Every computation is a 'target', which can be
+ selected on the command line; by default all targets are run.
+"""
+
+
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from satellite_app import (propagation, spatial, links, passes, conjunctions,
+                           search, snapshots, tle)
+from satellite_app.models import Satellite
+
+# Location and length (in days) of the passes target
+PASS_LOCATION = (52.0, 4.9, 0.0)
+PASS_DAYS = 1
+
+# Length (in hours) of the screening of the conjunctions target
+CONJUNCTION_HOURS = 1
+
+# Number of queries of the search target, which are the prefixes of the
+# names of random satellites as typed by a user
+SEARCH_QUERY_COUNT = 1000
+
+# Number of routes of the routing target
+ROUTE_COUNT = 100
+
+# Radius (km) and number of the queries of the spatial targets, like the
+# links between satellites drawn by the frontend
+SPATIAL_QUERY_RADIUS = 700
+SPATIAL_QUERY_COUNT = 1000
+
+
+class Command(BaseCommand):
+    help = 'Measure the throughput of the computations of the backend'
+
+    # The targets that can be benchmarked, with their methods
+    TARGETS = {
+        'propagation': '_benchmark_propagation',
+        'spatial_build': '_benchmark_spatial_build',
+        'spatial': '_benchmark_spatial',
+        'spatial_scan': '_benchmark_spatial_scan',
+        'links': '_benchmark_links',
+        'routing': '_benchmark_routing',
+        'passes': '_benchmark_passes',
+        'conjunctions': '_benchmark_conjunctions',
+        'search': '_benchmark_search',
+        'tle_parse': '_benchmark_tle_parse',
+        'tle_parse_tletools': '_benchmark_tle_parse_tletools',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets', nargs='*',
+            help='Targets to benchmark: ' + ', '.join(self.TARGETS)
+            + ' (default: all)')
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Number of timed runs per target (default: 5)')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        for target in kwargs['targets']:
+            if target not in self.TARGETS:
+                raise CommandError('Unknown target: ' + target)
+
+        for target in kwargs['targets'] or list(self.TARGETS):
+            benchmark = getattr(self, self.TARGETS[target])()
+            if benchmark is None:
+                self.stdout.write(self.style.WARNING(
+                    target + ': skipped, a package it compares with is'
+                    ' not installed'))
+                continue
+            run, count, unit = benchmark
+
+            # One untimed run, so that lazy loading isn't measured
+            run()
+            timings = []
+            for _ in range(kwargs['repeat']):
+                start = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - start)
+
+            best = min(timings)
+            self.stdout.write(self.style.SUCCESS(
+                target + ': ' + str(count) + ' ' + unit + ' in '
+                + format(best * 1000, '.1f') + ' ms (best of '
+                + str(len(timings)) + '), '
+                + format(count / best if best else float('inf'), '.0f')
+                + ' ' + unit + '/s'))
+
+    def _benchmark_propagation(self):
+        """
+        Propagates the whole catalogue to a single time,
+        as done by the 'positions' endpoint.
+        """
+        propagator, _ = propagation.current()
+        timestamp = time.time()
+        return (lambda: propagator.positions(timestamp),
+                len(propagator), 'satellites')
+
+    def _benchmark_spatial_build(self):
+        """
+        Builds the spatial index of the whole catalogue at a single time.
+        """
+        propagator, _ = propagation.current()
+        positions = propagator.ecef(time.time())
+        return (lambda: spatial.UniformGrid(positions),
+                len(propagator), 'satellites')
+
+    def _spatial_queries(self):
+        """
+        Returns the Earth-fixed positions of the whole catalogue, and the
+        positions of randomly picked satellites to query around.
+        """
+        propagator, _ = propagation.current()
+        positions = propagator.ecef(time.time())
+        valid = positions[np.isfinite(positions).all(axis=1)]
+        picks = np.random.default_rng(0).integers(
+            0, max(len(valid), 1), SPATIAL_QUERY_COUNT)
+        return positions, valid[picks] if len(valid) else valid
+
+    def _benchmark_spatial(self):
+        """
+        Finds the satellites near other satellites with the spatial index.
+        """
+        positions, queries = self._spatial_queries()
+        grid = spatial.UniformGrid(positions)
+
+        def run():
+            for point in queries:
+                grid.within(point, SPATIAL_QUERY_RADIUS)
+        return run, len(queries), 'queries'
+
+    def _benchmark_spatial_scan(self):
+        """
+        Finds the satellites near other satellites by comparing every
+        satellite, as a baseline for the 'spatial' target.
+        """
+        positions, queries = self._spatial_queries()
+
+        def run():
+            for point in queries:
+                distances = np.linalg.norm(positions - point, axis=1)
+                found = np.flatnonzero(distances <= SPATIAL_QUERY_RADIUS)
+                found[np.argsort(distances[found])]
+        return run, len(queries), 'queries'
+
+    def _benchmark_links(self):
+        """
+        Builds the link graph of the whole catalogue at a single time.
+        """
+        propagator, _ = propagation.current()
+        positions = propagator.ecef(time.time())
+        return (lambda: links.LinkGraph(propagator.catalog_numbers,
+                                        positions, 0),
+                len(propagator), 'satellites')
+
+    def _benchmark_routing(self):
+        """
+        Finds the shortest routes between randomly picked
+        satellites in the link graph of the whole catalogue.
+        """
+        propagator, _ = propagation.current()
+        graph = links.LinkGraph(propagator.catalog_numbers,
+                                propagator.ecef(time.time()), 0)
+        valid = np.flatnonzero(np.isfinite(graph.positions).all(axis=1))
+        ends = np.random.default_rng(0).choice(
+            valid, (ROUTE_COUNT, 2)) if len(valid) else []
+
+        def run():
+            for source, goal in ends:
+                graph.shortest_path(int(source), int(goal))
+        return run, len(ends), 'routes'
+
+    def _benchmark_passes(self):
+        """
+        Predicts the passes of the whole catalogue over a location,
+        without the cache of the 'passes' endpoint.
+        """
+        propagator, _ = propagation.current()
+        start = time.time()
+        return (lambda: passes.predict_passes(
+            propagator, *PASS_LOCATION, start, start + PASS_DAYS * 86400,
+            passes.DEFAULT_MIN_ELEVATION),
+            len(propagator), 'satellites')
+
+    def _benchmark_conjunctions(self):
+        """
+        Screens the whole catalogue for conjunctions, with the
+        process pool of the 'screen_conjunctions' cronjob.
+        """
+        propagator, _ = propagation.current()
+        start = time.time()
+        return (lambda: conjunctions.screen(
+            propagator.catalog_numbers, propagator.lines, start,
+            CONJUNCTION_HOURS * 3600),
+            len(propagator), 'satellites')
+
+    def _benchmark_search(self):
+        """
+        Answers typeahead queries with the search index of the whole
+        catalogue, as done by the 'search' endpoint.
+        """
+        index = search.index_for(snapshots.current())
+        rng = np.random.default_rng(0)
+        queries = []
+        if len(index):
+            for row in rng.integers(0, len(index), SEARCH_QUERY_COUNT):
+                name = index.names[row]
+                queries.append(name[:rng.integers(1, max(len(name), 1) + 1)])
+
+        def run():
+            for query in queries:
+                index.search(query)
+        return run, len(queries), 'queries'
+
+    def _tle_text(self):
+        """
+        Returns the TLEs of the satellites in the database in the
+        format of a Celestrak response.
+        """
+        lines = []
+        for sat in Satellite.objects.order_by(
+                'satellite_catalog_number').values_list(
+                'name', 'line1', 'line2'):
+            lines.extend(sat)
+        return '\r\n'.join(lines) + '\r\n'
+
+    def _benchmark_tle_parse(self):
+        """
+        Parses the TLEs of the whole catalogue, as done by the ingest.
+        """
+        text = self._tle_text()
+        return (lambda: tle.parse_tles(text),
+                Satellite.objects.count(), 'records')
+
+    def _benchmark_tle_parse_tletools(self):
+        """
+        Parses the TLEs of the whole catalogue with the 'tletools' package,
+        like the ingest did before, as a baseline for the 'tle_parse'
+        target. Skipped if 'tletools' is not installed.
+        """
+        try:
+            from tletools import TLE
+        except ImportError:
+            return None
+        text = self._tle_text()
+
+        def run():
+            lines = [line.strip() for line in text.splitlines()]
+            for index in range(0, len(lines) - 2, 3):
+                record = TLE.from_lines(*lines[index:index + 3])
+                int(record.norad)
+                year = str(record.int_desig)[:2]
+                if year:
+                    int(year)
+        return run, Satellite.objects.count(), 'records'
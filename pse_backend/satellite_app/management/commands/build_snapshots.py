@@ -0,0 +1,36 @@
+"""
+Description: This command-script builds the prebuilt responses of the API
+ from the current contents of the database, as a new dataset version, and
+ the ephemeris grid of that version. The cronjobs do this automatically; use
+ this command after filling or changing the database by hand.
+"""
+
+
+from django.core.management.base import BaseCommand
+from satellite_app.snapshots import build_snapshots, current
+from satellite_app.ephemeris import ensure_ephemeris
+
+
+class Command(BaseCommand):
+    help = 'Build the snapshots of the API as a new dataset version'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Build a new version even if nothing changed')
+        parser.add_argument(
+            '--skip-ephemeris', action='store_true',
+            help="Don't build the ephemeris grid")
+
+    def handle(self, *args, **kwargs):
+        version = build_snapshots(force=kwargs['force'])
+
+        self.stdout.write(self.style.SUCCESS(
+            'The current dataset version is ' + str(version.version)
+            + ' with ' + str(version.satellite_count) + ' satellites.'))
+
+        if not kwargs['skip_ephemeris']:
+            grid = ensure_ephemeris(current())
+            self.stdout.write(self.style.SUCCESS(
+                'Its ephemeris has ' + str(grid.positions.shape[1])
+                + ' samples, every ' + str(grid.step) + ' seconds.'))
@@ -0,0 +1,55 @@
+"""
+Description: This command-script screens the satellites of the current
+ dataset version for conjunctions (close approaches between two satellites)
+ and stores them, replacing the conjunctions of earlier screenings. A
+ cronjob does this daily; use this command to screen by hand, for example
+ with another distance or time window.
+"""
+
+
+from django.core.management.base import BaseCommand, CommandError
+from satellite_app import conjunctions, propagation
+from satellite_app.snapshots import current
+
+
+class Command(BaseCommand):
+    help = 'Screen the satellites for conjunctions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            help='Start of the screening as an ISO 8601 time (default: now)')
+        parser.add_argument(
+            '--hours', type=float,
+            default=conjunctions.CONJUNCTION_DURATION / 3600,
+            help='Number of hours to screen (default: '
+            + format(conjunctions.CONJUNCTION_DURATION / 3600, 'g') + ')')
+        parser.add_argument(
+            '--distance', type=float,
+            default=conjunctions.CONJUNCTION_DISTANCE,
+            help='Largest distance of a conjunction in km (default: '
+            + format(conjunctions.CONJUNCTION_DISTANCE, 'g') + ')')
+        parser.add_argument(
+            '--workers', type=int, default=conjunctions.CONJUNCTION_WORKERS,
+            help='Number of processes (default: '
+            + str(conjunctions.CONJUNCTION_WORKERS) + ')')
+
+    def handle(self, *args, **kwargs):
+        snapshot = current()
+        if snapshot is None:
+            raise CommandError('No dataset version was published yet, run'
+                               ' build_snapshots first')
+        if kwargs['hours'] <= 0 or kwargs['distance'] <= 0:
+            raise CommandError('--hours and --distance must be positive')
+        try:
+            start = (propagation.parse_time(kwargs['start'])
+                     if kwargs['start'] else None)
+        except ValueError:
+            raise CommandError('--start must be an ISO 8601 time')
+
+        count = conjunctions.screen_snapshot(
+            snapshot, start=start, duration=int(kwargs['hours'] * 3600),
+            distance=kwargs['distance'], workers=max(1, kwargs['workers']))
+        self.stdout.write(self.style.SUCCESS(
+            'Found ' + str(count) + ' conjunctions between the satellites'
+            ' of dataset version ' + str(snapshot.version) + '.'))
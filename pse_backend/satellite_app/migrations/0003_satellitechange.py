@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 02:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite_app', '0002_datasetversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SatelliteChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('satellite_catalog_number', models.IntegerField()),
+                ('change', models.CharField(choices=[('A', 'Added'), ('C', 'Changed'), ('R', 'Removed')], max_length=1)),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='satellite_app.datasetversion')),
+            ],
+        ),
+    ]
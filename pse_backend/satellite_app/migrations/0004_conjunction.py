@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-18 02:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite_app', '0003_satellitechange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conjunction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_catalog_number', models.IntegerField(db_index=True)),
+                ('second_catalog_number', models.IntegerField(db_index=True)),
+                ('time', models.DateTimeField(db_index=True)),
+                ('distance', models.FloatField()),
+                ('relative_speed', models.FloatField()),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conjunctions', to='satellite_app.datasetversion')),
+            ],
+        ),
+    ]
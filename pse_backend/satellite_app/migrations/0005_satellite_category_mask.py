@@ -0,0 +1,70 @@
+# Generated by Django 5.0.6 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+
+# The categories in the order of their bits, as they were when this
+# migration was written. Frozen here, so that the migration always computes
+# the same bits.
+CATEGORY_BITS = [
+    'None',
+    "Last 30 Days' Launches",
+    'Space Stations',
+    'Active Satellites',
+    'Weather',
+    'NOAA',
+    'Earth Resources',
+    'Search & Rescue (SARSAT)',
+    'Disaster Monitoring',
+    'ARGOS Data Collection System',
+    'Planet',
+    'Spire',
+    'Active Geosynchronous',
+    'Starlink',
+    'Iridium',
+    'Intelsat',
+    'Swarm',
+    'Amateur Radio',
+    'OneWeb',
+    'GNSS',
+    'GPS Operational',
+    'Glonass Operational',
+    'Galileo',
+    'Beidou',
+    'Space and Earth Science',
+    'Geodetics',
+    'Engineering',
+]
+
+
+def fill_category_masks(apps, schema_editor):
+    Satellite = apps.get_model('satellite_app', 'Satellite')
+    through = Satellite.minor_categories.through
+
+    masks = {}
+    for sat_id, name in through.objects.values_list(
+            'satellite_id', 'minorcategory__minor_category'):
+        if name in CATEGORY_BITS:
+            masks[sat_id] = (masks.get(sat_id, 0)
+                             | 1 << CATEGORY_BITS.index(name))
+
+    Satellite.objects.bulk_update(
+        [Satellite(satellite_catalog_number=number, category_mask=mask)
+         for number, mask in masks.items()],
+        ['category_mask'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite_app', '0004_conjunction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='satellite',
+            name='category_mask',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_category_masks, migrations.RunPython.noop),
+    ]
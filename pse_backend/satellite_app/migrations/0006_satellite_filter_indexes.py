@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-18 03:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('satellite_app', '0005_satellite_category_mask'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='satellite',
+            name='country',
+            field=models.CharField(blank=True, default='', max_length=5),
+        ),
+        migrations.AddIndex(
+            model_name='satellite',
+            index=models.Index(fields=['country', 'launch_year'], name='satellite_country_launch_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='satellite',
+            index=models.Index(fields=['classification', 'launch_year'], name='satellite_class_launch_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='satellite',
+            index=models.Index(fields=['epoch_year', 'epoch'], name='satellite_epoch_idx'),
+        ),
+    ]
@@ -3,6 +3,12 @@ Django models for the satellite_app app.
 The following models are defined:
 - MinorCategory: A model for satellite categories.
 - Satellite: A model for satellite data.
+- DatasetVersion: A model for the versions of the satellite data, one per
+    finished ingest run.
+- SatelliteChange: A model for the satellites that were added, changed or
+    removed in a dataset version.
+- Conjunction: A model for the close approaches between satellites found by
+    screening a dataset version.
 """
 
 from django.db import models
@@ -62,6 +68,46 @@ class MinorCategory(models.Model):
         choices=MinorCategoryChoices.choices,
         default=MinorCategoryChoices.NONE)
 
+    @staticmethod
+    def bit(minor_category):
+        """
+        Returns the bit of a category in a category bitmask. The bits
+        follow the order of 'MinorCategoryChoices', so new choices must
+        be added at the end of it.
+        """
+        return 1 << MinorCategory.MinorCategoryChoices.values.index(
+            minor_category)
+
+    @staticmethod
+    def names(category_mask):
+        """
+        Returns the names of the categories in a category bitmask, in the
+        order of 'MinorCategoryChoices'.
+        """
+        return [name for index, name in enumerate(
+            MinorCategory.MinorCategoryChoices.values)
+            if category_mask >> index & 1]
+
+
+class SatelliteQuerySet(models.QuerySet):
+    """
+    Query set of the satellites, adds filtering on the category bitmask.
+    """
+
+    def in_categories(self, category_mask, match_all=False):
+        """
+        Keeps the satellites that are in any of the categories of
+        'category_mask', or in all of them when 'match_all' is set. An
+        empty mask keeps every satellite.
+        """
+        if not category_mask:
+            return self
+        masked = self.alias(
+            masked_categories=models.F('category_mask').bitand(category_mask))
+        if match_all:
+            return masked.filter(masked_categories=category_mask)
+        return masked.exclude(masked_categories=0)
+
 
 class Satellite(models.Model):
     """
@@ -80,11 +126,16 @@ class Satellite(models.Model):
     country = models.CharField(
         max_length=5,
         blank=True,
-        default='',
-        db_index=True)
+        default='')
 
     minor_categories = models.ManyToManyField(
         MinorCategory, related_name='satellites', db_index=True)
+    # The bits (see 'MinorCategory.bit') of the linked minor categories,
+    # kept in sync by ingest/upsert.py so that filtering and serializing the
+    # categories doesn't need the join with 'minor_categories'
+    category_mask = models.BigIntegerField(default=0)
+
+    objects = SatelliteQuerySet.as_manager()
 
     class ClassificationChoices(models.TextChoices):
         # U: unclassified, C: classified, S: secret
@@ -97,5 +148,70 @@ class Satellite(models.Model):
         choices=ClassificationChoices.choices,
         default=ClassificationChoices.UNCLASSIFIED)
 
+    class Meta:
+        # The filters of the main endpoint (see filters.py) pick one of
+        # these for an equality on the first field and a range on the
+        # second. The country index also serves the 'countries' endpoint.
+        indexes = [
+            models.Index(fields=['country', 'launch_year'],
+                         name='satellite_country_launch_idx'),
+            models.Index(fields=['classification', 'launch_year'],
+                         name='satellite_class_launch_idx'),
+            models.Index(fields=['epoch_year', 'epoch'],
+                         name='satellite_epoch_idx'),
+        ]
+
     def __str__(self) -> str:
         return self.name + '\n' + self.line1 + '\n' + self.line2 + '\n'
+
+
+class DatasetVersion(models.Model):
+    """
+    Dataset version model. Every finished ingest run gets a new,
+    increasing version. The prebuilt responses of the API are
+    tagged with the version they were built from.
+    """
+    version = models.BigAutoField(primary_key=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    satellite_count = models.IntegerField(default=0)
+
+    def __str__(self) -> str:
+        return 'v' + str(self.version)
+
+
+class SatelliteChange(models.Model):
+    """
+    Change model. Records that a satellite was added, changed or
+    removed in a dataset version, so that clients can fetch only
+    the differences since the version they already have.
+    """
+    class ChangeChoices(models.TextChoices):
+        ADDED = "A"
+        CHANGED = "C"
+        REMOVED = "R"
+
+    version = models.ForeignKey(
+        DatasetVersion, on_delete=models.CASCADE, related_name='changes')
+    # Not a foreign key, since removed satellites are not stored anymore
+    satellite_catalog_number = models.IntegerField()
+    change = models.CharField(
+        max_length=1,
+        choices=ChangeChoices.choices)
+
+
+class Conjunction(models.Model):
+    """
+    Conjunction model. A close approach between two satellites, found
+    by screening the satellites of a dataset version over a time window
+    (see conjunctions.py). The first satellite has the lowest catalog
+    number of the two.
+    """
+    version = models.ForeignKey(
+        DatasetVersion, on_delete=models.CASCADE,
+        related_name='conjunctions')
+    # Not foreign keys, since satellites can be removed later
+    first_catalog_number = models.IntegerField(db_index=True)
+    second_catalog_number = models.IntegerField(db_index=True)
+    time = models.DateTimeField(db_index=True)
+    distance = models.FloatField()  # km
+    relative_speed = models.FloatField()  # km/s
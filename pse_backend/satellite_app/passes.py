@@ -0,0 +1,345 @@
+"""
+File description:
+Contains the pass prediction of the 'passes' endpoint: when satellites rise
+above, culminate and set below a minimum elevation, as seen from a location
+on the ground. The elevation of all satellites is first scanned at a coarse
+step, many satellites at a time. Only around the crossings and maxima that
+this scan finds, the exact times are refined with bisection: on the
+elevation for the rise and set times, and on its slope for the
+culminations. All refinements of a group of satellites are done together.
+
+Satellites are scanned in groups of similar orbital periods, each with a
+step that fits its period, so that slow (high) satellites are not sampled
+as often as fast (low) ones. The scan itself first propagates only every
+PASS_SCAN_RATIO-th sample, and only propagates the samples around those at
+which a satellite is close enough to the location to possibly be above the
+minimum elevation soon (see 'possibly_visible').
+
+Predicted passes are kept in the shared cache per location grid cell,
+dataset version, hour and selection of satellites, see 'cached_passes'.
+"""
+
+import hashlib
+import math
+
+import numpy as np
+from django.core.cache import cache
+
+from satellite_app import propagation
+
+
+# Number of coarse steps per orbit, and the limits of the coarse step (in
+# seconds). A pass of a low satellite lasts a few minutes at least.
+PASS_STEPS_PER_ORBIT = 100
+PASS_MIN_STEP = 30
+PASS_MAX_STEP = 600
+
+# Every how many samples all satellites are propagated
+PASS_SCAN_RATIO = 5
+
+# Angle (in radians) added to the visibility cone of 'possibly_visible',
+# for the difference between the geodetic and geocentric vertical
+PASS_CONE_SLACK = 0.01
+
+# Rotation of the Earth (in radians per second)
+EARTH_ROTATION = 7.2921159e-5
+
+# Precision (in seconds) of the refined times
+PASS_TIME_PRECISION = 1.0
+
+# Number of satellites that are scanned at a time
+PASS_CHUNK_SIZE = 256
+
+# Size (in degrees) of the cells of the location grid. Passes are
+# predicted for the center of a cell, which moves the times by seconds.
+PASS_LOCATION_CELL = 0.1
+
+# Passes are predicted from the start of the hour of the requested start,
+# and kept in the cache for a day
+PASS_TIME_BUCKET = 3600
+PASS_CACHE_TIMEOUT = 86400
+
+# Default and maximum number of days, and default minimum elevation
+# (in degrees)
+DEFAULT_PASS_DAYS = 1
+MAX_PASS_DAYS = 10
+DEFAULT_MIN_ELEVATION = 10.0
+
+# Maximum number of satellites times days in a single request
+PASS_MAX_SATELLITE_DAYS = 10_000
+
+
+def observer_frame(latitude, longitude, altitude):
+    """
+    Returns the Earth-fixed position (km) of an observer and the
+    unit vector pointing straight up from it.
+    """
+    latitude_rad = math.radians(latitude)
+    longitude_rad = math.radians(longitude)
+    up = np.array([math.cos(latitude_rad) * math.cos(longitude_rad),
+                   math.cos(latitude_rad) * math.sin(longitude_rad),
+                   math.sin(latitude_rad)])
+    return propagation.geodetic_to_ecef(latitude, longitude, altitude), up
+
+
+def elevations(positions, timestamps, observer, up):
+    """
+    Returns the elevations (degrees) of TEME positions (with the times in
+    the second-to-last axis) as seen by an observer.
+    """
+    ecef = propagation.teme_to_ecef(
+        positions, propagation.gmst(*propagation.julian_dates(timestamps)))
+    relative = ecef - observer
+    return np.degrees(np.arcsin(
+        (relative @ up) / np.linalg.norm(relative, axis=-1)))
+
+
+def _paired_elevations(satrecs, owners, timestamps, observer, up):
+    """
+    Returns the elevation of satellite 'satrecs[owners[i]]' at
+    'timestamps[i]', for every 'i'. The owners must be sorted, so that
+    every satellite is propagated to all of its times in a single call.
+    """
+    jd, fraction = propagation.julian_dates(timestamps)
+    positions = np.full((len(timestamps), 3), np.nan)
+    found, firsts = np.unique(owners, return_index=True)
+    lasts = np.append(firsts[1:], len(owners))
+    for owner, first, last in zip(found.tolist(), firsts.tolist(),
+                                  lasts.tolist()):
+        errors, r, _ = satrecs[owner].sgp4_array(jd[first:last],
+                                                 fraction[first:last])
+        r[errors != 0] = np.nan
+        positions[first:last] = r
+    return elevations(positions, timestamps, observer, up)
+
+
+def _refine_crossings(satrecs, owners, low, high, low_above, min_elevation,
+                      observer, up):
+    """
+    Returns the times at which the elevations of satellites cross
+    'min_elevation', one for every bracket from 'low' to 'high', found
+    with bisection. 'low_above' tells whether the satellite is above
+    'min_elevation' at the start of its bracket.
+    """
+    while np.any(high - low > PASS_TIME_PRECISION):
+        middle = (low + high) / 2
+        same = (_paired_elevations(satrecs, owners, middle, observer, up)
+                >= min_elevation) == low_above
+        low = np.where(same, middle, low)
+        high = np.where(same, high, middle)
+    return (low + high) / 2
+
+
+def _refine_culminations(satrecs, owners, low, high, observer, up):
+    """
+    Returns the times of the highest elevations of satellites, one for
+    every window from 'low' to 'high', and those elevations. The window
+    is halved towards the side to which the elevation is still rising.
+    """
+    owners = np.asarray(owners)
+    while np.any(high - low > PASS_TIME_PRECISION):
+        middle = (low + high) / 2
+        heights = _paired_elevations(
+            satrecs, np.repeat(owners, 2),
+            np.stack([middle, middle + PASS_TIME_PRECISION / 10],
+                     axis=1).ravel(), observer, up)
+        rising = heights[1::2] > heights[0::2]
+        low = np.where(rising, middle, low)
+        high = np.where(rising, high, middle)
+    times = (low + high) / 2
+    return times, _paired_elevations(satrecs, owners, times, observer, up)
+
+
+def coarse_step(revolutions_per_day):
+    """
+    Returns the coarse step (in seconds) for satellites with
+    the given number of revolutions per day.
+    """
+    if not revolutions_per_day > 0:
+        return PASS_MAX_STEP
+    step = 86400 / revolutions_per_day / PASS_STEPS_PER_ORBIT
+    return min(max(step, PASS_MIN_STEP), PASS_MAX_STEP)
+
+
+def possibly_visible(subset, timestamps, reach, min_elevation, observer):
+    """
+    Returns whether every satellite of a propagator can be above
+    'min_elevation' at any time within 'reach' seconds of each of the
+    given times. That is the case when the angle (seen from the center of
+    the Earth) between the satellite and the observer is at most the
+    angle at which the satellite would be at 'min_elevation', plus the
+    angle the satellite can move in 'reach' seconds.
+    """
+    positions, _ = subset.propagate(timestamps)
+    ecef = propagation.teme_to_ecef(
+        positions, propagation.gmst(*propagation.julian_dates(timestamps)))
+    distance = np.linalg.norm(ecef, axis=-1)
+    radius = np.linalg.norm(observer)
+    angle = np.arccos(np.clip((ecef @ observer) / (distance * radius),
+                              -1, 1))
+
+    elevation = math.radians(min_elevation)
+    horizon = np.arccos(np.clip(radius * math.cos(elevation) / distance,
+                                -1, 1)) - elevation
+    # The fastest angular motion of a satellite is at its perigee
+    rates = np.array([
+        satrec.no_kozai / 60 * (1 + satrec.ecco) ** 2
+        / (1 - satrec.ecco ** 2) ** 1.5 for satrec in subset.satrecs])
+    motion = (rates + EARTH_ROTATION) * reach
+    return angle <= horizon + motion[:, None] + PASS_CONE_SLACK
+
+
+def _scan_chunk(subset, start, end, min_elevation, observer, up):
+    """
+    Predicts the passes of the satellites of a propagator that all have
+    a TLE that can be read (see 'predict_passes').
+    """
+    revolutions = max(satrec.no_kozai * 1440 / (2 * math.pi)
+                      for satrec in subset.satrecs)
+    step = coarse_step(revolutions)
+    times = np.append(np.arange(start, end, step), end)
+
+    # Every sample is at most half the ratio of samples away from a
+    # sample at which all satellites are propagated
+    scanned = np.unique(np.append(
+        np.arange(0, len(times), PASS_SCAN_RATIO), len(times) - 1))
+    nearest = np.minimum(
+        (np.arange(len(times)) + PASS_SCAN_RATIO // 2) // PASS_SCAN_RATIO,
+        len(scanned) - 1)
+    candidates = possibly_visible(
+        subset, times[scanned], PASS_SCAN_RATIO // 2 * step, min_elevation,
+        observer)[:, nearest]
+
+    # The other samples are below the minimum elevation
+    heights = np.full(candidates.shape, -90.0)
+    owners, samples = np.nonzero(candidates)
+    heights[owners, samples] = _paired_elevations(
+        subset.satrecs, owners, times[samples], observer, up)
+    above = heights >= min_elevation
+
+    passes, owners, peaks = [], [], []
+    crossings = []
+    for index in np.flatnonzero(above.any(axis=1)).tolist():
+        row = above[index]
+        rises = np.flatnonzero(~row[:-1] & row[1:]).tolist()
+        sets = np.flatnonzero(row[:-1] & ~row[1:]).tolist()
+
+        # A pass that is going on at the start has no rise, and a pass
+        # that is still going on at the end has no set
+        for rise, set_ in zip(([None] if row[0] else []) + rises,
+                              sets + ([None] if row[-1] else [])):
+            first = 0 if rise is None else rise + 1
+            last = len(times) - 1 if set_ is None else set_
+            peaks.append(first + int(np.argmax(heights[index,
+                                                       first:last + 1])))
+            owners.append(index)
+            found = {'catalog_number': int(subset.catalog_numbers[index]),
+                     'rise': None, 'set': None}
+            for kind, crossing in (('rise', rise), ('set', set_)):
+                if crossing is not None:
+                    crossings.append((index, crossing, kind == 'set',
+                                      len(passes), kind))
+            passes.append(found)
+    if not passes:
+        return []
+
+    # The crossings lie between two samples. Satellites that stay above
+    # the minimum elevation the whole time (like a geostationary one) have
+    # none.
+    if crossings:
+        crossing_owners, indices, low_above, numbers, kinds = zip(*crossings)
+        indices = np.array(indices)
+        refined = _refine_crossings(
+            subset.satrecs, np.array(crossing_owners), times[indices],
+            times[indices + 1], np.array(low_above), min_elevation,
+            observer, up)
+        for number, kind, time in zip(numbers, kinds, refined.tolist()):
+            passes[number][kind] = time
+
+    # The culminations lie within a step of the highest sample
+    peaks = np.array(peaks)
+    culminations, highest = _refine_culminations(
+        subset.satrecs, owners, times[np.maximum(peaks - 1, 0)],
+        times[np.minimum(peaks + 1, len(times) - 1)], observer, up)
+    for found, time, height in zip(passes, culminations.tolist(),
+                                   highest.tolist()):
+        found['culmination'] = time
+        found['max_elevation'] = height
+    return passes
+
+
+def predict_passes(propagator, latitude, longitude, altitude, start, end,
+                   min_elevation):
+    """
+    Predicts the passes of the satellites of 'propagator' over a location
+    from 'start' to 'end' (Unix timestamps). Returns a list of passes
+    (dicts with the catalog number, the times of the rise, culmination and
+    set, and the highest elevation), ordered by their rise. Passes that
+    are going on at the start or end have no rise or set time.
+    """
+    observer, up = observer_frame(latitude, longitude, altitude)
+
+    # Satellites with similar periods are scanned together
+    revolutions = np.array([satrec.no_kozai for satrec in propagator.satrecs])
+    rows = propagator.valid[np.argsort(revolutions)[::-1]]
+
+    passes = []
+    for first in range(0, len(rows), PASS_CHUNK_SIZE):
+        chunk = np.sort(rows[first:first + PASS_CHUNK_SIZE])
+        subset = propagation.Propagator(
+            propagator.catalog_numbers[chunk],
+            [propagator.lines[row] for row in chunk],
+            propagator.masks[chunk])
+        passes.extend(_scan_chunk(subset, start, end, min_elevation,
+                                  observer, up))
+
+    passes.sort(key=lambda found: (
+        found['rise'] if found['rise'] is not None else start,
+        found['catalog_number']))
+    return passes
+
+
+def location_cell(latitude, longitude, altitude):
+    """
+    Returns the center of the location grid cell of a location, with the
+    altitude rounded to 100 m.
+    """
+    def center(degrees):
+        return round((math.floor(degrees / PASS_LOCATION_CELL) + 0.5)
+                     * PASS_LOCATION_CELL, 6)
+    return center(latitude), center(longitude), round(altitude, 1)
+
+
+def cached_passes(propagator, version, latitude, longitude, altitude, start,
+                  days, min_elevation, selection):
+    """
+    Returns the passes (see 'predict_passes') over the grid cell of a
+    location from 'start' for 'days' days, of the satellites of
+    'propagator'. 'selection' describes which satellites these are (the
+    category mask or the list of catalog numbers) for the cache key.
+    Passes are computed from the start of the hour and cached per dataset
+    version, unless 'version' is None.
+    """
+    latitude, longitude, altitude = location_cell(latitude, longitude,
+                                                  altitude)
+    bucket = start // PASS_TIME_BUCKET * PASS_TIME_BUCKET
+    end = start + days * 86400
+
+    key = None
+    if version is not None:
+        key = ('passes-v' + str(version) + '-' + repr(latitude) + '-'
+               + repr(longitude) + '-' + repr(altitude) + '-'
+               + str(int(bucket)) + '-' + str(days) + '-'
+               + repr(float(min_elevation)) + '-'
+               + hashlib.sha1(str(selection).encode()).hexdigest())
+        passes = cache.get(key)
+    if key is None or passes is None:
+        passes = predict_passes(propagator, latitude, longitude, altitude,
+                                bucket, bucket + days * 86400
+                                + PASS_TIME_BUCKET, min_elevation)
+        if key is not None:
+            cache.set(key, passes, PASS_CACHE_TIMEOUT)
+
+    return [found for found in passes
+            if (found['set'] is None or found['set'] >= start)
+            and (found['rise'] is None or found['rise'] <= end)]
@@ -0,0 +1,320 @@
+"""
+File description:
+Contains the batched SGP4 propagation of the satellites on the server. All
+satellites are propagated in a single call to the SGP4 array API, and the
+results are converted to the same values (and the same packed layout) that
+the web workers of the frontend compute in 'worker.ts': latitude and
+longitude in degrees and altitude in km per satellite, followed by the speed
+of every satellite in km/s. Tracks (many samples of a few satellites) are
+propagated the same way, see 'Propagator.tracks'.
+
+The SGP4 records are only built once per dataset version, see 'current'.
+"""
+
+import json
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+from sgp4.api import Satrec, SatrecArray
+
+from satellite_app import binary_catalog, snapshots
+from satellite_app.models import Satellite
+
+
+# The WGS84 ellipsoid, as used by 'eciToGeodetic' of satellite.js
+EARTH_RADIUS = 6378.137
+EARTH_POLAR_RADIUS = 6356.7523142
+FLATTENING = (EARTH_RADIUS - EARTH_POLAR_RADIUS) / EARTH_RADIUS
+ECCENTRICITY_SQUARED = 2 * FLATTENING - FLATTENING ** 2
+
+# Iterations for the geodetic latitude. The latitude converges to well
+# below a millimetre in a few iterations, for any orbit.
+GEODETIC_ITERATIONS = 5
+
+# Julian date of the Unix epoch
+UNIX_EPOCH_JD = 2440587.5
+
+# The propagators of the dataset versions loaded by this process, by
+# directory of the snapshot
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def julian_dates(timestamps):
+    """
+    Splits Unix timestamps (in seconds) into the whole and fractional
+    parts of their Julian dates, as expected by the SGP4 array API.
+    """
+    days = np.asarray(timestamps, dtype=np.float64) / 86400.0
+    whole = np.floor(days)
+    return whole + UNIX_EPOCH_JD, days - whole
+
+
+def gmst(jd, fraction):
+    """
+    Returns the Greenwich mean sidereal time (in radians) of Julian dates,
+    like 'gstime' of satellite.js (IAU-82).
+    """
+    tut1 = (np.asarray(jd) - 2451545.0 + np.asarray(fraction)) / 36525.0
+    seconds = (-6.2e-6 * tut1 ** 3 + 0.093104 * tut1 ** 2
+               + (876600.0 * 3600 + 8640184.812866) * tut1 + 67310.54841)
+    return np.mod(np.radians(seconds / 240.0), 2 * np.pi)
+
+
+def teme_to_geodetic(positions, sidereal_time):
+    """
+    Converts positions in the TEME frame (km, with the coordinates in the
+    last axis) to latitudes and longitudes in degrees and altitudes in km.
+    'sidereal_time' must broadcast against the positions without their
+    last axis.
+    """
+    x, y, z = positions[..., 0], positions[..., 1], positions[..., 2]
+    r = np.hypot(x, y)
+
+    longitude = np.mod(np.arctan2(y, x) - sidereal_time + np.pi,
+                       2 * np.pi) - np.pi
+    latitude = np.arctan2(z, r)
+    for _ in range(GEODETIC_ITERATIONS):
+        sin_latitude = np.sin(latitude)
+        c = 1 / np.sqrt(1 - ECCENTRICITY_SQUARED * sin_latitude ** 2)
+        latitude = np.arctan2(
+            z + EARTH_RADIUS * c * ECCENTRICITY_SQUARED * sin_latitude, r)
+    altitude = r / np.cos(latitude) - EARTH_RADIUS * c
+
+    return np.degrees(latitude), np.degrees(longitude), altitude
+
+
+def teme_to_ecef(positions, sidereal_time):
+    """
+    Rotates positions in the TEME frame (with the coordinates in the last
+    axis) to the Earth-fixed frame, like 'eciToEcf' of satellite.js.
+    """
+    cos_gmst = np.cos(sidereal_time)
+    sin_gmst = np.sin(sidereal_time)
+    x, y = positions[..., 0], positions[..., 1]
+    return np.stack([x * cos_gmst + y * sin_gmst,
+                     y * cos_gmst - x * sin_gmst,
+                     positions[..., 2]], axis=-1)
+
+
+def geodetic_to_ecef(latitude, longitude, altitude):
+    """
+    Converts latitudes and longitudes in degrees and altitudes in km to
+    Earth-fixed positions (km, with the coordinates in the last axis).
+    """
+    latitude = np.radians(latitude)
+    longitude = np.radians(longitude)
+    sin_latitude = np.sin(latitude)
+    c = 1 / np.sqrt(1 - ECCENTRICITY_SQUARED * sin_latitude ** 2)
+    radius = EARTH_RADIUS * c + altitude
+    return np.stack([
+        radius * np.cos(latitude) * np.cos(longitude),
+        radius * np.cos(latitude) * np.sin(longitude),
+        (EARTH_RADIUS * c * (1 - ECCENTRICITY_SQUARED) + altitude)
+        * sin_latitude], axis=-1)
+
+
+def parse_time(value):
+    """
+    Parses an ISO 8601 time into a Unix timestamp. Times without a
+    timezone are in UTC, and no time at all means now. Raises a
+    ValueError if the time can't be read.
+    """
+    if not value:
+        return datetime.now(timezone.utc).timestamp()
+    time = datetime.fromisoformat(value)
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return time.timestamp()
+
+
+def pack_positions(latitude, longitude, altitude, speed):
+    """
+    Packs positions and speeds like the web workers do: latitude,
+    longitude and altitude of every satellite, then the speed of every
+    satellite, all as 32-bit floats.
+    """
+    buffer = np.empty(len(latitude) * 4, dtype='<f4')
+    points = buffer[:len(latitude) * 3].reshape(-1, 3)
+    points[:, 0] = latitude
+    points[:, 1] = longitude
+    points[:, 2] = altitude
+    buffer[len(latitude) * 3:] = speed
+    return buffer.tobytes()
+
+
+class Propagator:
+    """
+    The SGP4 records of a list of satellites, ordered by catalog number,
+    with the category bitmask of every satellite. Satellites with a TLE
+    that can't be read are kept, but their positions are always NaN.
+    """
+
+    def __init__(self, catalog_numbers, lines, masks):
+        self.catalog_numbers = np.asarray(catalog_numbers, dtype=np.uint32)
+        self.masks = np.asarray(masks, dtype=np.uint32)
+        self.lines = lines
+
+        satrecs = []
+        valid = []
+        for index, (line1, line2) in enumerate(lines):
+            try:
+                satrecs.append(Satrec.twoline2rv(line1, line2))
+            except ValueError:
+                continue
+            valid.append(index)
+
+        self.valid = np.asarray(valid, dtype=np.intp)
+        self.satrecs = satrecs
+        self.array = SatrecArray(satrecs) if satrecs else None
+        self._subsets = {}
+
+    def __len__(self):
+        return len(self.catalog_numbers)
+
+    @classmethod
+    def from_items(cls, items):
+        """
+        Builds a propagator from serialized satellites (see
+        'snapshots.serialize_satellite'), ordered by catalog number.
+        """
+        catalog_numbers, lines, masks = [], [], []
+        for item in items:
+            catalog_numbers.append(item['catalog_number'])
+            lines.append((item['line1'], item['line2']))
+            masks.append(binary_catalog.category_mask(item['categories']))
+        return cls(catalog_numbers, lines, masks)
+
+    @classmethod
+    def from_database(cls):
+        """
+        Builds a propagator from all satellites in the database.
+        """
+        return cls.from_items(
+            snapshots.serialize_satellite(sat, categories)
+            for sat, categories in snapshots.iter_satellites(
+                Satellite.objects.order_by('satellite_catalog_number')))
+
+    def subset(self, mask):
+        """
+        Returns a propagator with only the satellites that belong to at
+        least one of the categories in 'mask'. A mask of 0 selects all
+        satellites. Subsets are kept, since a handful of filters is used
+        over and over.
+        """
+        if not mask:
+            return self
+
+        subset = self._subsets.get(mask)
+        if subset is None:
+            keep = np.flatnonzero(self.masks & mask)
+            subset = Propagator(self.catalog_numbers[keep],
+                                [self.lines[i] for i in keep],
+                                self.masks[keep])
+            self._subsets[mask] = subset
+        return subset
+
+    def select(self, catalog_numbers):
+        """
+        Returns a propagator with only the satellites with the given catalog
+        numbers, ordered by catalog number. Unknown numbers are ignored.
+        """
+        rows = np.flatnonzero(np.isin(self.catalog_numbers, catalog_numbers))
+        return Propagator(self.catalog_numbers[rows],
+                          [self.lines[i] for i in rows], self.masks[rows])
+
+    def propagate(self, timestamps):
+        """
+        Propagates every satellite to the given Unix timestamps. Returns
+        the positions and velocities in the TEME frame (km and km/s), with
+        shape (satellites, times, 3). Satellites that couldn't be
+        propagated to a time have NaN there.
+        """
+        jd, fraction = julian_dates(np.atleast_1d(timestamps))
+        positions = np.full((len(self), len(jd), 3), np.nan)
+        velocities = np.full((len(self), len(jd), 3), np.nan)
+        if self.array is None:
+            return positions, velocities
+
+        errors, r, v = self.array.sgp4(jd, fraction)
+        failed = errors != 0
+        r[failed] = np.nan
+        v[failed] = np.nan
+        positions[self.valid] = r
+        velocities[self.valid] = v
+        return positions, velocities
+
+    def geodetic(self, timestamps):
+        """
+        Propagates every satellite to the given Unix timestamps. Returns the
+        latitudes, longitudes, altitudes and speeds, each with shape
+        (satellites, times).
+        """
+        timestamps = np.atleast_1d(timestamps)
+        positions, velocities = self.propagate(timestamps)
+        latitude, longitude, altitude = teme_to_geodetic(
+            positions, gmst(*julian_dates(timestamps)))
+        speed = np.linalg.norm(velocities, axis=-1)
+        return latitude, longitude, altitude, speed
+
+    def ecef(self, timestamp):
+        """
+        Returns the Earth-fixed positions (km) of all satellites at a
+        single Unix timestamp, with shape (satellites, 3).
+        """
+        positions, _ = self.propagate(timestamp)
+        return teme_to_ecef(positions[:, 0],
+                            gmst(*julian_dates(timestamp)))
+
+    def tracks(self, timestamps):
+        """
+        Propagates every satellite to the given Unix timestamps. Returns 32-bit
+        floats with shape (satellites, times, 9): the TEME position, the
+        Earth-fixed position (both in km) and the latitude, longitude
+        (degrees) and altitude (km) of every sample.
+        """
+        timestamps = np.atleast_1d(timestamps)
+        positions, _ = self.propagate(timestamps)
+        sidereal_time = gmst(*julian_dates(timestamps))
+
+        tracks = np.empty(positions.shape[:2] + (9,), dtype='<f4')
+        tracks[..., 0:3] = positions
+        tracks[..., 3:6] = teme_to_ecef(positions, sidereal_time)
+        for field, values in enumerate(
+                teme_to_geodetic(positions, sidereal_time)):
+            tracks[..., 6 + field] = values
+        return tracks
+
+    def positions(self, timestamp):
+        """
+        Returns the packed positions and speeds of all satellites at a
+        single Unix timestamp (see 'pack_positions').
+        """
+        latitude, longitude, altitude, speed = self.geodetic(timestamp)
+        return pack_positions(latitude[:, 0], longitude[:, 0],
+                              altitude[:, 0], speed[:, 0])
+
+
+def current():
+    """
+    Returns the propagator of the newest dataset version, together with its
+    snapshot. The propagator is only built once per dataset version. When
+    no snapshot was built yet, it is built from the database every time
+    and the snapshot is None.
+    """
+    snapshot = snapshots.current()
+    if snapshot is None:
+        return Propagator.from_database(), None
+
+    propagator = _loaded.get(snapshot.path)
+    if propagator is None:
+        with _loaded_lock:
+            propagator = _loaded.get(snapshot.path)
+            if propagator is None:
+                propagator = Propagator.from_items(
+                    json.loads(item) for item in snapshot.items().values())
+                # Older versions are not needed anymore
+                _loaded.clear()
+                _loaded[snapshot.path] = propagator
+    return propagator, snapshot
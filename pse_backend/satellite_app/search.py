@@ -0,0 +1,204 @@
+"""
+File description:
+Contains the name search of the satellites, used by the 'search' endpoint.
+The names of all satellites are normalized (upper case, with every run of
+other characters than letters and digits replaced by a single space) and
+joined into one text, of which a suffix array is built once per dataset
+version. Every name that contains the query is then found with two binary
+searches, so a query takes time in the number of matches instead of in the
+size of the catalogue. The catalog numbers have their own sorted index for
+lookups and prefix matches on the number.
+
+The matches are ranked as follows (lowest first), and then by the length of
+the name and the catalog number:
+0. The catalog number is the query.
+1. The name is the query.
+2. The name starts with the query.
+3. A word in the name starts with the query.
+4. The catalog number starts with the query.
+5. The name contains the query.
+"""
+
+import bisect
+import re
+import threading
+
+import numpy as np
+
+from satellite_app import binary_catalog, snapshots
+from satellite_app.models import Satellite
+
+
+DEFAULT_SEARCH_COUNT = 10
+MAX_SEARCH_COUNT = 100
+
+# Number of matches per requested result that are looked at first
+SEARCH_OVERSAMPLING = 4
+
+# Layout of the keys of the matches (see '_keys')
+LENGTH_SHIFT = 32
+LENGTH_MASK = 0xff
+RANK_SHIFT = 40
+ROW_MASK = (1 << LENGTH_SHIFT) - 1
+
+# The index of the newest dataset version that was searched by this process
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+_WORD = re.compile('[0-9A-Z]+')
+
+
+def normalize(text):
+    """
+    Returns the normalized form of a name or query.
+    """
+    return ' '.join(_WORD.findall(text.upper()))
+
+
+class SearchIndex:
+    """
+    The search index of the names and catalog numbers of a list of
+    satellites. Every match gets a single integer key that sorts like its
+    rank, so the best matches can be picked without sorting all of them.
+    """
+
+    def __init__(self, catalog_numbers, names):
+        order = np.argsort(np.asarray(catalog_numbers, dtype=np.int64),
+                           kind='stable')
+        self.catalog_numbers = np.asarray(catalog_numbers,
+                                          dtype=np.int64)[order]
+        self.names = [names[row] for row in order.tolist()]
+
+        normalized = [normalize(name) for name in self.names]
+        lengths = np.fromiter((len(name) for name in normalized),
+                              dtype=np.int64, count=len(normalized))
+        # Every name is followed by a newline, which no query contains
+        self.text = ''.join(name + '\n' for name in normalized)
+        starts = np.cumsum(lengths + 1) - lengths - 1
+        # Longer suffixes never have to be compared, since a query can't be
+        # longer than the longest name
+        width = int(lengths.max()) + 1 if len(normalized) else 1
+
+        text = self.text
+        positions = [position for position, char in enumerate(text)
+                     if char != '\n']
+        positions.sort(key=lambda position: text[position:position + width])
+        self.suffixes = np.array(positions, dtype=np.int64)
+
+        # The row and the rank of the match at every suffix
+        rows = np.searchsorted(starts, self.suffixes, side='right') - 1
+        # A normalized text only has ASCII characters
+        chars = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+        ranks = np.where(chars[np.maximum(self.suffixes - 1, 0)] == ord(' '),
+                         3, 5)
+        ranks[self.suffixes == starts[rows]] = 2
+        self.suffix_keys = _keys(ranks, lengths[rows], rows)
+        self.lengths = lengths
+
+        number_texts = [str(number) for number in self.catalog_numbers]
+        self.number_rows = np.array(
+            sorted(range(len(number_texts)), key=number_texts.__getitem__),
+            dtype=np.int64)
+        self.number_texts = [number_texts[row] for row in self.number_rows]
+
+    def __len__(self):
+        return len(self.names)
+
+    def _name_matches(self, query):
+        """
+        Returns the keys of the matches of the names that contain the
+        (normalized) query.
+        """
+        text = self.text
+
+        def key(position):
+            return text[position:position + len(query)]
+
+        first = bisect.bisect_left(self.suffixes, query, key=key)
+        last = bisect.bisect_right(self.suffixes, query, key=key)
+        keys = self.suffix_keys[first:last]
+
+        # Names that start with the query and are as long are exact
+        exact = (((keys >> RANK_SHIFT) == 2)
+                 & (((keys >> LENGTH_SHIFT) & LENGTH_MASK) == len(query)))
+        return np.where(exact, keys - (1 << RANK_SHIFT), keys)
+
+    def _number_matches(self, query):
+        """
+        Returns the keys of the matches of the catalog numbers that
+        start with the query.
+        """
+        if not query.isdigit():
+            return np.zeros(0, dtype=np.int64)
+
+        first = bisect.bisect_left(self.number_texts, query)
+        last = bisect.bisect_left(self.number_texts, query + ':')
+        rows = self.number_rows[first:last]
+        ranks = np.where(self.catalog_numbers[rows] == int(query), 0, 4)
+        return _keys(ranks, self.lengths[rows], rows)
+
+    def search(self, query, limit=DEFAULT_SEARCH_COUNT):
+        """
+        Returns the rows of the best 'limit' matches of a query, best first
+        (see the top of this file). A query without letters or digits
+        matches nothing.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+
+        keys = np.concatenate([self._name_matches(query),
+                               self._number_matches(query.replace(' ', ''))])
+
+        # A satellite can match several times, so a few more matches than
+        # 'limit' are taken. All of them are only needed when most of
+        # these turn out to be the same satellites.
+        for count in (SEARCH_OVERSAMPLING * limit, len(keys)):
+            best = np.sort(np.partition(keys, count)[:count]
+                           if count < len(keys) else keys)
+            rows = best & ROW_MASK
+            # Every satellite is only listed once, with its best rank
+            _, firsts = np.unique(rows, return_index=True)
+            if len(firsts) >= limit or count >= len(keys):
+                return rows[np.sort(firsts)[:limit]].tolist()
+
+
+def _keys(ranks, lengths, rows):
+    """
+    Packs the ranks, name lengths and rows of matches into keys that sort
+    like the matches: by rank, then by the length of the name and then by
+    the row (which is ordered by catalog number).
+    """
+    return ((np.asarray(ranks, dtype=np.int64) << RANK_SHIFT)
+            | (np.minimum(lengths, LENGTH_MASK) << LENGTH_SHIFT) | rows)
+
+
+def index_for(snapshot):
+    """
+    Returns the search index of the satellites of a snapshot, built once
+    per process. Without a snapshot, or with one of an older format that
+    has no binary catalogue, the index is built from the database every
+    time.
+    """
+    if snapshot is None or snapshot.format != snapshots.SNAPSHOT_FORMAT:
+        catalog_numbers, names = [], []
+        for number, name in Satellite.objects.order_by(
+                'satellite_catalog_number').values_list(
+                'satellite_catalog_number', 'name'):
+            catalog_numbers.append(number)
+            names.append(name)
+        return SearchIndex(catalog_numbers, names)
+
+    # Concurrent first queries of a new version wait for a single build
+    with _indexes_lock:
+        index = _indexes.get(snapshot.path)
+        if index is None:
+            _, records, names = binary_catalog.unpack(
+                snapshot.read('catalog.bin'))
+            index = SearchIndex(
+                records['catalog_number'].tolist(),
+                [name.decode('utf-8') for name in names])
+            # Older versions are not needed anymore
+            _indexes.clear()
+            _indexes[snapshot.path] = index
+    return index
@@ -0,0 +1,585 @@
+"""
+File description:
+Contains the prebuilt responses ('snapshots') of the main endpoint. After every
+ingest run, the whole catalogue is serialized and encoded once, both
+unfiltered and per category, and written to disk under a new dataset version.
+The 'index' view serves these bytes as they are, so handling a request needs
+no ORM or JSON work at all.
+
+A version is stored in SNAPSHOT_DIR as follows:
+- current: Text file with the newest complete version.
+- <version>/manifest.json: The catalog numbers in the snapshot, and the
+    catalog numbers of every category, country and classification.
+- <version>/all.json: Body of the unfiltered catalogue.
+- <version>/<category>.json: Body of a single category.
+- <version>/catalog.bin: The binary catalogue (see binary_catalog.py).
+- <version>/meta.json: Body of the meta endpoint without a filter, with the
+    facet counts of the whole catalogue (see facets.py).
+Every body also has precompressed copies next to it (see compression.py).
+"""
+
+import bisect
+import json
+import os
+import shutil
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.text import slugify
+
+from satellite_app import compression, facets
+from satellite_app.binary_catalog import CatalogBuilder
+from satellite_app.filters import SatelliteFilter, SnapshotIndex
+from satellite_app.models import (Satellite, MinorCategory, DatasetVersion,
+                                  SatelliteChange)
+
+
+# Number of versions that are kept on disk, so that requests which are
+# still reading an older version don't fail
+KEEP_VERSIONS = 3
+
+# Version of the layout of the files of a snapshot. Snapshots with another
+# layout are always rebuilt.
+SNAPSHOT_FORMAT = 4
+
+# Number of dataset versions for which the changes are kept. Clients that are
+# further behind get the full catalogue instead.
+KEEP_CHANGE_VERSIONS = 60
+
+# Number of satellites fetched from the database at a time while building
+# or streaming a body
+ITERATOR_CHUNK_SIZE = 2000
+
+# The snapshots that were loaded by this process, by directory
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+# The fields of a serialized satellite, in order, with the model fields
+# they come from. The categories come from the category bitmask.
+SERIALIZED_FIELDS = {
+    'name': 'name',
+    'line1': 'line1',
+    'line2': 'line2',
+    'catalog_number': 'satellite_catalog_number',
+    'launch_year': 'launch_year',
+    'epoch_year': 'epoch_year',
+    'epoch': 'epoch',
+    'revolutions': 'revolutions',
+    'revolutions_per_day': 'revolutions_per_day',
+    'country': 'country',
+    'categories': 'category_mask',
+    'classification': 'classification',
+}
+
+
+def serialize_satellite(sat, categories):
+    """
+    Transforms a satellite and the names of its
+    categories into JSON format.
+    """
+    return {'name': sat.name,
+            'line1': sat.line1,
+            'line2': sat.line2,
+            'catalog_number': sat.satellite_catalog_number,
+            'launch_year': sat.launch_year,
+            'epoch_year': sat.epoch_year,
+            'epoch': sat.epoch,
+            'revolutions': sat.revolutions,
+            'revolutions_per_day': sat.revolutions_per_day,
+            'country': sat.country,
+            'categories': categories,
+            'classification': sat.classification,
+            }
+
+
+def encode_item(data):
+    """
+    Encodes a single serialized satellite.
+    """
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def encode_body(items):
+    """
+    Joins encoded satellites into a response body. Every satellite is put
+    on its own line, so the items can be split up again without parsing.
+    """
+    return b'{"satellites":[\n' + b',\n'.join(items) + b'\n]}'
+
+
+def split_body(body):
+    """
+    Splits a body made by 'encode_body' back into its items.
+    """
+    return [line.rstrip(b',') for line in body.split(b'\n')[1:-1] if line]
+
+
+def encode_changes(snapshot, added, changed, removed):
+    """
+    Returns the body of the changes endpoint for the given catalog
+    numbers, built from the encoded satellites of a snapshot.
+    """
+    items = snapshot.items()
+    return (b'{"version":' + str(snapshot.version).encode()
+            + b',"full":false,"added":['
+            + b','.join(items[number] for number in added)
+            + b'],"changed":['
+            + b','.join(items[number] for number in changed)
+            + b'],"removed":' + json.dumps(removed).encode() + b'}')
+
+
+def encode_full(snapshot):
+    """
+    Returns the body of the changes endpoint for a client that has to
+    start over, which is the whole catalogue of a snapshot.
+    """
+    return (b'{"version":' + str(snapshot.version).encode()
+            + b',"full":true,' + snapshot.read('all.json')[1:])
+
+
+def category_file(category):
+    """
+    Returns the file name of the snapshot of a single category.
+    """
+    return slugify(category) + '.json'
+
+
+def iter_satellites(queryset, chunk_size=None):
+    """
+    Iterates over the satellites of a queryset together with the names of
+    their categories. The satellites are fetched 'chunk_size' at a time, so
+    memory use is bounded by the chunk size rather than by the size of the
+    catalogue. The categories come from the category bitmask of a
+    satellite, so they need no extra queries.
+    """
+    chunk_size = chunk_size or ITERATOR_CHUNK_SIZE
+    for sat in queryset.iterator(chunk_size=chunk_size):
+        yield sat, MinorCategory.names(sat.category_mask)
+
+
+def iter_projected(queryset, fields, chunk_size=None):
+    """
+    Iterates over the satellites of a queryset serialized with only the
+    given fields (see SERIALIZED_FIELDS), in the order of
+    'serialize_satellite'. Only the columns of those fields are fetched.
+    """
+    chunk_size = chunk_size or ITERATOR_CHUNK_SIZE
+    fields = [field for field in SERIALIZED_FIELDS if field in fields]
+    columns = [SERIALIZED_FIELDS[field] for field in fields]
+    for row in queryset.values_list(*columns).iterator(chunk_size=chunk_size):
+        yield {field: (MinorCategory.names(value) if field == 'categories'
+                       else value) for field, value in zip(fields, row)}
+
+
+def stream_body(queryset):
+    """
+    Generates the body for the satellites of a queryset piece by piece,
+    in the same format as 'encode_body'.
+    """
+    yield b'{"satellites":[\n'
+    separator = b''
+    for sat, categories in iter_satellites(queryset):
+        yield separator + encode_item(serialize_satellite(sat, categories))
+        separator = b',\n'
+    yield b'\n]}'
+
+
+def stream_projected(queryset, fields):
+    """
+    Generates the body for the satellites of a queryset with only the
+    given fields (see 'iter_projected'), in the same format as
+    'encode_body'.
+    """
+    yield b'{"satellites":[\n'
+    separator = b''
+    for item in iter_projected(queryset, fields):
+        yield separator + encode_item(item)
+        separator = b',\n'
+    yield b'\n]}'
+
+
+def diff_items(old_items, new_items):
+    """
+    Compares two dicts mapping catalog numbers to encoded satellites.
+    Returns the catalog numbers of the added, changed and removed
+    satellites.
+    """
+    added = [number for number in new_items if number not in old_items]
+    removed = [number for number in old_items if number not in new_items]
+    changed = [number for number, item in new_items.items()
+               if number in old_items and old_items[number] != item]
+    return added, changed, removed
+
+
+def build_snapshots(force=False):
+    """
+    Serializes the whole catalogue as it is in the database right now and
+    writes it to disk as a new dataset version, together with the changes
+    since the previous version. If nothing changed since the previous
+    version, no new version is made unless 'force' is given. Returns the
+    (new or previous) version.
+    """
+
+    members = {name: [] for name in
+               MinorCategory.objects.values_list('minor_category', flat=True)}
+
+    countries = {}
+    classifications = {}
+
+    catalog_numbers = []
+    items = []
+    catalog = CatalogBuilder()
+    for sat, sat_categories in iter_satellites(
+            Satellite.objects.order_by('satellite_catalog_number')):
+        catalog_numbers.append(sat.pk)
+        countries.setdefault(sat.country, []).append(sat.pk)
+        classifications.setdefault(sat.classification, []).append(sat.pk)
+        items.append(encode_item(serialize_satellite(sat, sat_categories)))
+        catalog.add(sat, sat_categories)
+        for name in sat_categories:
+            members.setdefault(name, []).append(len(items) - 1)
+
+    previous = current()
+    if previous is not None:
+        added, changed, removed = diff_items(
+            previous.items(), dict(zip(catalog_numbers, items)))
+        unchanged = (not (added or changed or removed)
+                     and previous.format == SNAPSHOT_FORMAT
+                     and sorted(previous.categories) == sorted(members))
+        previous_version = DatasetVersion.objects.filter(
+            version=previous.version).first()
+        if unchanged and previous_version is not None and not force:
+            return previous_version
+    else:
+        added, changed, removed = catalog_numbers, [], []
+
+    with transaction.atomic():
+        version = DatasetVersion.objects.create(
+            satellite_count=len(catalog_numbers))
+        _record_changes(version, added, changed, removed)
+
+    # Everything is written to a temporary directory first, which is
+    # renamed once complete. Readers never see a partial version.
+    final_dir = os.path.join(settings.SNAPSHOT_DIR, str(version.version))
+    build_dir = final_dir + '.tmp'
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+
+    _write_body(build_dir, 'all.json', encode_body(items))
+
+    for name, indices in members.items():
+        _write_body(build_dir, category_file(name),
+                    encode_body([items[i] for i in indices]))
+
+    _write_body(build_dir, 'catalog.bin', catalog.pack(version.version))
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': version.version,
+        'created_at': version.created_at.isoformat(),
+        'catalog_numbers': catalog_numbers,
+        'categories': {name: [catalog_numbers[i] for i in indices]
+                       for name, indices in members.items()},
+        'countries': countries,
+        'classifications': classifications,
+    }
+    with open(os.path.join(build_dir, 'manifest.json'), 'w') as outfile:
+        json.dump(manifest, outfile)
+
+    # The facet counts are computed from the files written above
+    _write_body(build_dir, 'meta.json', facets.encode_meta(
+        Snapshot(version.version, build_dir), SatelliteFilter()))
+
+    os.rename(build_dir, final_dir)
+    _set_current_version(version.version)
+    _prune_versions()
+    _analyze_satellites()
+
+    return version
+
+
+def _analyze_satellites():
+    """
+    Updates the statistics of the database on the satellites table after
+    an ingest, so that its query planner picks the most selective index
+    for the filters of the main endpoint.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE '
+                       + connection.ops.quote_name(Satellite._meta.db_table))
+
+
+def _write_body(directory, file_name, body):
+    """
+    Writes a body to a file, together with a precompressed copy
+    of it in every available encoding.
+    """
+    with open(os.path.join(directory, file_name), 'wb') as outfile:
+        outfile.write(body)
+
+    for encoding, extension in compression.ENCODINGS.items():
+        with open(os.path.join(directory, file_name + extension),
+                  'wb') as outfile:
+            outfile.write(compression.compress(body, encoding, build=True))
+
+
+def _record_changes(version, added, changed, removed):
+    """
+    Stores the changes of a new dataset version, and forgets the changes
+    of versions that are too old to be asked for.
+    """
+    kinds = SatelliteChange.ChangeChoices
+    SatelliteChange.objects.bulk_create(
+        [SatelliteChange(version=version, satellite_catalog_number=number,
+                         change=kind)
+         for kind, numbers in [(kinds.ADDED, added),
+                               (kinds.CHANGED, changed),
+                               (kinds.REMOVED, removed)]
+         for number in numbers],
+        batch_size=ITERATOR_CHUNK_SIZE)
+    SatelliteChange.objects.filter(
+        version__lte=version.version - KEEP_CHANGE_VERSIONS).delete()
+
+
+def changes_since(since):
+    """
+    Returns the catalog numbers of the satellites that were added, changed
+    and removed after dataset version 'since', with the changes of all
+    versions in between combined. Returns None if the changes of these
+    versions are no longer (or not yet) known.
+    """
+    snapshot = current()
+    if snapshot is None or since > snapshot.version \
+            or since < snapshot.version - KEEP_CHANGE_VERSIONS:
+        return None
+
+    kinds = SatelliteChange.ChangeChoices
+    first = {}
+    last = {}
+    for number, kind in SatelliteChange.objects.filter(
+            version__gt=since, version__lte=snapshot.version).order_by(
+            'version').values_list('satellite_catalog_number', 'change'):
+        first.setdefault(number, kind)
+        last[number] = kind
+
+    added, changed, removed = [], [], []
+    for number, kind in last.items():
+        if kind == kinds.REMOVED:
+            # Satellites that were added and removed again were never seen
+            if first[number] != kinds.ADDED:
+                removed.append(number)
+        elif first[number] == kinds.ADDED:
+            added.append(number)
+        else:
+            changed.append(number)
+    return sorted(added), sorted(changed), sorted(removed)
+
+
+def _set_current_version(version):
+    """
+    Points the 'current' file to the given version.
+    """
+    current_path = os.path.join(settings.SNAPSHOT_DIR, 'current')
+    with open(current_path + '.tmp', 'w') as outfile:
+        outfile.write(str(version))
+    os.replace(current_path + '.tmp', current_path)
+
+
+def _prune_versions():
+    """
+    Removes all but the newest KEEP_VERSIONS versions from disk.
+    """
+    versions = sorted(int(name) for name in os.listdir(settings.SNAPSHOT_DIR)
+                      if name.isdigit())
+    for version in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(settings.SNAPSHOT_DIR, str(version)),
+                      ignore_errors=True)
+
+
+def current_version():
+    """
+    Returns the newest complete dataset version,
+    or None if no snapshots were built yet.
+    """
+    try:
+        with open(os.path.join(settings.SNAPSHOT_DIR, 'current')) as infile:
+            return int(infile.read())
+    except (OSError, ValueError):
+        return None
+
+
+def current():
+    """
+    Returns the snapshot of the newest dataset version, or None
+    if no snapshots were built yet. The snapshot is only loaded from
+    disk once per process.
+    """
+    version = current_version()
+    if version is None:
+        return None
+
+    path = os.path.join(settings.SNAPSHOT_DIR, str(version))
+    snapshot = _loaded.get(path)
+    if snapshot is None:
+        with _loaded_lock:
+            snapshot = _loaded.get(path)
+            if snapshot is None:
+                try:
+                    snapshot = Snapshot(version)
+                except OSError:
+                    return None
+                # Older versions are not needed anymore
+                _loaded.clear()
+                _loaded[path] = snapshot
+    return snapshot
+
+
+class Snapshot:
+    """
+    A single dataset version on disk. The bodies are read lazily and
+    kept in memory afterwards. 'path' is only given for a version that is
+    still being built.
+    """
+
+    def __init__(self, version, path=None):
+        self.version = version
+        self.path = path or os.path.join(settings.SNAPSHOT_DIR, str(version))
+
+        with open(os.path.join(self.path, 'manifest.json')) as infile:
+            manifest = json.load(infile)
+
+        self.format = manifest.get('format')
+        self.created_at = manifest['created_at']
+        self.catalog_numbers = manifest['catalog_numbers']
+        self.categories = manifest['categories']
+        self.countries = manifest.get('countries', {})
+        self.classifications = manifest.get('classifications', {})
+
+        self._bodies = {}
+        self._items = None
+        self._filter_index = None
+
+    def read(self, file_name, encoding=None):
+        """
+        Returns the contents of one of the files of this snapshot,
+        compressed with 'encoding' if given. Precompressed files are
+        used when they exist.
+        """
+        key = (file_name, encoding)
+        body = self._bodies.get(key)
+        if body is None:
+            path = os.path.join(self.path, file_name)
+            if encoding is not None:
+                path += compression.ENCODINGS[encoding]
+            try:
+                with open(path, 'rb') as infile:
+                    body = infile.read()
+            except FileNotFoundError:
+                if encoding is None:
+                    raise
+                body = compression.compress(self.read(file_name), encoding)
+            self._bodies[key] = body
+        return body
+
+    def catalog(self):
+        """
+        Returns the binary catalogue of the satellites of this snapshot.
+        Snapshots of an older format may have none, then it is built once
+        from those satellites in the database.
+        """
+        if self.format == SNAPSHOT_FORMAT:
+            return self.read('catalog.bin')
+        body = self._bodies.get(('catalog.bin', None))
+        if body is None:
+            catalog_numbers = set(self.catalog_numbers)
+            builder = CatalogBuilder()
+            for sat, sat_categories in iter_satellites(
+                    Satellite.objects.order_by('satellite_catalog_number')):
+                if sat.satellite_catalog_number in catalog_numbers:
+                    builder.add(sat, sat_categories)
+            body = builder.pack(self.version)
+            self._bodies[('catalog.bin', None)] = body
+        return body
+
+    def items(self):
+        """
+        Returns a dict mapping catalog numbers to encoded satellites.
+        """
+        if self._items is None:
+            self._items = dict(zip(self.catalog_numbers,
+                                   split_body(self.read('all.json'))))
+        return self._items
+
+    def filter_index(self):
+        """
+        Returns the indexes on the attributes of the satellites, used to
+        plan filters (see filters.py).
+        """
+        if self._filter_index is None:
+            self._filter_index = SnapshotIndex(self)
+        return self._filter_index
+
+    def filtered(self, categories, match_all=False):
+        """
+        Returns the sorted catalog numbers of the satellites in any of the
+        given categories (all of them if 'match_all' is set), and the names
+        of the categories that exist. Names that don't exist are ignored,
+        and if none are left, all catalog numbers are returned.
+        """
+        known = sorted(set(cat for cat in categories
+                           if cat in self.categories))
+        if len(known) == 0:
+            return self.catalog_numbers, known
+        if len(known) == 1:
+            return self.categories[known[0]], known
+        members = [set(self.categories[cat]) for cat in known]
+        if match_all:
+            return sorted(set.intersection(*members)), known
+        return sorted(set.union(*members)), known
+
+    def body(self, categories, encoding=None, match_all=False):
+        """
+        Returns the body for a filter on the given category names (see
+        'filtered'), compressed with 'encoding' if given. Names that don't
+        exist are ignored, and if none are left, the whole catalogue is
+        returned. Several categories are combined without duplicates from
+        the encoded satellites.
+        """
+        catalog_numbers, known = self.filtered(categories, match_all)
+
+        if len(known) == 0:
+            return self.read('all.json', encoding)
+        if len(known) == 1:
+            return self.read(category_file(known[0]), encoding)
+
+        items = self.items()
+        body = encode_body([items[number] for number in catalog_numbers])
+        if encoding is not None:
+            body = compression.compress(body, encoding)
+        return body
+
+    def page(self, satellite_filter, after=None, limit=None, encoding=None):
+        """
+        Returns the body of a page of the satellites that pass a filter
+        (see filters.py): the first 'limit' satellites (all if None) with a
+        catalog number above 'after' (from the start if None). A page with
+        every satellite of a filter on categories is the prebuilt body.
+        """
+        catalog_numbers = satellite_filter.select(self)
+        first = (bisect.bisect_right(catalog_numbers, after)
+                 if after is not None else 0)
+        last = (len(catalog_numbers) if limit is None
+                else min(first + limit, len(catalog_numbers)))
+        if (first == 0 and last == len(catalog_numbers)
+                and not satellite_filter.attributes):
+            return self.body(satellite_filter.categories, encoding,
+                             satellite_filter.match_all)
+
+        items = self.items()
+        body = encode_body([items[number]
+                            for number in catalog_numbers[first:last]])
+        if encoding is not None:
+            body = compression.compress(body, encoding)
+        return body
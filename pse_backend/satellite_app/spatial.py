@@ -0,0 +1,293 @@
+"""
+File description:
+Contains the spatial index of the satellites, used by the 'nearby' and
+'nearest' endpoints. The Earth-fixed positions of the satellites at a given
+time are put in a uniform 3D grid of cubic cells, sorted by cell, so that a
+query only has to look at the satellites in the cells around the queried
+point instead of at every satellite in the catalogue.
+
+Like the link graphs (see links.py), an index is built for the start of a
+short time bucket, and the indexes of the last few buckets that were queried
+are kept per process, see 'index_at'.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from satellite_app import propagation
+
+
+# Edge length of a cell of the grid (in km)
+SPATIAL_CELL_SIZE = 500.0
+
+# Length of a time bucket (in seconds). All times in a bucket use the
+# positions at the start of the bucket, so that the requests of that time
+# share a single index.
+SPATIAL_TIME_BUCKET = 10
+
+# Number of indexes (times and filters) that are kept per process
+SPATIAL_CACHE_SIZE = 8
+
+# The indexes that were built by this process, most recently used last
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+class UniformGrid:
+    """
+    A uniform grid over a set of 3D points. Points with NaN coordinates
+    (satellites that couldn't be propagated) are left out.
+    """
+
+    def __init__(self, points, cell_size=SPATIAL_CELL_SIZE):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.cell_size = float(cell_size)
+
+        ids = np.flatnonzero(np.isfinite(self.points).all(axis=1))
+        cells = self.cells(self.points[ids])
+        if len(ids):
+            self.origin = cells.min(axis=0)
+            self.shape = cells.max(axis=0) - self.origin + 1
+        else:
+            self.origin = np.zeros(3, dtype=np.int64)
+            self.shape = np.ones(3, dtype=np.int64)
+
+        # The points sorted by cell, and the range of every occupied cell
+        keys = self.keys(cells)
+        order = np.argsort(keys, kind='stable')
+        self.order = ids[order]
+        self.cell_keys, self.cell_starts, counts = np.unique(
+            keys[order], return_index=True, return_counts=True)
+        self.cell_ends = self.cell_starts + counts
+
+    def cells(self, points):
+        """
+        Returns the integer cell coordinates of points.
+        """
+        return np.floor(points / self.cell_size).astype(np.int64)
+
+    def keys(self, cells):
+        """
+        Returns the keys of cells within the bounds of the grid.
+        """
+        relative = cells - self.origin
+        return ((relative[..., 0] * self.shape[1] + relative[..., 1])
+                * self.shape[2] + relative[..., 2])
+
+    def candidates(self, point, reach):
+        """
+        Returns the points in the cube of cells that reaches 'reach' cells
+        in every direction from the cell of 'point'.
+        """
+        center = self.cells(np.asarray(point, dtype=np.float64))
+        low = np.maximum(center - reach, self.origin)
+        high = np.minimum(center + reach, self.origin + self.shape - 1)
+        if np.any(low > high):
+            return np.empty(0, dtype=np.intp)
+
+        # The keys of all cells in the cube, in increasing order
+        x, y, z = (np.arange(low[axis], high[axis] + 1) - self.origin[axis]
+                   for axis in range(3))
+        keys = ((x[:, None, None] * self.shape[1] + y[None, :, None])
+                * self.shape[2] + z[None, None, :]).ravel()
+
+        # The occupied cells among them, and the points in those cells
+        found = np.searchsorted(self.cell_keys, keys)
+        inside = found < len(self.cell_keys)
+        found = found[inside]
+        found = found[self.cell_keys[found] == keys[inside]]
+        starts = self.cell_starts[found]
+        lengths = self.cell_ends[found] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.order[offsets + np.arange(lengths.sum())]
+
+    def _sorted(self, point, ids):
+        """
+        Returns the given points and their distances to 'point',
+        sorted by distance.
+        """
+        distances = np.linalg.norm(self.points[ids] - point, axis=1)
+        order = np.argsort(distances, kind='stable')
+        return ids[order], distances[order]
+
+    def within(self, point, radius):
+        """
+        Returns the points within 'radius' of 'point' and their
+        distances, sorted by distance.
+        """
+        reach = int(np.ceil(radius / self.cell_size))
+        ids, distances = self._sorted(point, self.candidates(point, reach))
+        keep = distances <= radius
+        return ids[keep], distances[keep]
+
+    def nearest(self, point, k):
+        """
+        Returns the 'k' points nearest to 'point' and their distances,
+        sorted by distance. The search grows one ring of cells at a time,
+        until the k-th nearest point can't be beaten by any point outside
+        of the searched cells.
+        """
+        point = np.asarray(point, dtype=np.float64)
+        center = self.cells(point)
+        max_reach = int(np.max(np.maximum(
+            np.abs(center - self.origin),
+            np.abs(self.origin + self.shape - 1 - center))))
+
+        for reach in range(max_reach + 1):
+            ids = self.candidates(point, reach)
+            if len(ids) < k and reach < max_reach:
+                continue
+            ids, distances = self._sorted(point, ids)
+            # Every point outside of the searched cells is at least
+            # 'reach' cells away
+            if (len(ids) >= k and distances[k - 1] <= reach * self.cell_size
+                    or reach == max_reach):
+                return ids[:k], distances[:k]
+        return np.empty(0, dtype=np.intp), np.empty(0)
+
+    def pairs(self, radius):
+        """
+        Returns all pairs of points that are at most 'radius' apart, as two
+        arrays of point ids and an array of their distances. Every pair is
+        returned once. Instead of comparing every point to every other
+        point, only the points in neighbouring cells are compared, one
+        offset between cells at a time.
+        """
+        reach = int(np.ceil(radius / self.cell_size))
+        x = self.cell_keys // (self.shape[1] * self.shape[2])
+        y = self.cell_keys // self.shape[2] % self.shape[1]
+        z = self.cell_keys % self.shape[2]
+        counts = self.cell_ends - self.cell_starts
+
+        firsts, seconds, distances = [], [], []
+        offsets = range(-reach, reach + 1)
+        for offset in ((dx, dy, dz) for dx in offsets for dy in offsets
+                       for dz in offsets):
+            # The opposite offset gives the same pairs
+            if offset < (0, 0, 0):
+                continue
+
+            # The occupied cells at this offset from every occupied cell
+            nx, ny, nz = x + offset[0], y + offset[1], z + offset[2]
+            inside = ((nx >= 0) & (nx < self.shape[0]) & (ny >= 0)
+                      & (ny < self.shape[1]) & (nz >= 0)
+                      & (nz < self.shape[2]))
+            keys = (nx * self.shape[1] + ny) * self.shape[2] + nz
+            cells = np.flatnonzero(inside)
+            found = np.searchsorted(self.cell_keys, keys[cells])
+            valid = found < len(self.cell_keys)
+            cells, found = cells[valid], found[valid]
+            matched = self.cell_keys[found] == keys[cells]
+            cells, found = cells[matched], found[matched]
+
+            # Every point of a cell with every point of the other cell
+            sizes = counts[cells] * counts[found]
+            pair = np.repeat(np.arange(len(cells)), sizes)
+            local = (np.arange(sizes.sum())
+                     - np.repeat(np.cumsum(sizes) - sizes, sizes))
+            first = (self.cell_starts[cells][pair]
+                     + local // counts[found][pair])
+            second = (self.cell_starts[found][pair]
+                      + local % counts[found][pair])
+            if offset == (0, 0, 0):
+                keep = first < second
+                first, second = first[keep], second[keep]
+
+            first, second = self.order[first], self.order[second]
+            distance = np.linalg.norm(
+                self.points[first] - self.points[second], axis=1)
+            keep = distance <= radius
+            firsts.append(first[keep])
+            seconds.append(second[keep])
+            distances.append(distance[keep])
+
+        if not firsts:
+            return (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp),
+                    np.empty(0))
+        return (np.concatenate(firsts), np.concatenate(seconds),
+                np.concatenate(distances))
+
+
+class SpatialIndex:
+    """
+    The Earth-fixed positions of a set of satellites at a single time,
+    indexed in a uniform grid.
+    """
+
+    def __init__(self, catalog_numbers, positions, timestamp):
+        self.catalog_numbers = np.asarray(catalog_numbers)
+        self.positions = positions
+        self.timestamp = timestamp
+        self.grid = UniformGrid(positions)
+
+    def row(self, catalog_number):
+        """
+        Returns the row of a satellite, or None if it isn't in the index
+        or has no position.
+        """
+        row = np.searchsorted(self.catalog_numbers, catalog_number)
+        if (row >= len(self.catalog_numbers)
+                or self.catalog_numbers[row] != catalog_number
+                or not np.isfinite(self.positions[row]).all()):
+            return None
+        return int(row)
+
+    def within(self, point, radius, exclude=None):
+        """
+        Returns the catalog numbers of the satellites within 'radius' km of
+        'point' (an Earth-fixed position) and their distances, nearest
+        first. The satellite in row 'exclude' is left out.
+        """
+        rows, distances = self.grid.within(point, radius)
+        keep = rows != exclude
+        return self.catalog_numbers[rows[keep]], distances[keep]
+
+    def nearest(self, point, k, exclude=None):
+        """
+        Returns the catalog numbers of the 'k' satellites nearest to 'point'
+        (an Earth-fixed position) and their distances, nearest first. The
+        satellite in row 'exclude' is left out.
+        """
+        extra = 1 if exclude is not None else 0
+        rows, distances = self.grid.nearest(point, k + extra)
+        keep = rows != exclude
+        return (self.catalog_numbers[rows[keep]][:k], distances[keep][:k])
+
+
+def time_bucket(timestamp):
+    """
+    Returns the start of the time bucket of a Unix timestamp.
+    """
+    return int(timestamp // SPATIAL_TIME_BUCKET * SPATIAL_TIME_BUCKET)
+
+
+def index_at(timestamp, mask=0):
+    """
+    Returns the spatial index of the satellites in the categories of 'mask'
+    (all satellites if 0) at the start of the time bucket of a Unix
+    timestamp, and the snapshot it was built from. Indexes are kept per
+    dataset version, time bucket and filter.
+    """
+    bucket = time_bucket(timestamp)
+    propagator, snapshot = propagation.current()
+    key = (snapshot.path if snapshot is not None else None, bucket, mask)
+
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index, snapshot
+
+    propagator = propagator.subset(mask)
+    index = SpatialIndex(propagator.catalog_numbers,
+                         propagator.ecef(bucket), bucket)
+
+    # Without a snapshot, the satellites can change at any time
+    if snapshot is not None:
+        with _indexes_lock:
+            _indexes[key] = index
+            while len(_indexes) > SPATIAL_CACHE_SIZE:
+                _indexes.popitem(last=False)
+    return index, snapshot
@@ -13,16 +13,213 @@ The tests are as follows:
     intended
 - test_countries_endpoint: Tests whether the countries endpoint works as
     intended
+- IngestTestCase: Tests the ingestion in the 'ingest' package.
+- test_upsert_reports_changes: Tests whether an upsert inserts, updates and
+    skips the right satellites.
+- test_upsert_links_categories: Tests whether an upsert links satellites to
+    a category exactly once, and sets their category bitmask.
+- test_pull_categories: Tests whether the downloads of several categories
+    are all parsed and stored.
+- test_parse_tles: Tests whether the TLE parser reads valid TLEs, including
+    Alpha-5 catalog numbers, and reports the invalid ones.
+- test_fetch_cache: Tests whether unchanged downloads are skipped, and
+    whether a failed download falls back on the cached body.
+- test_assign_countries: Tests whether country codes from the satellite
+    catalogue are assigned to stored satellites only.
+- SnapshotTestCase: Tests the prebuilt responses in snapshots.py.
+- test_index_serves_snapshot: Tests whether the main endpoint serves the
+    snapshot of the newest dataset version.
+- test_index_combines_categories: Tests whether filtering on several
+    categories returns every matching satellite exactly once.
+- test_index_streams_without_snapshot: Tests whether the main endpoint
+    streams the satellites from the database when there is no snapshot.
+- test_index_pagination: Tests whether the main endpoint pages through the
+    satellites by catalog number, and returns only the requested fields.
+- test_index_match_all: Tests whether filtering with 'match=all' keeps only
+    the satellites in all of the categories, with and without a snapshot.
+- test_index_attribute_filters: Tests whether the filters on the attributes
+    of the satellites give the same satellites with and without a snapshot.
+- test_meta_endpoint: Tests whether the meta endpoint counts the satellites
+    per facet, taking every filter into account except the one on the facet.
+- test_search_index: Tests whether the search index ranks catalog numbers,
+    names, prefixes and substrings in the right order.
+- test_search_endpoint: Tests whether the search endpoint finds satellites
+    with and without a snapshot.
+- test_catalog_endpoint: Tests whether the binary catalogue holds the
+    orbital elements of the (filtered) satellites.
+- test_changes_endpoint: Tests whether the changes endpoint returns only
+    the differences since a version, or everything if it is too old.
+- test_conditional_requests: Tests whether the endpoints answer a request
+    for a version the client already has with a 304.
+- test_compressed_responses: Tests whether the endpoints are compressed
+    in the encoding the client asks for.
+- test_cache_follows_dataset_version: Tests whether cached responses are
+    shared, and replaced as soon as a new dataset version is published.
+- PropagationTestCase: Tests the batched propagation in propagation.py.
+- test_propagation_matches_sgp4: Tests whether the batched propagation and
+    the conversion to geodetic coordinates agree with plain SGP4.
+- test_positions_endpoint: Tests whether the positions endpoint returns the
+    (filtered) satellites in the layout of the web workers.
+- test_ephemeris_grid: Tests whether the ephemeris grid, built by several
+    processes, holds the propagated positions.
+- test_ephemeris_endpoint: Tests whether the ephemeris endpoint serves the
+    samples of the requested satellites and time window.
+- test_track_endpoints: Tests whether the track endpoints return the
+    sampled tracks of one or more satellites, and cache them.
+- test_uniform_grid: Tests whether the queries of the spatial index give
+    the same results as comparing every point.
+- test_spatial_endpoints: Tests whether the nearby and nearest endpoints
+    find the satellites around a point or a satellite.
+- test_link_graph: Tests whether the link graph links exactly the close
+    satellites, and whether its routes are the shortest.
+- test_route_endpoint: Tests whether the route endpoint finds the route
+    between satellites or points.
+- test_pass_prediction: Tests whether the predicted passes agree with a
+    fine scan of the elevations.
+- test_passes_endpoint: Tests whether the passes endpoint serves the passes
+    of the selected satellites, and caches them.
+- test_passes_without_crossings: Tests whether satellites that are visible
+    the whole time or never are handled, like a geostationary one.
+- ConjunctionTestCase: Tests the conjunction screening in conjunctions.py.
+- test_screening_finds_approaches: Tests whether the screening finds the
+    same close approaches as comparing the satellites every second.
+- test_conjunctions_endpoint: Tests whether screened conjunctions are
+    stored by the command and served by the conjunctions endpoint.
+- StartupTestCase: Tests the startup of the web process.
+- test_web_imports: Tests whether a web worker starts without importing the
+    ingestion code, and within the import time budget.
 
 Can be run with:
     python3 manage.py test
 """
 
+import calendar
+import gzip
+import io
 import json
+import os
 import random
-from django.test import TestCase
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+from django.conf import settings
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.core.cache import cache
 from django.core.management import call_command
+from django.db.models import QuerySet
 
+import numpy as np
+from sgp4.api import Satrec, jday
+from sgp4.propagation import gstime
+
+from satellite_app import (cron, snapshots, binary_catalog, compression,
+                           propagation, ephemeris, tracks, spatial, links,
+                           passes, conjunctions, filters, search)
+from satellite_app import tle as tle_parser
+from satellite_app.ingest import celestrak, satcat
+from satellite_app.ingest.upsert import upsert_satellites, assign_countries
+from satellite_app.models import Satellite, MinorCategory, Conjunction
+
+# Two real TLEs, used by the tests that don't rely on the fixtures
+ISS_TLE = (
+    'ISS (ZARYA)',
+    '1 25544U 98067A   24176.51782528  .00020137  00000+0  35631-3 0  9991',
+    '2 25544  51.6395 276.2164 0010035 101.0632  42.7834 15.50066683459861')
+HST_TLE = (
+    'HST',
+    '1 20580U 90037B   24176.46356221  .00008328  00000+0  38744-3 0  9992',
+    '2 20580  28.4701 116.8521 0002638  51.9626 308.1510 15.20930911684389')
+
+# A geostationary satellite above longitude 88.2
+GEO_TLE = (
+    'GEO',
+    '1 41866U 16071A   24176.50000000 -.00000270  00000+0  00000+0 0  9993',
+    '2 41866   0.0880  92.6213 0001054 233.1402 215.6108  1.00272000 27814')
+
+# The ISS in a more inclined orbit, so that both cross the
+# line of nodes of their orbits at the same time
+CROSSING_TLE = (
+    'CROSSING',
+    '1 99001U 98067A   24176.51782528  .00020137  00000+0  35631-3 0  9991',
+    '2 99001  60.0000 276.2164 0010035 101.0632  42.7834 15.50066683459861')
+
+
+def make_satellite(tle, **kwargs):
+    """
+    Builds an unsaved satellite from a (name, line1, line2) tuple.
+    """
+    fields = {
+        'name': tle[0],
+        'line1': tle[1],
+        'line2': tle[2],
+        'satellite_catalog_number': int(tle[1][2:7]),
+        'classification': tle[1][7],
+        'launch_year': 1998,
+        'epoch_year': 2024,
+        'epoch': float(tle[1][20:32]),
+        'revolutions': int(tle[2][63:68]),
+        'revolutions_per_day': float(tle[2][52:63]),
+    }
+    fields.update(kwargs)
+    return Satellite(**fields)
+
+
+def response_json(response):
+    """
+    Returns the decoded JSON body of a response,
+    which may be a streaming response.
+    """
+    if response.streaming:
+        return json.loads(b''.join(response.streaming_content))
+    return json.loads(response.content)
+
+
+def decompress(data, encoding):
+    """
+    Decompresses a response body that was compressed with 'encoding'.
+    """
+    if encoding == 'br':
+        return compression.brotli.decompress(data)
+    return gzip.decompress(data)
+
+
+def use_temporary_data_dir(test_case):
+    """
+    Points the data directories to a temporary directory for the duration
+    of a test, so that tests never read or write the real data.
+    """
+    data_dir = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, data_dir)
+    settings_override = override_settings(
+        DATA_DIR=data_dir,
+        FETCH_CACHE_DIR=os.path.join(data_dir, 'celestrak'),
+        SNAPSHOT_DIR=os.path.join(data_dir, 'snapshots'),
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(data_dir, 'cache')}})
+    settings_override.enable()
+    test_case.addCleanup(settings_override.disable)
+
+
+def downgrade_snapshot():
+    """
+    Turns the current snapshot into one of before the snapshot format was
+    recorded, which has no binary catalogue. The snapshot is loaded from
+    disk again on the next request.
+    """
+    path = os.path.join(settings.SNAPSHOT_DIR,
+                        str(snapshots.current_version()))
+    for name in os.listdir(path):
+        if name.startswith('catalog.bin'):
+            os.remove(os.path.join(path, name))
+    with open(os.path.join(path, 'manifest.json')) as infile:
+        manifest = json.load(infile)
+    del manifest['format']
+    with open(os.path.join(path, 'manifest.json'), 'w') as outfile:
+        json.dump(manifest, outfile)
+    snapshots._loaded.clear()
 
 
 class EndpointsTestCase(TestCase):
@@ -40,6 +237,7 @@ class EndpointsTestCase(TestCase):
         """
 
         call_command('loaddata', 'category_fixture.json')
+        use_temporary_data_dir(self)
 
     def test_main_endpoint_all_satellites(self):
         """
@@ -53,9 +251,9 @@ class EndpointsTestCase(TestCase):
             200,
             "The /satellite_app/ endpoint did not return OK status!")
 
-        response_json = json.loads(response_all_satellites.content)
+        data = response_json(response_all_satellites)
 
-        satellites_amount = len(response_json['satellites'])
+        satellites_amount = len(data['satellites'])
 
         CORRECT_SATELLITES_AMOUNT = 10344  # <- Based on the mock data
 
@@ -76,9 +274,9 @@ class EndpointsTestCase(TestCase):
             response_some_satellites.status_code,
             200,
             "The /satellite_app?... endpoint did not return OK status!")
-        response_json = json.loads(response_some_satellites.content)
+        data = response_json(response_some_satellites)
 
-        satellites_list = response_json['satellites']
+        satellites_list = data['satellites']
 
         # Pick a random satellite, check if its categories are correct
         for _ in range(3):
@@ -151,3 +349,1406 @@ class EndpointsTestCase(TestCase):
         self.assertEqual(countries_amount,
                          len(set(response_json['countries'])),
                          "There are duplicate countries!")
+
+
+class IngestTestCase(TestCase):
+    """
+    Tests the ingestion in the 'ingest' package.
+    """
+
+    def setUp(self):
+        self.stations = MinorCategory.objects.create(
+            minor_category=MinorCategory.MinorCategoryChoices.SPACE_STATIONS)
+
+        use_temporary_data_dir(self)
+
+    def test_upsert_reports_changes(self):
+        """
+        Tests whether an upsert inserts, updates and
+        skips the right satellites.
+        """
+
+        report = upsert_satellites(
+            [make_satellite(ISS_TLE), make_satellite(HST_TLE)],
+            self.stations)
+        self.assertEqual(report['inserted'], 2)
+        self.assertEqual(Satellite.objects.count(), 2)
+
+        # Countries are assigned by another cronjob and must survive
+        Satellite.objects.filter(pk=25544).update(country='ISS')
+
+        report = upsert_satellites(
+            [make_satellite(ISS_TLE, name='ISS'), make_satellite(HST_TLE)],
+            self.stations)
+        self.assertEqual(report['inserted'], 0)
+        self.assertEqual(report['updated'], 1)
+        self.assertEqual(report['unchanged'], 1)
+
+        iss = Satellite.objects.get(pk=25544)
+        self.assertEqual(iss.name, 'ISS')
+        self.assertEqual(iss.country, 'ISS')
+
+    def test_upsert_links_categories(self):
+        """
+        Tests whether an upsert links satellites to a category
+        exactly once, and sets their category bitmask.
+        """
+
+        weather = MinorCategory.objects.create(
+            minor_category=MinorCategory.MinorCategoryChoices.WEATHER)
+
+        upsert_satellites([make_satellite(ISS_TLE)], self.stations)
+        report = upsert_satellites([make_satellite(ISS_TLE)], self.stations)
+        self.assertEqual(report['linked'], 0)
+
+        report = upsert_satellites([make_satellite(ISS_TLE)], weather)
+        self.assertEqual(report['linked'], 1)
+
+        iss = Satellite.objects.get(pk=25544)
+        self.assertEqual(
+            sorted(cat.minor_category for cat in iss.minor_categories.all()),
+            ['Space Stations', 'Weather'])
+
+        # The category bitmask follows the links
+        self.assertEqual(MinorCategory.names(iss.category_mask),
+                         ['Space Stations', 'Weather'])
+        upsert_satellites([make_satellite(ISS_TLE, name='ISS')], self.stations)
+        self.assertEqual(Satellite.objects.get(pk=25544).category_mask,
+                         iss.category_mask)
+
+    def test_pull_categories(self):
+        """
+        Tests whether the downloads of several categories
+        are all parsed and stored.
+        """
+
+        MinorCategory.objects.create(
+            minor_category=MinorCategory.MinorCategoryChoices.WEATHER)
+        bodies = {
+            'Space Stations': ('\r\n'.join(ISS_TLE) + '\r\n').encode(),
+            'Weather': ('\r\n'.join(ISS_TLE + HST_TLE) + '\r\n').encode(),
+        }
+
+        with mock.patch.object(
+                celestrak, 'fetch_category',
+                side_effect=lambda session, category: bodies[category]):
+            celestrak.pull_categories(['Space Stations', 'Weather'])
+
+        self.assertEqual(Satellite.objects.count(), 2)
+        self.assertEqual(
+            Satellite.objects.get(pk=25544).minor_categories.count(), 2)
+
+    def test_parse_tles(self):
+        """
+        Tests whether the TLE parser reads valid TLEs, including Alpha-5
+        catalog numbers, and reports the invalid ones.
+        """
+
+        def with_checksum(line):
+            return line[:68] + str(tle_parser.checksum(line))
+
+        alpha5 = [with_checksum(line[:2] + 'A0001' + line[7:])
+                  for line in ISS_TLE[1:]]
+        launched_2024 = with_checksum(
+            HST_TLE[1][:9] + '24001A  ' + HST_TLE[1][17:])
+        text = '\r\n'.join([
+            '0 ' + ISS_TLE[0], ISS_TLE[1], ISS_TLE[2],
+            # Without a name line
+            launched_2024, HST_TLE[2],
+            'ALPHA', *alpha5,
+            'CROSSING', *CROSSING_TLE[1:],
+            'SHORT', ISS_TLE[1][:60], ISS_TLE[2]]) + '\r\n'
+
+        records, errors = tle_parser.parse_tles(text)
+        self.assertEqual(
+            [(record.name, record.catalog_number, record.launch_year)
+             for record in records],
+            [('ISS (ZARYA)', 25544, 1998), ('', 20580, 2024),
+             ('ALPHA', 100001, 1998)])
+        self.assertEqual([name for name, _ in errors], ['CROSSING', 'SHORT'])
+
+        iss = records[0]
+        self.assertEqual((iss.classification, iss.epoch_year, iss.revolutions),
+                         ('U', 2024, 45986))
+        self.assertAlmostEqual(iss.epoch_day, 176.51782528)
+        self.assertAlmostEqual(iss.mean_motion, 15.50066683)
+
+        self.assertEqual(tle_parser.catalog_number('Z9999'), 339999)
+        self.assertRaises(ValueError, tle_parser.catalog_number, 'I0001')
+        self.assertEqual(tle_parser.full_year(57), 1957)
+        self.assertEqual(tle_parser.full_year(56), 2056)
+        no_designator = ISS_TLE[1][:9] + ' ' * 8 + ISS_TLE[1][17:]
+        self.assertEqual(tle_parser.launch_year(no_designator),
+                         tle_parser.UNKNOWN_LAUNCH_YEAR)
+
+    def test_fetch_cache(self):
+        """
+        Tests whether unchanged downloads are skipped, and
+        whether a failed download falls back on the cached body.
+        """
+
+        body = ('\n'.join(ISS_TLE) + '\n').encode()
+        session = mock.Mock()
+        session.get.return_value = mock.Mock(
+            status_code=200, content=body, headers={'ETag': '"v1"'})
+
+        celestrak.ingest_body(
+            'Space Stations', self.stations,
+            celestrak.fetch_category(session, 'Space Stations'))
+        self.assertEqual(Satellite.objects.count(), 1)
+
+        # The next request is conditional, and a 304 means no writes
+        session.get.return_value = mock.Mock(status_code=304)
+        with mock.patch.object(celestrak, 'store_satellites') as store:
+            celestrak.ingest_body(
+                'Space Stations', self.stations,
+                celestrak.fetch_category(session, 'Space Stations'))
+            store.assert_not_called()
+        self.assertEqual(session.get.call_args.kwargs['headers'],
+                         {'If-None-Match': '"v1"'})
+
+        # A failed download still returns the last body
+        session.get.return_value = mock.Mock(status_code=503)
+        self.assertEqual(
+            celestrak.fetch_category(session, 'Space Stations'), body)
+
+    def test_assign_countries(self):
+        """
+        Tests whether country codes from the satellite
+        catalogue are assigned to stored satellites only.
+        """
+
+        upsert_satellites(
+            [make_satellite(ISS_TLE), make_satellite(HST_TLE)],
+            self.stations)
+        catalogue = (
+            'OBJECT_NAME,OBJECT_ID,NORAD_CAT_ID,OBJECT_TYPE,'
+            'OPS_STATUS_CODE,OWNER\n'
+            '"ISS (ZARYA)",1998-067A,25544,PAY,+,ISS\n'
+            '"HST, HUBBLE",1990-037B,20580,PAY,+,US\n'
+            'VANGUARD 1,1958-002B,5,PAY,,US\n'
+            'UNKNOWN,1958-002C,6,PAY,,???\n')
+
+        countries, unknown_owners = satcat.parse_satcat(
+            catalogue, {'ISS': 'INT', 'US': 'US'})
+        self.assertEqual(countries, {25544: 'INT', 20580: 'US', 5: 'US'})
+        self.assertEqual(unknown_owners, 1)
+
+        report = assign_countries(countries)
+        self.assertEqual(report,
+                         {'updated': 2, 'unchanged': 0, 'unfound': 1})
+        self.assertEqual(Satellite.objects.get(pk=20580).country, 'US')
+
+        report = assign_countries(countries)
+        self.assertEqual(report['updated'], 0)
+        self.assertEqual(report['unchanged'], 2)
+
+
+class SnapshotTestCase(TestCase):
+    """
+    Tests the prebuilt responses in snapshots.py.
+    """
+
+    def setUp(self):
+        use_temporary_data_dir(self)
+        cache.clear()
+        self.stations = MinorCategory.objects.create(
+            minor_category=MinorCategory.MinorCategoryChoices.SPACE_STATIONS)
+        self.science = MinorCategory.objects.create(
+            minor_category=MinorCategory.MinorCategoryChoices.SPACE_AND_EARTH)
+        self.starlink = MinorCategory.objects.create(
+            minor_category=MinorCategory.MinorCategoryChoices.STARLINK)
+        upsert_satellites([make_satellite(ISS_TLE)], self.stations)
+        upsert_satellites(
+            [make_satellite(ISS_TLE), make_satellite(HST_TLE)], self.science)
+
+    def test_index_serves_snapshot(self):
+        """
+        Tests whether the main endpoint serves the
+        snapshot of the newest dataset version.
+        """
+
+        first = snapshots.build_snapshots()
+        Satellite.objects.filter(pk=20580).update(name='HUBBLE')
+        second = snapshots.build_snapshots()
+        self.assertGreater(second.version, first.version)
+
+        response = self.client.get('/satellite_app/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Dataset-Version'], str(second.version))
+
+        response_json = json.loads(response.content)
+        self.assertEqual(
+            [sat['name'] for sat in response_json['satellites']],
+            ['HUBBLE', 'ISS (ZARYA)'])
+        self.assertEqual(response_json['satellites'][1]['categories'],
+                         ['Space Stations', 'Space and Earth Science'])
+
+    def test_index_combines_categories(self):
+        """
+        Tests whether filtering on several categories returns
+        every matching satellite exactly once.
+        """
+
+        snapshots.build_snapshots()
+
+        for category_filter, expected in [
+                ('Space Stations', [25544]),
+                ('Starlink', []),
+                ('Space Stations, Space and Earth Science', [20580, 25544]),
+                ('Space Stations, Starlink', [25544]),
+                ('Does Not Exist', [20580, 25544])]:
+            response = self.client.get(
+                '/satellite_app/', {'filter': category_filter})
+            response_json = json.loads(response.content)
+            self.assertEqual(
+                [sat['catalog_number'] for sat in response_json['satellites']],
+                expected)
+
+    def test_index_streams_without_snapshot(self):
+        """
+        Tests whether the main endpoint streams the satellites
+        from the database when there is no snapshot.
+        """
+
+        # The body is streamed (and the satellites fetched) while it is
+        # consumed, one satellite at a time
+        with mock.patch.object(snapshots, 'ITERATOR_CHUNK_SIZE', 1), \
+                mock.patch.object(QuerySet, 'iterator', autospec=True,
+                                  side_effect=QuerySet.iterator) as iterator:
+            response = self.client.get('/satellite_app/')
+            filtered_response = self.client.get(
+                '/satellite_app/', {'filter': 'Space Stations, Starlink'})
+            self.assertTrue(response.streaming)
+            iterator.assert_not_called()
+            body = response_json(response)
+            filtered_body = response_json(filtered_response)
+        self.assertEqual(
+            [call.kwargs['chunk_size'] for call in iterator.call_args_list],
+            [1, 1])
+        self.assertEqual(
+            [sat['catalog_number'] for sat in filtered_body['satellites']],
+            [25544])
+
+        # The streamed body is the same as the one of the snapshot
+        snapshots.build_snapshots()
+        self.assertEqual(body, json.loads(snapshots.current().body([])))
+
+    def test_index_pagination(self):
+        """
+        Tests whether the main endpoint pages through the satellites
+        by catalog number, and returns only the requested fields.
+        """
+
+        upsert_satellites([make_satellite(CROSSING_TLE)], self.science)
+        snapshots.build_snapshots()
+
+        def catalog_numbers(parameters):
+            response = self.client.get('/satellite_app/', parameters)
+            self.assertEqual(response.status_code, 200)
+            return [sat['catalog_number']
+                    for sat in response_json(response)['satellites']]
+
+        self.assertEqual(catalog_numbers({'limit': 2}), [20580, 25544])
+        self.assertEqual(catalog_numbers({'after': 20580, 'limit': 1}),
+                         [25544])
+        self.assertEqual(catalog_numbers({'after': 25544}), [99001])
+        self.assertEqual(catalog_numbers({'after': 99001}), [])
+        self.assertEqual(catalog_numbers({
+            'filter': 'Space Stations, Space and Earth Science',
+            'after': 20580, 'limit': 5}), [25544, 99001])
+
+        # A page with every satellite is the prebuilt body
+        self.assertEqual(
+            self.client.get('/satellite_app/', {'limit': 20000}).content,
+            snapshots.current().read('all.json'))
+
+        # Projections come from the database, the categories come from the
+        # category bitmask without extra queries
+        with self.assertNumQueries(1):
+            response = self.client.get('/satellite_app/', {
+                'fields': 'name,line1,line2', 'after': 20580, 'limit': 1})
+            sats = response_json(response)['satellites']
+        self.assertEqual(sats, [{'name': ISS_TLE[0], 'line1': ISS_TLE[1],
+                                 'line2': ISS_TLE[2],
+                                 'catalog_number': 25544}])
+        with self.assertNumQueries(1):
+            response = self.client.get('/satellite_app/', {
+                'fields': 'categories', 'filter': 'Space Stations'})
+            sats = response_json(response)['satellites']
+        self.assertEqual(sats, [{
+            'catalog_number': 25544,
+            'categories': ['Space Stations', 'Space and Earth Science']}])
+
+        for bad in [{'limit': 0}, {'after': 'ISS'}, {'fields': 'name,tle'},
+                    {'match': 'some'}]:
+            response = self.client.get('/satellite_app/', bad)
+            self.assertEqual(response.status_code, 400)
+
+    def test_index_match_all(self):
+        """
+        Tests whether filtering with 'match=all' keeps only the
+        satellites in all of the categories, with and without a snapshot.
+        """
+
+        category_filter = 'Space Stations, Space and Earth Science'
+        mask = binary_catalog.category_mask(category_filter.split(', '))
+        self.assertEqual(
+            sorted(Satellite.objects.in_categories(mask).values_list(
+                'pk', flat=True)), [20580, 25544])
+        self.assertEqual(
+            list(Satellite.objects.in_categories(mask, True).values_list(
+                'pk', flat=True)), [25544])
+
+        for build in [False, True]:
+            if build:
+                snapshots.build_snapshots()
+            for match, expected in [('any', [20580, 25544]),
+                                    ('all', [25544])]:
+                response = self.client.get('/satellite_app/', {
+                    'filter': category_filter, 'match': match})
+                self.assertEqual(
+                    [sat['catalog_number'] for sat in
+                     response_json(response)['satellites']], expected)
+
+    def test_index_attribute_filters(self):
+        """
+        Tests whether the filters on the attributes of the satellites
+        give the same satellites with and without a snapshot.
+        """
+
+        upsert_satellites([make_satellite(CROSSING_TLE)], self.science)
+        Satellite.objects.filter(pk=25544).update(country='ISS')
+        Satellite.objects.filter(pk=20580).update(
+            country='US', launch_year=1990)
+        Satellite.objects.filter(pk=99001).update(
+            country='US', launch_year=2020, classification='C')
+
+        # A day after a time between the epochs of HST and the ISS
+        now = calendar.timegm((2024, 1, 1, 0, 0, 0)) + 176.49 * 86400
+
+        def catalog_numbers(parameters):
+            response = self.client.get('/satellite_app/', parameters)
+            self.assertEqual(response.status_code, 200)
+            return [sat['catalog_number']
+                    for sat in response_json(response)['satellites']]
+
+        with mock.patch.object(filters, 'time') as clock:
+            clock.time.return_value = now
+            for build in [False, True]:
+                if build:
+                    snapshots.build_snapshots()
+                for parameters, expected in [
+                        ({'country': 'US'}, [20580, 99001]),
+                        ({'country': 'US, ISS', 'min_launch_year': 1995},
+                         [25544, 99001]),
+                        ({'max_launch_year': 1998}, [20580, 25544]),
+                        ({'classification': 'C'}, [99001]),
+                        ({'country': 'NL'}, []),
+                        ({'country': 'US', 'filter': 'Space Stations'}, []),
+                        ({'filter': 'Space Stations, Space and Earth Science',
+                          'match': 'all', 'country': 'ISS'}, [25544]),
+                        ({'max_age': 1}, [25544, 99001]),
+                        ({'max_age': 1, 'classification': 'U'}, [25544]),
+                        ({'country': 'US', 'after': 20580}, [99001])]:
+                    self.assertEqual(catalog_numbers(parameters), expected,
+                                     parameters)
+
+            # The indexes of a snapshot of an older format, which has no
+            # binary catalogue, are built from the database
+            category_masks = snapshots.current().filter_index().category_masks
+            downgrade_snapshot()
+            index = snapshots.current().filter_index()
+            np.testing.assert_array_equal(index.category_masks,
+                                          category_masks)
+            self.assertEqual(filters.parse_filter(
+                {'max_launch_year': 1998}).select(snapshots.current()),
+                [20580, 25544])
+
+        for bad in [{'classification': 'X'}, {'min_launch_year': 'old'},
+                    {'max_age': -1}]:
+            response = self.client.get('/satellite_app/', bad)
+            self.assertEqual(response.status_code, 400)
+
+    def test_meta_endpoint(self):
+        """
+        Tests whether the meta endpoint counts the satellites per facet,
+        taking every filter into account except the one on the facet.
+        """
+
+        upsert_satellites([make_satellite(CROSSING_TLE)], self.science)
+        Satellite.objects.filter(pk=25544).update(country='ISS')
+        Satellite.objects.filter(pk=20580).update(
+            country='US', launch_year=1990)
+        Satellite.objects.filter(pk=99001).update(
+            country='US', launch_year=2020, classification='C')
+
+        response = self.client.get('/satellite_app/meta')
+        self.assertEqual(response.status_code, 503)
+
+        version = snapshots.build_snapshots()
+        with self.assertNumQueries(0):
+            response = self.client.get('/satellite_app/meta')
+        self.assertEqual(response.json(), {
+            'version': version.version,
+            'satellite_count': 3,
+            'facets': {
+                'categories': {'Space Stations': 1,
+                               'Space and Earth Science': 3,
+                               'Starlink': 0},
+                'countries': {'ISS': 1, 'US': 2},
+                'launch_years': {'1990': 1, '1998': 1, '2020': 1},
+                'classifications': {'C': 1, 'U': 2},
+            },
+        })
+        self.assertEqual(response.content,
+                         snapshots.current().read('meta.json'))
+
+        response = self.client.get('/satellite_app/meta', {'country': 'US'})
+        self.assertEqual(response.json()['satellite_count'], 2)
+        self.assertEqual(response.json()['facets'], {
+            'categories': {'Space Stations': 0,
+                           'Space and Earth Science': 2,
+                           'Starlink': 0},
+            'countries': {'ISS': 1, 'US': 2},
+            'launch_years': {'1990': 1, '1998': 0, '2020': 1},
+            'classifications': {'C': 1, 'U': 1},
+        })
+
+        response = self.client.get('/satellite_app/meta', {
+            'country': 'US', 'filter': 'Space Stations'})
+        self.assertEqual(response.json()['satellite_count'], 0)
+        self.assertEqual(
+            response.json()['facets']['categories']['Space Stations'], 0)
+        self.assertEqual(response.json()['facets']['countries'],
+                         {'ISS': 1, 'US': 0})
+
+        response = self.client.get('/satellite_app/meta', {'max_age': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_index(self):
+        """
+        Tests whether the search index ranks catalog numbers, names,
+        prefixes and substrings in the right order.
+        """
+
+        index = search.SearchIndex(
+            [25544, 20580, 1, 44444, 25545],
+            ['ISS (ZARYA)', 'HST', 'ISS DEB', 'CISSAT', 'STARLINK-25544'])
+
+        def found(query, limit=10):
+            return [int(index.catalog_numbers[row])
+                    for row in index.search(query, limit)]
+
+        self.assertEqual(found('iss'), [1, 25544, 44444])
+        self.assertEqual(found('iss', 2), [1, 25544])
+        self.assertEqual(found('Zarya'), [25544])
+        self.assertEqual(found('hst'), [20580])
+        self.assertEqual(found('25544'), [25544, 25545])
+        self.assertEqual(found('2554'), [25545, 25544])
+        self.assertEqual(found('starlink 255'), [25545])
+        self.assertEqual(found('iss zar'), [25544])
+        self.assertEqual(found('-'), [])
+        self.assertEqual(found('nothing'), [])
+
+    def test_search_endpoint(self):
+        """
+        Tests whether the search endpoint finds satellites with and
+        without a snapshot.
+        """
+
+        for build in [False, True]:
+            if build:
+                version = snapshots.build_snapshots()
+            response = self.client.get('/satellite_app/search', {'q': 'is'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['satellites'],
+                             [{'catalog_number': 25544,
+                               'name': 'ISS (ZARYA)'}])
+        self.assertEqual(response['X-Dataset-Version'], str(version.version))
+
+        response = self.client.get('/satellite_app/search',
+                                   {'q': '20580', 'limit': 1})
+        self.assertEqual(response.json()['satellites'][0]['name'], 'HST')
+
+        # A snapshot of an older format has no binary catalogue, so the
+        # index is built from the database
+        snapshots.build_snapshots(force=True)
+        downgrade_snapshot()
+        response = self.client.get('/satellite_app/search', {'q': 'is'})
+        self.assertEqual(response.json()['satellites'],
+                         [{'catalog_number': 25544, 'name': 'ISS (ZARYA)'}])
+        response = self.client.get('/satellite_app/search',
+                                   {'q': 'iss', 'limit': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_catalog_endpoint(self):
+        """
+        Tests whether the binary catalogue holds the orbital
+        elements of the (filtered) satellites.
+        """
+
+        version = snapshots.build_snapshots()
+
+        response = self.client.get('/satellite_app/catalog')
+        self.assertEqual(response.status_code, 200)
+        header, records, names = binary_catalog.unpack(response.content)
+        self.assertEqual(header['dataset_version'], version.version)
+        self.assertEqual(names, [b'HST', b'ISS (ZARYA)'])
+
+        iss = records[1]
+        self.assertEqual(iss['catalog_number'], 25544)
+        self.assertAlmostEqual(float(iss['inclination']), 51.6395, places=4)
+        self.assertAlmostEqual(float(iss['mean_motion']), 15.50066683)
+        self.assertAlmostEqual(float(iss['bstar']), 0.35631e-3)
+        # 2024-06-24 12:25:40.104 UTC
+        self.assertAlmostEqual(float(iss['epoch']), 1719231940.104, places=2)
+        self.assertEqual(
+            int(iss['category_mask']),
+            MinorCategory.bit('Space Stations')
+            | MinorCategory.bit('Space and Earth Science'))
+
+        response = self.client.get(
+            '/satellite_app/catalog', {'filter': 'Space Stations'})
+        header, records, names = binary_catalog.unpack(response.content)
+        self.assertEqual(header['count'], 1)
+        self.assertEqual(names, [b'ISS (ZARYA)'])
+
+        # A snapshot of an older format has no binary catalogue, so the
+        # catalogue is built from the database
+        cache.clear()
+        downgrade_snapshot()
+        response = self.client.get('/satellite_app/catalog')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(binary_catalog.unpack(response.content)[2],
+                         [b'HST', b'ISS (ZARYA)'])
+
+    def test_changes_endpoint(self):
+        """
+        Tests whether the changes endpoint returns only the
+        differences since a version, or everything if it is too old.
+        """
+
+        first = snapshots.build_snapshots()
+
+        # Nothing changed, so there is no new version
+        self.assertEqual(snapshots.build_snapshots().version, first.version)
+
+        Satellite.objects.filter(pk=20580).update(name='HUBBLE')
+        Satellite.objects.filter(pk=25544).delete()
+        upsert_satellites([make_satellite(
+            ISS_TLE, satellite_catalog_number=99999, name='NEW')],
+            self.starlink)
+        second = snapshots.build_snapshots()
+
+        response = self.client.get(
+            '/satellite_app/changes', {'since': first.version})
+        response_json = json.loads(response.content)
+        self.assertEqual(response_json['version'], second.version)
+        self.assertFalse(response_json['full'])
+        self.assertEqual([sat['name'] for sat in response_json['added']],
+                         ['NEW'])
+        self.assertEqual([sat['name'] for sat in response_json['changed']],
+                         ['HUBBLE'])
+        self.assertEqual(response_json['removed'], [25544])
+
+        response = self.client.get(
+            '/satellite_app/changes', {'since': second.version})
+        response_json = json.loads(response.content)
+        self.assertEqual(response_json['added'], [])
+        self.assertEqual(response_json['changed'], [])
+        self.assertEqual(response_json['removed'], [])
+
+        response = self.client.get(
+            '/satellite_app/changes',
+            {'since': second.version - snapshots.KEEP_CHANGE_VERSIONS - 1})
+        response_json = json.loads(response.content)
+        self.assertTrue(response_json['full'])
+        self.assertEqual(len(response_json['satellites']), 2)
+
+        response = self.client.get('/satellite_app/changes')
+        self.assertEqual(response.status_code, 400)
+
+    def test_conditional_requests(self):
+        """
+        Tests whether the endpoints answer a request for a
+        version the client already has with a 304.
+        """
+
+        snapshots.build_snapshots()
+
+        for endpoint in ['/satellite_app/', '/satellite_app/categories',
+                         '/satellite_app/launch_years',
+                         '/satellite_app/countries',
+                         '/satellite_app/catalog']:
+            response = self.client.get(endpoint)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Last-Modified', response)
+
+            response = self.client.get(
+                endpoint, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+        etag = self.client.get('/satellite_app/')['ETag']
+        filtered_etag = self.client.get(
+            '/satellite_app/', {'filter': 'Space Stations'})['ETag']
+        self.assertNotEqual(etag, filtered_etag)
+
+        # A new version invalidates the ETag
+        Satellite.objects.filter(pk=20580).update(name='HUBBLE')
+        snapshots.build_snapshots()
+        response = self.client.get('/satellite_app/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        # and the cached response of the old version
+        self.assertIn('HUBBLE', [sat['name'] for sat in
+                                 response_json(response)['satellites']])
+
+    def test_compressed_responses(self):
+        """
+        Tests whether the endpoints are compressed
+        in the encoding the client asks for.
+        """
+
+        snapshots.build_snapshots()
+
+        for endpoint, params in [('/satellite_app/', {}),
+                                 ('/satellite_app/', {'filter': 'Science'}),
+                                 ('/satellite_app/catalog', {}),
+                                 ('/satellite_app/catalog',
+                                  {'filter': 'Science'}),
+                                 ('/satellite_app/changes', {'since': 0})]:
+            plain = self.client.get(endpoint, params)
+            self.assertNotIn('Content-Encoding', plain)
+            self.assertIn('Accept-Encoding', plain['Vary'])
+
+            for encoding in compression.ENCODINGS:
+                response = self.client.get(endpoint, params,
+                                           HTTP_ACCEPT_ENCODING=encoding)
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertNotEqual(response['ETag'], plain['ETag'])
+                self.assertEqual(
+                    decompress(response.content, encoding), plain.content)
+
+        # Unsupported encodings are not used
+        response = self.client.get('/satellite_app/',
+                                   HTTP_ACCEPT_ENCODING='compress, gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+
+        # Headers that negotiate the same encoding share a cached response
+        cache.clear()
+        cache_dir = os.path.join(settings.DATA_DIR, 'cache')
+        self.client.get('/satellite_app/', HTTP_ACCEPT_ENCODING='gzip')
+        cached = sorted(os.listdir(cache_dir))
+        response = self.client.get('/satellite_app/',
+                                   HTTP_ACCEPT_ENCODING='deflate, gzip;q=0.5')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(sorted(os.listdir(cache_dir)), cached)
+
+    def test_cache_follows_dataset_version(self):
+        """
+        Tests whether cached responses are shared, and replaced
+        as soon as a new dataset version is published.
+        """
+
+        snapshots.build_snapshots()
+        response = self.client.get('/satellite_app/countries')
+        self.assertEqual(response.json()['countries'], [''])
+        self.assertTrue(os.listdir(
+            os.path.join(settings.DATA_DIR, 'cache')))
+
+        # Until a new version is published, the cached response is served
+        assign_countries({25544: 'ISS', 20580: 'US'})
+        response = self.client.get('/satellite_app/countries')
+        self.assertEqual(response.json()['countries'], [''])
+
+        # Publishing a new version makes the cached response unreachable
+        cron.publish_dataset()
+        response = self.client.get('/satellite_app/countries')
+        self.assertEqual(sorted(response.json()['countries']), ['ISS', 'US'])
+
+
+class PropagationTestCase(TestCase):
+    """
+    Tests the batched propagation in propagation.py.
+    """
+
+    # 2024-06-25 12:00 UTC, shortly after the epochs of the TLEs
+    TIME = '2024-06-25T12:00:00'
+
+    def setUp(self):
+        use_temporary_data_dir(self)
+        self.stations = MinorCategory.objects.create(
+            minor_category=MinorCategory.MinorCategoryChoices.SPACE_STATIONS)
+        self.science = MinorCategory.objects.create(
+            minor_category=MinorCategory.MinorCategoryChoices.SPACE_AND_EARTH)
+        upsert_satellites([make_satellite(ISS_TLE)], self.stations)
+        upsert_satellites(
+            [make_satellite(ISS_TLE), make_satellite(HST_TLE)], self.science)
+
+    def test_propagation_matches_sgp4(self):
+        """
+        Tests whether the batched propagation and the conversion
+        to geodetic coordinates agree with plain SGP4.
+        """
+
+        propagator = propagation.Propagator.from_database()
+        self.assertEqual(propagator.catalog_numbers.tolist(), [20580, 25544])
+
+        timestamp = propagation.parse_time(self.TIME)
+        positions, velocities = propagator.propagate([timestamp])
+
+        jd, fraction = jday(2024, 6, 25, 12, 0, 0)
+        for index, tle in enumerate([HST_TLE, ISS_TLE]):
+            _, r, v = Satrec.twoline2rv(tle[1], tle[2]).sgp4(jd, fraction)
+            np.testing.assert_allclose(positions[index, 0], r, atol=1e-6)
+            np.testing.assert_allclose(velocities[index, 0], v, atol=1e-9)
+
+        self.assertAlmostEqual(
+            float(propagation.gmst(*propagation.julian_dates(timestamp))),
+            gstime(jd + fraction), places=8)
+
+        # Converting the geodetic coordinates back gives the positions
+        latitude, longitude, altitude, speed = propagator.geodetic(timestamp)
+        lat = np.radians(latitude[:, 0])
+        lng = np.radians(longitude[:, 0]) + gstime(jd + fraction)
+        c = 1 / np.sqrt(1 - propagation.ECCENTRICITY_SQUARED
+                        * np.sin(lat) ** 2)
+        radius = propagation.EARTH_RADIUS * c + altitude[:, 0]
+        np.testing.assert_allclose(
+            np.stack([radius * np.cos(lat) * np.cos(lng),
+                      radius * np.cos(lat) * np.sin(lng),
+                      (propagation.EARTH_RADIUS * c
+                       * (1 - propagation.ECCENTRICITY_SQUARED)
+                       + altitude[:, 0]) * np.sin(lat)], axis=-1),
+            positions[:, 0], atol=1e-3)
+
+        # The ISS flies at about 420 km and 7.66 km/s
+        self.assertTrue(380 < altitude[1, 0] < 460)
+        self.assertTrue(7.5 < speed[1, 0] < 7.8)
+        self.assertTrue(abs(latitude[1, 0]) <= 51.7)
+
+    def test_positions_endpoint(self):
+        """
+        Tests whether the positions endpoint returns the (filtered)
+        satellites in the layout of the web workers.
+        """
+
+        snapshots.build_snapshots()
+        timestamp = propagation.parse_time(self.TIME)
+        latitude, longitude, altitude, speed = (
+            propagation.Propagator.from_database().geodetic(timestamp))
+
+        response = self.client.get('/satellite_app/positions',
+                                   {'time': self.TIME})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Satellite-Count'], '2')
+        self.assertEqual(response['X-Dataset-Version'], '1')
+        buffer = np.frombuffer(response.content, dtype='<f4')
+        self.assertEqual(len(buffer), 2 * 4)
+        np.testing.assert_allclose(
+            buffer[:6].reshape(2, 3),
+            np.stack([latitude[:, 0], longitude[:, 0], altitude[:, 0]],
+                     axis=-1), rtol=1e-6)
+        np.testing.assert_allclose(buffer[6:], speed[:, 0], rtol=1e-6)
+
+        # Only the ISS is a space station
+        response = self.client.get(
+            '/satellite_app/positions',
+            {'time': self.TIME, 'filter': 'Space Stations'})
+        buffer = np.frombuffer(response.content, dtype='<f4')
+        self.assertEqual(response['X-Satellite-Count'], '1')
+        self.assertAlmostEqual(float(buffer[2]), altitude[1, 0], places=2)
+
+        # The categories may be separated by a comma and a space
+        response = self.client.get(
+            '/satellite_app/positions',
+            {'time': self.TIME, 'filter': 'Starlink, Space Stations'})
+        self.assertEqual(response['X-Satellite-Count'], '1')
+
+        response = self.client.get('/satellite_app/positions',
+                                   {'time': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_ephemeris_grid(self):
+        """
+        Tests whether the ephemeris grid, built by several
+        processes, holds the propagated positions.
+        """
+
+        snapshots.build_snapshots()
+        snapshot = snapshots.current()
+        start = propagation.parse_time(self.TIME)
+
+        with mock.patch.object(ephemeris, 'EPHEMERIS_CHUNK_SIZE', 1):
+            grid = ephemeris.build_ephemeris(
+                snapshot, start=start, step=600, duration=3600, workers=2)
+        self.assertEqual(grid.start, start)
+        self.assertEqual(grid.end, start + 3600)
+        self.assertEqual(grid.positions.shape, (2, 7, 3))
+
+        positions, _ = propagation.Propagator.from_database().propagate(
+            start + 600 * np.arange(7))
+        np.testing.assert_allclose(grid.positions, positions, rtol=1e-6)
+
+        # A newer grid replaces the old one
+        grid = ephemeris.build_ephemeris(
+            snapshot, start=start + 1200, step=600, duration=3600)
+        self.assertEqual(ephemeris.find(snapshot).start, start + 1200)
+        self.assertEqual(len([name for name in os.listdir(snapshot.path)
+                              if name.startswith('ephemeris-')]), 1)
+
+    def test_ephemeris_endpoint(self):
+        """
+        Tests whether the ephemeris endpoint serves the samples
+        of the requested satellites and time window.
+        """
+
+        snapshots.build_snapshots()
+        response = self.client.get('/satellite_app/ephemeris',
+                                   {'start': self.TIME})
+        self.assertEqual(response.status_code, 503)
+
+        start = propagation.parse_time(self.TIME)
+        grid = ephemeris.build_ephemeris(snapshots.current(), start=start,
+                                         step=600, duration=3600)
+
+        # The samples around the window are included
+        response = self.client.get('/satellite_app/ephemeris', {
+            'start': '2024-06-25T12:15:00', 'end': '2024-06-25T12:25:00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Satellite-Count'], '2')
+        self.assertEqual(response['X-Sample-Count'], '3')
+        self.assertEqual(response['X-Ephemeris-Start'], str(int(start) + 600))
+        self.assertEqual(response['X-Ephemeris-Step'], '600')
+        np.testing.assert_array_equal(
+            np.frombuffer(response.content, dtype='<f4').reshape(2, 3, 3),
+            grid.positions[:, 1:4])
+
+        response = self.client.get('/satellite_app/ephemeris', {
+            'start': self.TIME, 'satellites': '25544,1'})
+        self.assertEqual(response['X-Catalog-Numbers'], '25544')
+        np.testing.assert_array_equal(
+            np.frombuffer(response.content, dtype='<f4').reshape(1, 7, 3),
+            grid.positions[1:])
+
+        # A number that isn't in the grid doesn't repeat the row after it
+        response = self.client.get('/satellite_app/ephemeris', {
+            'start': self.TIME, 'satellites': '1,20580'})
+        self.assertEqual(response['X-Catalog-Numbers'], '20580')
+        self.assertEqual(grid.indices([1, 20580, 25544]).tolist(), [0, 1])
+
+        response = self.client.get('/satellite_app/ephemeris', {
+            'start': self.TIME, 'filter': 'Space Stations'})
+        self.assertEqual(response['X-Satellite-Count'], '1')
+        response = self.client.get('/satellite_app/ephemeris', {
+            'start': self.TIME, 'filter': 'Starlink, Space Stations'})
+        self.assertEqual(response['X-Satellite-Count'], '1')
+
+        response = self.client.get('/satellite_app/ephemeris',
+                                   {'start': '2024-06-27T12:00:00'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/satellite_app/ephemeris',
+                                   {'satellites': 'ISS'})
+        self.assertEqual(response.status_code, 400)
+
+        # The 7 samples of both satellites are too many, those of one
+        # satellite are not
+        with mock.patch.object(ephemeris, 'EPHEMERIS_MAX_SAMPLES', 13):
+            response = self.client.get('/satellite_app/ephemeris', {
+                'start': self.TIME, 'end': '2024-06-25T13:00:00'})
+            self.assertEqual(response.status_code, 400)
+            response = self.client.get('/satellite_app/ephemeris', {
+                'start': self.TIME, 'end': '2024-06-25T13:00:00',
+                'satellites': '25544'})
+            self.assertEqual(response.status_code, 200)
+
+    def test_track_endpoints(self):
+        """
+        Tests whether the track endpoints return the sampled
+        tracks of one or more satellites, and cache them.
+        """
+
+        snapshots.build_snapshots()
+        params = {'start': self.TIME, 'end': '2024-06-25T12:10:00',
+                  'step': 60}
+        timestamps = propagation.parse_time(self.TIME) + 60 * np.arange(10)
+        expected = propagation.Propagator.from_database().tracks(timestamps)
+
+        response = self.client.get('/satellite_app/25544/track', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Sample-Count'], '10')
+        self.assertEqual(response['X-Track-Step'], '60.0')
+        track = np.frombuffer(b''.join(response.streaming_content),
+                              dtype='<f4').reshape(10, 9)
+        np.testing.assert_array_equal(track, expected[1])
+
+        # The ground track matches the positions endpoint
+        positions = np.frombuffer(self.client.get(
+            '/satellite_app/positions',
+            {'time': self.TIME, 'filter': 'Space Stations'}).content,
+            dtype='<f4')
+        np.testing.assert_allclose(track[0, 6:9], positions[:3], rtol=1e-5)
+
+        # Cached tracks are reused for other combinations of satellites
+        with mock.patch.object(propagation.Propagator, 'tracks',
+                               autospec=True,
+                               side_effect=propagation.Propagator.tracks) \
+                as computed:
+            response = self.client.get(
+                '/satellite_app/tracks',
+                dict(params, satellites='25544,20580,1'))
+            self.assertEqual(response['X-Catalog-Numbers'], '20580,25544')
+            np.testing.assert_array_equal(
+                np.frombuffer(b''.join(response.streaming_content),
+                              dtype='<f4').reshape(2, 10, 9), expected)
+            self.assertEqual(len(computed.call_args.args[0]), 1)
+
+        self.assertEqual(self.client.get('/satellite_app/1/track',
+                                         params).status_code, 404)
+        self.assertEqual(self.client.get(
+            '/satellite_app/25544/track',
+            dict(params, step=0)).status_code, 400)
+        for step in ['1e-320', 'inf', 'nan']:
+            for window in [params, {'step': step}]:
+                self.assertEqual(self.client.get(
+                    '/satellite_app/25544/track',
+                    dict(window, step=step)).status_code, 400)
+        self.assertEqual(self.client.get(
+            '/satellite_app/tracks', params).status_code, 400)
+
+        # Tracks without a start begin at the start of the time bucket, of
+        # a minute or (if the step doesn't divide a minute) 9 steps
+        now = propagation.parse_time(self.TIME)
+        for step, offsets, start in [('', (5, 50), now),
+                                     ('7', (10, 60), now + 9)]:
+            for offset in offsets:
+                with mock.patch.object(propagation, 'parse_time',
+                                       return_value=now + offset):
+                    self.assertEqual(
+                        tracks.sample_times('', '', step)[0], start)
+
+    def test_uniform_grid(self):
+        """
+        Tests whether the queries of the spatial index give
+        the same results as comparing every point.
+        """
+
+        rng = np.random.default_rng(1)
+        points = rng.normal(size=(2000, 3)) * 7000
+        points[::50] = np.nan
+        grid = spatial.UniformGrid(points, cell_size=500)
+        valid = np.isfinite(points).all(axis=1)
+
+        for point in [points[1], points[2] + 100, [0, 0, 0],
+                      [50000, 0, 0]]:
+            distances = np.linalg.norm(points - point, axis=1)
+            distances[~valid] = np.inf
+
+            ids, found = grid.within(point, 1200)
+            self.assertEqual(sorted(ids.tolist()),
+                             np.flatnonzero(distances <= 1200).tolist())
+            self.assertTrue(np.all(np.diff(found) >= 0))
+
+            ids, found = grid.nearest(point, 15)
+            np.testing.assert_allclose(found, np.sort(distances)[:15])
+
+        self.assertEqual(len(grid.nearest(points[1], 5000)[0]),
+                         valid.sum())
+
+    def test_spatial_endpoints(self):
+        """
+        Tests whether the nearby and nearest endpoints find
+        the satellites around a point or a satellite.
+        """
+
+        snapshots.build_snapshots()
+        timestamp = propagation.parse_time(self.TIME)
+        positions = propagation.Propagator.from_database().ecef(timestamp)
+        distance = float(np.linalg.norm(positions[0] - positions[1]))
+
+        response = self.client.get('/satellite_app/nearest', {
+            'time': self.TIME, 'satellite': 25544})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['satellites'], [
+            {'catalog_number': 20580, 'distance': round(distance, 3)}])
+
+        response = self.client.get('/satellite_app/nearby', {
+            'time': self.TIME, 'satellite': 25544,
+            'radius': distance - 1})
+        self.assertEqual(response.json()['satellites'], [])
+
+        # Straight below the ISS
+        latitude, longitude, _, _ = (
+            propagation.Propagator.from_database().geodetic(timestamp))
+        params = {'time': self.TIME, 'lat': latitude[1, 0],
+                  'lng': longitude[1, 0], 'radius': 1000}
+        response = self.client.get('/satellite_app/nearby', params)
+        self.assertEqual(
+            [sat['catalog_number'] for sat in response.json()['satellites']],
+            [25544])
+        response = self.client.get('/satellite_app/nearest',
+                                   dict(params, k=2, filter='Space Stations'))
+        self.assertEqual(
+            [sat['catalog_number'] for sat in response.json()['satellites']],
+            [25544])
+        response = self.client.get(
+            '/satellite_app/nearest',
+            dict(params, k=2, filter='Starlink, Space Stations'))
+        self.assertEqual(
+            [sat['catalog_number'] for sat in response.json()['satellites']],
+            [25544])
+
+        # Later times in the same time bucket use the same index
+        with mock.patch.object(spatial, 'SpatialIndex') as build:
+            response = self.client.get('/satellite_app/nearest', {
+                'time': '2024-06-25T12:00:05', 'satellite': 25544})
+            build.assert_not_called()
+        self.assertEqual(response.json()['time'], '2024-06-25T12:00:00+00:00')
+        self.assertEqual(response.json()['satellites'], [
+            {'catalog_number': 20580, 'distance': round(distance, 3)}])
+
+        self.assertEqual(self.client.get('/satellite_app/nearest', {
+            'satellite': 1}).status_code, 404)
+        self.assertEqual(self.client.get('/satellite_app/nearby', {
+            'lat': 0, 'lng': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/satellite_app/nearest', {
+            'lat': 100, 'lng': 0}).status_code, 400)
+
+    def test_link_graph(self):
+        """
+        Tests whether the link graph links exactly the close
+        satellites, and whether its routes are the shortest.
+        """
+
+        # A ring of satellites where only neighbours are within range
+        angles = np.linspace(0, 2 * np.pi, 100, endpoint=False)
+        ring = np.stack([np.cos(angles), np.sin(angles),
+                         np.zeros(100)], axis=-1) * 7000
+        graph = links.LinkGraph(np.arange(100), ring, 0)
+        self.assertEqual(graph.link_count, 100)
+
+        rows, distance = graph.shortest_path(0, 70)
+        self.assertEqual(rows, [0] + list(range(99, 69, -1)))
+        self.assertAlmostEqual(distance, 30 * np.linalg.norm(
+            ring[0] - ring[1]), places=6)
+        self.assertEqual(graph.shortest_path(5, 5), ([5], 0.0))
+
+        # The links match comparing every pair, also with missing positions
+        rng = np.random.default_rng(2)
+        points = rng.normal(size=(500, 3)) * 3000
+        points[::25] = np.nan
+        first, second, _ = spatial.UniformGrid(points, 700).pairs(700)
+        found = set(zip(np.minimum(first, second).tolist(),
+                        np.maximum(first, second).tolist()))
+        distances = np.linalg.norm(points[:, None] - points[None], axis=-1)
+        expected = set(zip(*np.nonzero(np.triu(distances <= 700, k=1))))
+        self.assertEqual(found, {(int(a), int(b)) for a, b in expected})
+
+        # The satellite without a position isn't linked
+        graph = links.LinkGraph(np.arange(3), [[7000, 0, 0], [np.nan] * 3,
+                                               [7000, 600, 0]], 0)
+        self.assertIsNone(graph.shortest_path(1, 0))
+        self.assertEqual(graph.nearest([7000, 700, 0]), 2)
+
+    def test_route_endpoint(self):
+        """
+        Tests whether the route endpoint finds the
+        route between satellites or points.
+        """
+
+        snapshots.build_snapshots()
+
+        response = self.client.get('/satellite_app/route', {
+            'time': self.TIME, 'from_satellite': 25544,
+            'to_satellite': 25544})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['distance'], 0)
+        self.assertEqual(
+            [sat['catalog_number'] for sat in response.json()['path']],
+            [25544])
+        response = self.client.get('/satellite_app/route', {
+            'time': self.TIME, 'from_satellite': 25544,
+            'to_satellite': 25544, 'filter': 'Starlink, Space Stations'})
+        self.assertEqual(response.status_code, 200)
+
+        # A point straight below the ISS is routed from the ISS
+        latitude, longitude, altitude, _ = (
+            propagation.Propagator.from_database().geodetic(
+                propagation.parse_time(self.TIME)))
+        response = self.client.get('/satellite_app/route', {
+            'time': self.TIME, 'from_lat': latitude[1, 0],
+            'from_lng': longitude[1, 0], 'to_satellite': 25544})
+        path = response.json()['path']
+        self.assertEqual([sat['catalog_number'] for sat in path], [25544])
+        self.assertAlmostEqual(path[0]['alt'], altitude[1, 0], places=2)
+
+        # The ISS and the HST are thousands of km apart
+        response = self.client.get('/satellite_app/route', {
+            'time': self.TIME, 'from_satellite': 25544,
+            'to_satellite': 20580})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/satellite_app/route', {
+            'time': self.TIME, 'from_satellite': 20580,
+            'to_satellite': 25544, 'filter': 'Space Stations'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/satellite_app/route', {
+            'from_satellite': 25544})
+        self.assertEqual(response.status_code, 400)
+
+    def test_pass_prediction(self):
+        """
+        Tests whether the predicted passes agree with a
+        fine scan of the elevations.
+        """
+
+        propagator = propagation.Propagator.from_database()
+        start = propagation.parse_time(self.TIME)
+        end = start + 86400
+        found = [item for item in passes.predict_passes(
+            propagator, 52.0, 4.9, 0.0, start, end, 10.0)
+            if item['rise'] is not None and item['set'] is not None]
+
+        # Scan the elevations of both satellites every second
+        observer, up = passes.observer_frame(52.0, 4.9, 0.0)
+        times = np.arange(start, end, 1.0)
+        positions, _ = propagator.propagate(times)
+        heights = passes.elevations(positions, times, observer, up)
+        expected = []
+        for row, number in enumerate(propagator.catalog_numbers.tolist()):
+            above = heights[row] >= 10.0
+            rises = np.flatnonzero(~above[:-1] & above[1:]) + 1
+            sets = np.flatnonzero(above[:-1] & ~above[1:])
+            if above[0]:
+                sets = sets[1:]
+            expected += [(number, times[rise], times[set_],
+                          heights[row, rise:set_ + 1].max())
+                         for rise, set_ in zip(rises, sets)]
+        expected.sort(key=lambda item: item[1])
+
+        # The ISS passes over a few times a day
+        self.assertTrue(len(expected) >= 3)
+        self.assertEqual(len(found), len(expected))
+        for item, (number, rise, set_, highest) in zip(found, expected):
+            self.assertEqual(item['catalog_number'], number)
+            self.assertAlmostEqual(item['rise'], rise, delta=2)
+            self.assertAlmostEqual(item['set'], set_, delta=2)
+            self.assertTrue(item['rise'] < item['culmination'] < item['set'])
+            self.assertAlmostEqual(item['max_elevation'], highest, delta=0.05)
+
+    def test_passes_endpoint(self):
+        """
+        Tests whether the passes endpoint serves the passes
+        of the selected satellites, and caches them.
+        """
+
+        snapshots.build_snapshots()
+        parameters = {'lat': 52.0, 'lng': 4.9, 'start': self.TIME,
+                      'days': 2}
+
+        response = self.client.get('/satellite_app/passes', dict(
+            parameters, satellites='25544'))
+        self.assertEqual(response.status_code, 200)
+        found = response.json()['passes']
+        self.assertTrue(len(found) >= 6)
+        self.assertEqual({item['catalog_number'] for item in found}, {25544})
+        rises = [propagation.parse_time(item['rise']) for item in found
+                 if item['rise'] is not None]
+        self.assertEqual(rises, sorted(rises))
+        self.assertTrue(all(0 <= rise - propagation.parse_time(self.TIME)
+                            <= 2 * 86400 for rise in rises))
+
+        # The filter selects the satellites of its categories, and the
+        # passes of a location in the same grid cell come from the cache
+        response = self.client.get('/satellite_app/passes', dict(
+            parameters, filter='Space Stations'))
+        self.assertEqual(response.json()['passes'], found)
+        with mock.patch.object(passes, 'predict_passes') as predict:
+            response = self.client.get('/satellite_app/passes', dict(
+                parameters, lat=52.01, filter='Space Stations'))
+            predict.assert_not_called()
+        self.assertEqual(response.json()['passes'], found)
+        response = self.client.get('/satellite_app/passes', dict(
+            parameters, filter='Starlink, Space Stations'))
+        self.assertEqual(response.json()['passes'], found)
+
+        # Both satellites for two days are too many, one satellite is not
+        with mock.patch.object(passes, 'PASS_MAX_SATELLITE_DAYS', 3):
+            response = self.client.get('/satellite_app/passes', parameters)
+            self.assertEqual(response.status_code, 400)
+            response = self.client.get('/satellite_app/passes', dict(
+                parameters, filter='Space Stations'))
+            self.assertEqual(response.status_code, 200)
+
+        for bad in [{'lat': 100}, {'days': 11}, {'start': 'yesterday'},
+                    {'satellites': 'ISS'}]:
+            response = self.client.get('/satellite_app/passes',
+                                       dict(parameters, **bad))
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get('/satellite_app/passes', {'lng': 4.9})
+        self.assertEqual(response.status_code, 400)
+
+    def test_passes_without_crossings(self):
+        """
+        Tests whether satellites that are visible the whole time
+        or never are handled, like a geostationary one.
+        """
+
+        upsert_satellites([make_satellite(GEO_TLE)], self.science)
+        snapshots.build_snapshots()
+        parameters = {'lat': 0.0, 'start': self.TIME, 'days': 1,
+                      'satellites': '41866'}
+
+        # Right below the satellite, its only pass lasts the whole window
+        response = self.client.get('/satellite_app/passes',
+                                   dict(parameters, lng=88.2))
+        self.assertEqual(response.status_code, 200)
+        found, = response.json()['passes']
+        self.assertEqual((found['catalog_number'], found['rise'],
+                          found['set']), (41866, None, None))
+        self.assertTrue(found['max_elevation'] > 80)
+
+        # On the other side of the earth, it never rises
+        response = self.client.get('/satellite_app/passes',
+                                   dict(parameters, lng=-91.8))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['passes'], [])
+
+
+class ConjunctionTestCase(TestCase):
+    """
+    Tests the conjunction screening in conjunctions.py.
+    """
+
+    # Shortly after the epochs of the TLEs
+    START = '2024-06-24T12:30:00'
+
+    def setUp(self):
+        use_temporary_data_dir(self)
+        self.stations = MinorCategory.objects.create(
+            minor_category=MinorCategory.MinorCategoryChoices.SPACE_STATIONS)
+        upsert_satellites([make_satellite(tle) for tle in
+                           [ISS_TLE, HST_TLE, CROSSING_TLE]], self.stations)
+
+    def test_screening_finds_approaches(self):
+        """
+        Tests whether the screening finds the same close
+        approaches as comparing the satellites every second.
+        """
+
+        tles = [HST_TLE, ISS_TLE, CROSSING_TLE]
+        catalog_numbers = [int(tle[1][2:7]) for tle in tles]
+        lines = [tle[1:] for tle in tles]
+        start = propagation.parse_time(self.START)
+        found = conjunctions.screen(catalog_numbers, lines, start,
+                                    duration=3 * 3600, distance=20.0,
+                                    workers=1)
+
+        # The closest approaches of every pair, every second
+        propagator = propagation.Propagator(catalog_numbers, lines,
+                                            [0] * len(lines))
+        times = start + np.arange(3 * 3600 + 1.0)
+        positions, _ = propagator.propagate(times)
+        expected = []
+        for first in range(len(tles)):
+            for second in range(first + 1, len(tles)):
+                distances = np.linalg.norm(
+                    positions[second] - positions[first], axis=1)
+                minima = np.flatnonzero(
+                    (distances[1:-1] <= distances[:-2])
+                    & (distances[1:-1] <= distances[2:])
+                    & (distances[1:-1] <= 20.0)) + 1
+                expected += [(catalog_numbers[first], catalog_numbers[second],
+                              times[index], distances[index])
+                             for index in minima]
+        expected.sort(key=lambda approach: approach[2])
+
+        # The ISS and the crossing satellite meet at every crossing, a
+        # bit further apart every time
+        self.assertEqual(len(expected), 3)
+        self.assertEqual(len(found), len(expected))
+        for conjunction, approach in zip(found, expected):
+            self.assertEqual(conjunction[:2], approach[:2])
+            self.assertAlmostEqual(conjunction[2], approach[2], delta=1)
+            self.assertAlmostEqual(conjunction[3], approach[3], delta=0.05)
+            self.assertTrue(conjunction[3] <= approach[3])
+            self.assertTrue(1.0 < conjunction[4] < 1.3)
+
+    def test_conjunctions_endpoint(self):
+        """
+        Tests whether screened conjunctions are stored by the
+        command and served by the conjunctions endpoint.
+        """
+
+        snapshots.build_snapshots()
+        call_command('screen_conjunctions', start=self.START, hours=1,
+                     distance=5.0, workers=2, stdout=io.StringIO())
+        self.assertEqual(Conjunction.objects.count(), 1)
+
+        response = self.client.get('/satellite_app/conjunctions')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Dataset-Version'],
+                         str(snapshots.current_version()))
+        conjunction, = response.json()['conjunctions']
+        self.assertEqual((conjunction['first_catalog_number'],
+                          conjunction['second_catalog_number']),
+                         (25544, 99001))
+        self.assertTrue(conjunction['distance'] < 1.0)
+
+        for parameters, count in [({'satellite': 99001}, 1),
+                                  ({'satellite': 20580}, 0),
+                                  ({'max_distance': 0.5}, 0),
+                                  ({'start': '2024-06-24T13:00:00'}, 0),
+                                  ({'end': '2024-06-24T13:00:00'}, 1)]:
+            response = self.client.get('/satellite_app/conjunctions',
+                                       parameters)
+            self.assertEqual(len(response.json()['conjunctions']), count)
+
+        # A new screening replaces the conjunctions
+        call_command('screen_conjunctions', start='2024-06-24T14:00:00',
+                     hours=0.5, workers=1, stdout=io.StringIO())
+        self.assertEqual(Conjunction.objects.count(), 0)
+
+        for bad in [{'satellite': 'ISS'}, {'limit': 0}, {'start': 'now'}]:
+            response = self.client.get('/satellite_app/conjunctions', bad)
+            self.assertEqual(response.status_code, 400)
+
+
+# The modules that a web worker must never import (see ingest/__init__.py)
+INGESTION_MODULES = ('satellite_app.cron', 'satellite_app.ingest')
+
+# Largest time (in seconds) that a web worker may spend on importing the
+# backend, as measured by 'python -X importtime'
+WEB_IMPORT_TIME_BUDGET = 2.0
+
+
+class StartupTestCase(SimpleTestCase):
+    """
+    Tests the startup of the web process.
+    """
+
+    def test_web_imports(self):
+        """
+        Tests whether a web worker starts without importing the
+        ingestion code, and within the import time budget.
+        """
+
+        # A fresh interpreter imports what a web worker does: the WSGI
+        # application, and the URLconf on the first request
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             'import pse_backend.wsgi, ' + settings.ROOT_URLCONF],
+            cwd=settings.BASE_DIR, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+        # Every line is 'import time: <self> | <cumulative> | <module>',
+        # where the module is indented by its depth
+        imports = [line.split('|') for line in result.stderr.splitlines()
+                   if line.startswith('import time:') and 'self' not in line]
+        modules = [module.strip() for _, _, module in imports]
+        self.assertFalse(
+            [module for module in modules
+             if module.startswith(INGESTION_MODULES)])
+
+        total = sum(int(cumulative) for _, cumulative, module in imports
+                    if not module.startswith('  '))
+        self.assertLess(total / 1e6, WEB_IMPORT_TIME_BUDGET)
@@ -0,0 +1,197 @@
+"""
+File description:
+Contains helpers for reading the numeric orbital elements directly from the
+fixed columns of a TLE, without building any intermediate objects. See
+https://celestrak.org/columns/v04n03/ for the format.
+
+It also contains the parser of the ingest path (see 'parse_tles'), which
+reads the TLEs of a whole Celestrak response into light records, checking
+the checksum of every line. Catalog numbers can be in the classic 5 digit
+format or in the Alpha-5 format, in which the first digit is replaced by a
+letter for the numbers 100000 to 339999.
+"""
+
+import calendar
+
+
+# The letters of the first character of an Alpha-5 catalog number, from 10
+# onwards. 'I' and 'O' are skipped, since they look like digits.
+ALPHA5_LETTERS = 'ABCDEFGHJKLMNPQRSTUVWXYZ'
+
+# Two-digit years from this one onwards are in the 20th century, the rest in
+# the 21st. Nothing was launched before 1957.
+CENTURY_PIVOT = 57
+
+# The launch year of satellites without an international designator
+UNKNOWN_LAUNCH_YEAR = -1
+
+# Length of a line of a TLE
+LINE_LENGTH = 69
+
+# The value of every character in the checksum of a line (see 'checksum')
+_CHECKSUM_VALUES = bytes(ord(char) - ord('0') if '0' <= char <= '9'
+                         else 1 if char == '-' else 0
+                         for char in map(chr, range(256)))
+
+
+def _implied_decimal(field):
+    """
+    Parses a field in the TLE 'implied decimal point' notation, such as
+    ' 35631-3' (meaning 0.35631e-3).
+    """
+    field = field.strip()
+    if not field:
+        return 0.0
+    sign = -1.0 if field[0] == '-' else 1.0
+    field = field.lstrip('+-')
+    mantissa, exponent = field[:-2], field[-2:]
+    return sign * float('0.' + mantissa) * 10.0 ** int(exponent)
+
+
+def epoch_year(line1):
+    """
+    Returns the full year of the epoch of a TLE.
+    """
+    return full_year(int(line1[18:20]))
+
+
+def full_year(year):
+    """
+    Returns the full year of a two-digit year of a TLE.
+    """
+    return year + (1900 if year >= CENTURY_PIVOT else 2000)
+
+
+def epoch_timestamp(line1):
+    """
+    Returns the epoch of a TLE as a Unix timestamp (in seconds).
+    """
+    day = float(line1[20:32])
+    start_of_year = calendar.timegm((epoch_year(line1), 1, 1, 0, 0, 0))
+    return start_of_year + (day - 1.0) * 86400.0
+
+
+def elements(line1, line2):
+    """
+    Returns the numeric orbital elements of a TLE as a dict. Angles are
+    in degrees and the mean motion is in revolutions per day.
+    """
+    return {
+        'epoch': epoch_timestamp(line1),
+        'bstar': _implied_decimal(line1[53:61]),
+        'inclination': float(line2[8:16]),
+        'raan': float(line2[17:25]),
+        'eccentricity': float('0.' + line2[26:33].strip()),
+        'arg_perigee': float(line2[34:42]),
+        'mean_anomaly': float(line2[43:51]),
+        'mean_motion': float(line2[52:63]),
+    }
+
+
+def checksum(line):
+    """
+    Returns the checksum of a line of a TLE: the sum of the digits in its
+    first 68 columns, with every minus sign counting as 1, modulo 10.
+    """
+    # Characters that are not ASCII count as 0, like letters
+    return sum(line[:LINE_LENGTH - 1].encode('ascii', 'replace').translate(
+        _CHECKSUM_VALUES)) % 10
+
+
+def catalog_number(field):
+    """
+    Returns the catalog number in the 5 columns of a TLE that hold it,
+    in the classic or in the Alpha-5 format.
+    """
+    first = field[:1]
+    if first.isalpha():
+        if first not in ALPHA5_LETTERS or not field[1:].isdigit():
+            raise ValueError("Invalid Alpha-5 catalog number '" + field + "'")
+        return (ALPHA5_LETTERS.index(first) + 10) * 10000 + int(field[1:])
+    return int(field)
+
+
+def launch_year(line1):
+    """
+    Returns the launch year in the international designator of a TLE,
+    or UNKNOWN_LAUNCH_YEAR if it has none.
+    """
+    year = line1[9:11].strip()
+    if not year:
+        return UNKNOWN_LAUNCH_YEAR
+    return full_year(int(year))
+
+
+class TLERecord:
+    """
+    The fields of a TLE that are stored by the ingest. The epoch is a
+    year and a (1-based, fractional) day of that year, and the mean motion
+    is in revolutions per day.
+    """
+    __slots__ = ('name', 'line1', 'line2', 'catalog_number',
+                 'classification', 'launch_year', 'epoch_year', 'epoch_day',
+                 'mean_motion', 'revolutions')
+
+    def __init__(self, name, line1, line2):
+        self.name = name
+        self.line1 = line1
+        self.line2 = line2
+        self.catalog_number = catalog_number(line1[2:7])
+        self.classification = line1[7]
+        self.launch_year = launch_year(line1)
+        self.epoch_year = epoch_year(line1)
+        self.epoch_day = float(line1[20:32])
+        self.mean_motion = float(line2[52:63])
+        self.revolutions = int(line2[63:68].strip() or 0)
+
+
+def parse_tle(name, line1, line2):
+    """
+    Parses a single TLE into a 'TLERecord'. Raises a ValueError if the
+    lines are not a valid TLE.
+    """
+    if len(line1) != LINE_LENGTH or len(line2) != LINE_LENGTH:
+        raise ValueError('The lines must have ' + str(LINE_LENGTH)
+                         + ' characters')
+    if line1[0] != '1' or line2[0] != '2':
+        raise ValueError('The lines must start with 1 and 2')
+    for number, line in enumerate([line1, line2], 1):
+        if line[-1] != str(checksum(line)):
+            raise ValueError('Wrong checksum on line ' + str(number))
+    if line1[2:7] != line2[2:7]:
+        raise ValueError('The catalog numbers of the lines differ')
+
+    # Names of the 3LE format of Space-Track start with '0 '
+    if name.startswith('0 '):
+        name = name[2:]
+    return TLERecord(name.strip(), line1, line2)
+
+
+def parse_tles(text):
+    """
+    Parses all TLEs in a text, like the body of a Celestrak response, with
+    or without a name line before every TLE. Returns the parsed records and
+    a list of (name, error message) pairs of the TLEs that are invalid.
+    """
+    lines = [line.strip() for line in text.splitlines()]
+    records = []
+    errors = []
+
+    name = ''
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        if (line.startswith('1 ') and index + 1 < len(lines)
+                and lines[index + 1].startswith('2 ')):
+            try:
+                records.append(parse_tle(name, line, lines[index + 1]))
+            except ValueError as e:
+                errors.append((name, str(e)))
+            name = ''
+            index += 2
+        else:
+            if line:
+                name = line
+            index += 1
+
+    return records, errors
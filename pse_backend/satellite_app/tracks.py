@@ -0,0 +1,106 @@
+"""
+File description:
+Contains the orbit paths and ground tracks of the 'track' endpoints. The
+track of a satellite is sampled at a fixed step over a time window, with all
+requested satellites and samples propagated in a single call (see
+'Propagator.tracks'). Every track is kept in the shared cache per satellite,
+dataset version and window, so a track only has to be computed once per
+dataset version, no matter by which worker or in which combination of
+satellites it is requested.
+
+A track consists of 9 little-endian 32-bit floats per sample: the TEME
+position (x, y, z in km), the Earth-fixed position (x, y, z in km) and the
+latitude, longitude (degrees) and altitude (km).
+"""
+
+import numpy as np
+from django.core.cache import cache
+
+from satellite_app import propagation
+
+
+# Default step (in seconds) and length (in samples) of a track, like the
+# orbits drawn by the frontend (see Orbit.ts)
+DEFAULT_TRACK_STEP = 1
+DEFAULT_TRACK_SAMPLES = 10000
+
+# Maximum number of samples of all satellites in a single request
+TRACK_MAX_SAMPLES = 1_000_000
+
+# Length of a time bucket (in seconds, at least a whole number of steps).
+# Tracks without a start begin at the start of the current bucket, so that
+# the requests of that time share their cached tracks.
+TRACK_TIME_BUCKET = 60
+
+
+def sample_times(start, end, step):
+    """
+    Returns the Unix timestamps at which a track from 'start' up to (but
+    not including) 'end' is sampled. When no start is given, the track
+    starts at the start of the current time bucket (see
+    'TRACK_TIME_BUCKET'), so that tracks requested around the same time
+    are the same. When no end is given, the track
+    has the default number of samples. Raises a ValueError for an empty
+    or too long window.
+    """
+    step = float(step) if step else DEFAULT_TRACK_STEP
+    if not step > 0:
+        raise ValueError('The step must be positive')
+
+    bucket = np.ceil(TRACK_TIME_BUCKET / step) * step
+    start = (propagation.parse_time(start) if start
+             else propagation.parse_time('') // bucket * bucket)
+    end = (propagation.parse_time(end) if end
+           else start + DEFAULT_TRACK_SAMPLES * step)
+
+    # Checked before the conversion, as a tiny step gives an infinite count
+    count = np.ceil((end - start) / step)
+    if not 1 <= count <= TRACK_MAX_SAMPLES:
+        raise ValueError('A track has between 1 and '
+                         + str(TRACK_MAX_SAMPLES) + ' samples')
+    return start + step * np.arange(int(count))
+
+
+def cache_key(version, catalog_number, timestamps):
+    """
+    Returns the cache key of the track of a satellite in a dataset version.
+    """
+    step = timestamps[1] - timestamps[0] if len(timestamps) > 1 else 0
+    return ('track-v' + str(version) + '-' + str(catalog_number) + '-'
+            + repr(float(timestamps[0])) + '-' + repr(float(step)) + '-'
+            + str(len(timestamps)))
+
+
+def compute_tracks(propagator, version, catalog_numbers, timestamps,
+                   timeout):
+    """
+    Returns the catalog numbers (in order) of the satellites of
+    'catalog_numbers' that exist in 'propagator', and a dict with the packed
+    track of every one of them. Tracks are taken from the cache when they
+    were computed before for the same dataset version; the others are
+    computed together and cached for 'timeout' seconds. Nothing is cached
+    when 'version' is None, since the data isn't versioned then.
+    """
+    selected = propagator.select(catalog_numbers)
+    found = selected.catalog_numbers.tolist()
+
+    keys = {number: cache_key(version, number, timestamps)
+            for number in found}
+    tracks = {}
+    if version is not None:
+        cached = cache.get_many(list(keys.values()))
+        tracks = {number: cached[key] for number, key in keys.items()
+                  if key in cached}
+
+    missing = [number for number in found if number not in tracks]
+    if missing:
+        computed = selected.select(missing).tracks(timestamps)
+        new_tracks = {number: computed[index].tobytes()
+                      for index, number in enumerate(missing)}
+        if version is not None:
+            cache.set_many({keys[number]: track
+                            for number, track in new_tracks.items()},
+                           timeout)
+        tracks.update(new_tracks)
+
+    return found, tracks
@@ -7,4 +7,17 @@ urlpatterns = [
     path("categories", views.categories, name="categories"),
     path("launch_years", views.launch_years, name="launch_years"),
     path("countries", views.countries, name="countries"),
+    path("meta", views.meta, name="meta"),
+    path("catalog", views.catalog, name="catalog"),
+    path("changes", views.changes, name="changes"),
+    path("positions", views.positions, name="positions"),
+    path("ephemeris", views.ephemeris_range, name="ephemeris"),
+    path("<int:catalog_number>/track", views.track, name="track"),
+    path("tracks", views.multiple_tracks, name="tracks"),
+    path("nearby", views.nearby, name="nearby"),
+    path("nearest", views.nearest, name="nearest"),
+    path("route", views.route, name="route"),
+    path("passes", views.satellite_passes, name="passes"),
+    path("conjunctions", views.conjunctions, name="conjunctions"),
+    path("search", views.satellite_search, name="search"),
 ]
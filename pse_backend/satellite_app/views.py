@@ -6,17 +6,53 @@ The endpoints are as follows:
 - categories: Endpoint for fetching all satellite categories.
 - launch_years: Endpoint for fetching all known launch years of the satellites.
 - countries: Endpoint for fetching all known countries/affiliations of the satellites.
+- meta: Endpoint for fetching the number of satellites per category, country,
+    launch year and classification.
+- catalog: Endpoint for fetching the satellites in a packed binary format.
+- changes: Endpoint for fetching the satellites that changed since a given
+    dataset version.
+- positions: Endpoint for fetching the positions and speeds of the
+    satellites at a given time.
+- ephemeris_range: Endpoint for fetching the precomputed positions of the
+    satellites over a time window.
+- track: Endpoint for fetching the orbit path and ground track of a
+    satellite.
+- multiple_tracks: Endpoint for fetching the orbit paths and ground tracks
+    of several satellites.
+- nearby: Endpoint for fetching the satellites within a distance of a point
+    or a satellite.
+- nearest: Endpoint for fetching the satellites nearest to a point or a
+    satellite.
+- route: Endpoint for fetching the shortest route over links between
+    satellites.
+- satellite_passes: Endpoint for fetching the passes of satellites over a
+    location.
+- conjunctions: Endpoint for fetching the close approaches between
+    satellites found by the last screening.
+- search: Endpoint for finding satellites by name or catalog number.
 """
 
+import hashlib
 import logging
 import os
+from datetime import datetime, timezone
+from functools import wraps
+from urllib.parse import urlencode
 
-from django.http import HttpResponse, HttpRequest, JsonResponse
+import numpy as np
 
-from satellite_app.cron import pull_communications_satellites
-from satellite_app.models import Satellite, MinorCategory
+from django.db.models import Q
+from django.http import (HttpResponse, HttpRequest, JsonResponse,
+                         StreamingHttpResponse)
 
+from satellite_app.models import Satellite, MinorCategory, Conjunction
+from satellite_app import (snapshots, binary_catalog, compression, facets,
+                           filters, propagation, ephemeris, tracks, spatial,
+                           links, passes, search)
+
+from django.utils.cache import patch_vary_headers
 from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
 
 from rest_framework.decorators import api_view
 
@@ -40,34 +76,133 @@ STANDARD_CACHING_LENGTH = int(os.getenv(
     DEFAULT_STANDARD_CACHING_LENGTH))
 
 
-def serializedSatellites(satellites):
+def dataset_etag(request: HttpRequest, *args, **kwargs):
+    """
+    Returns a strong ETag for a request, derived from the current dataset
+    version, the endpoint and the query parameters. Returns None when no
+    dataset version was published yet.
+    """
+    version = snapshots.current_version()
+    if version is None:
+        return None
+
+    params = urlencode(sorted(request.GET.lists()), doseq=True)
+    digest = hashlib.sha256(
+        (request.path + '?' + params).encode('utf-8')).hexdigest()
+    return 'v' + str(version) + '-' + digest[:16]
+
+
+def dataset_last_modified(request: HttpRequest, *args, **kwargs):
+    """
+    Returns the time at which the current dataset version was published,
+    or None when no dataset version was published yet.
+    """
+    snapshot = snapshots.current()
+    if snapshot is None:
+        return None
+    return datetime.fromisoformat(snapshot.created_at)
+
+
+def encoded_dataset_etag(request: HttpRequest, *args, **kwargs):
+    """
+    Returns the ETag of a request to an endpoint that compresses its
+    responses. Every encoding gets its own ETag, since the bytes differ.
+    """
+    etag = dataset_etag(request)
+    encoding = request_encoding(request)
+    if etag is not None and encoding is not None:
+        etag += '-' + encoding
+    return etag
+
+
+def request_encoding(request: HttpRequest):
+    """
+    Returns the encoding in which the response to a
+    request should be compressed, or None.
+    """
+    return compression.negotiate(request.headers.get('Accept-Encoding', ''))
+
+
+def category_filter(request: HttpRequest):
+    """
+    Returns the category names in the 'filter' parameter of a request,
+    stripped of the whitespace around them.
+    """
+    return [element.strip()
+            for element in request.GET.get('filter', '').split(',')]
+
+
+def encoded_response(body, encoding, content_type, snapshot):
+    """
+    Returns a response for a body that was compressed with 'encoding'
+    (or not at all, if it is None) and built from 'snapshot'.
+    """
+    response = HttpResponse(
+        body,
+        content_type=content_type,
+        headers={'X-Dataset-Version': str(snapshot.version)})
+    if encoding is not None:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def dataset_cache_page(timeout):
     """
-    Transforms a given list of satellites
-    into JSON format.
+    Caches the responses of a view like 'cache_page', but in a namespace of
+    the current dataset version. Responses of older versions are never
+    served again once a new version is published, no matter their timeout.
+    Responses that vary on 'Accept-Encoding' are cached once per negotiated
+    encoding rather than once per value of the header.
     """
-    return [{'name': sat.name,
-            'line1': sat.line1,
-             'line2': sat.line2,
-             'catalog_number': sat.satellite_catalog_number,
-             'launch_year': sat.launch_year,
-             'epoch_year': sat.epoch_year,
-             'epoch': sat.epoch,
-             'revolutions': sat.revolutions,
-             'revolutions_per_day': sat.revolutions_per_day,
-             'country': sat.country,
-             'categories': [cat.minor_category for
-                            cat in sat.minor_categories.all()],
-             'classification': sat.classification,
-             } for sat in satellites]
+    def decorator(view):
+        # One cached view per dataset version
+        cached_views = {}
+
+        @wraps(view)
+        def wrapper(request: HttpRequest, *args, **kwargs):
+            encoding = request_encoding(request)
+            if encoding is None:
+                request.META.pop('HTTP_ACCEPT_ENCODING', None)
+            else:
+                request.META['HTTP_ACCEPT_ENCODING'] = encoding
+
+            key_prefix = 'dataset-v' + str(snapshots.current_version())
+            cached_view = cached_views.get(key_prefix)
+            if cached_view is None:
+                cached_view = cache_page(timeout, key_prefix=key_prefix)(view)
+                cached_views.clear()
+                cached_views[key_prefix] = cached_view
+            return cached_view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
 
+# Answers 'If-None-Match'/'If-Modified-Since' with a 304 before the view
+# (or the cache) is touched, and adds the ETag and Last-Modified headers
+dataset_condition = condition(etag_func=dataset_etag,
+                              last_modified_func=dataset_last_modified)
+encoded_dataset_condition = condition(
+    etag_func=encoded_dataset_etag,
+    last_modified_func=dataset_last_modified)
 
-@cache_page(SATELLITES_CACHING_LENGTH)
+
+@encoded_dataset_condition
+@dataset_cache_page(SATELLITES_CACHING_LENGTH)
 @api_view(['GET'])
 def index(request: HttpRequest):
     """
     Main filter endpoint. This endpoint lets the caller retrieve a number
     of satellites with optional parameter 'filter' which filters
-    satellites on specific categories.
+    satellites on specific categories. With 'match=all', only the satellites
+    in all of the categories are kept. The satellites can also be filtered
+    on their country, classification, launch year and the age of their
+    TLE (see filters.py). The satellites can be paged through
+    by catalog number with the 'after' and 'limit' parameters, and the
+    'fields' parameter selects the fields of every satellite. The response
+    is served from the prebuilt (and precompressed) snapshot of the newest
+    dataset version when there is one and all fields are wanted.
+    Otherwise, it is streamed from the database in chunks.
     """
     # Retrieve the query parameters
     query_params = request.GET
@@ -78,26 +213,71 @@ def index(request: HttpRequest):
 
     # Logging
     views_logger.info("Endpoint 'index' was called with filter elements "
-                      + str(filter_elements) + ".")
+                      + str(filter_elements) + " and parameters "
+                      + str(dict(query_params.items())) + ".")
 
-    # Retrieve the category objects corresponding to the enum values
-    categories = MinorCategory.objects.filter(
-        minor_category__in=filter_elements)
+    try:
+        after = (int(query_params['after']) if query_params.get('after')
+                 else None)
+        limit = (int(query_params['limit']) if query_params.get('limit')
+                 else None)
+        if limit is not None and limit < 1:
+            raise ValueError
+    except ValueError:
+        return JsonResponse(
+            {'error': "Parameters 'after' and 'limit' must be a catalog"
+                      " number and a positive number."},
+            status=400)
 
-    # By default, all satellites will be retrieved. Otherwise,
-    # the filter will be applied.
-    if len(categories) == 0:
-        sats = Satellite.objects.prefetch_related("minor_categories").all()
-    else:
-        sats = Satellite.objects.prefetch_related(
-            "minor_categories").filter(minor_categories__in=categories)
+    try:
+        satellite_filter = filters.parse_filter(query_params)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    fields = None
+    if query_params.get('fields'):
+        fields = set(field.strip()
+                     for field in query_params['fields'].split(','))
+        unknown = fields.difference(snapshots.SERIALIZED_FIELDS)
+        if unknown:
+            return JsonResponse(
+                {'error': "Unknown fields: " + ', '.join(sorted(unknown))
+                          + ". Parameter 'fields' must be a list of "
+                          + ', '.join(snapshots.SERIALIZED_FIELDS) + "."},
+                status=400)
+        # The catalog number is needed to fetch the next page
+        fields.add('catalog_number')
+
+    # Snapshots of an older format can't filter on the attributes yet
+    snapshot = snapshots.current()
+    if (snapshot is not None and fields is None
+            and (not satellite_filter.attributes
+                 or snapshot.format == snapshots.SNAPSHOT_FORMAT)):
+        encoding = request_encoding(request)
+        return encoded_response(
+            snapshot.page(satellite_filter, after, limit, encoding),
+            encoding, 'application/json', snapshot)
+
+    # By default, all satellites will be retrieved. Otherwise, the filters
+    # will be applied in a single query.
+    sats = satellite_filter.apply(Satellite.objects.order_by(
+        'satellite_catalog_number'))
+    if after is not None:
+        sats = sats.filter(satellite_catalog_number__gt=after)
+    if limit is not None:
+        sats = sats[:limit]
 
-    resp = serializedSatellites(sats)
-    # Returns a JSON-serialized list of the fetched satellites
-    return JsonResponse({'satellites': resp})
+    # Streams a JSON-serialized list of the fetched satellites
+    if fields is not None:
+        return StreamingHttpResponse(
+            snapshots.stream_projected(sats, fields),
+            content_type='application/json')
+    return StreamingHttpResponse(snapshots.stream_body(sats),
+                                 content_type='application/json')
 
 
-@cache_page(STANDARD_CACHING_LENGTH)
+@dataset_condition
+@dataset_cache_page(STANDARD_CACHING_LENGTH)
 @api_view(['GET'])
 def categories(request: HttpRequest):
     """
@@ -110,7 +290,8 @@ def categories(request: HttpRequest):
     return JsonResponse({'categories': catList})
 
 
-@cache_page(STANDARD_CACHING_LENGTH)
+@dataset_condition
+@dataset_cache_page(STANDARD_CACHING_LENGTH)
 @api_view(['GET'])
 def launch_years(request: HttpRequest):
     """
@@ -123,7 +304,8 @@ def launch_years(request: HttpRequest):
     return JsonResponse({'launch_years': launch_years_list})
 
 
-@cache_page(STANDARD_CACHING_LENGTH)
+@dataset_condition
+@dataset_cache_page(STANDARD_CACHING_LENGTH)
 @api_view(['GET'])
 def countries(request: HttpRequest):
     """
@@ -133,4 +315,710 @@ def countries(request: HttpRequest):
     views_logger.info("Endpoint 'countries' was called.")
     distinct_countries = Satellite.objects.values('country').distinct()
     countries_list = [c['country'] for c in distinct_countries]
-    return JsonResponse({'countries': countries_list})
\ No newline at end of file
+    return JsonResponse({'countries': countries_list})
+
+
+@encoded_dataset_condition
+@dataset_cache_page(SATELLITES_CACHING_LENGTH)
+@api_view(['GET'])
+def meta(request: HttpRequest):
+    """
+    Endpoint for fetching the number of satellites per category, country,
+    launch year and classification (see facets.py). Takes the same filter
+    parameters as the main endpoint. Without a filter, the counts computed
+    when the dataset version was published are served.
+    """
+    views_logger.info("Endpoint 'meta' was called with parameters "
+                      + str(dict(request.GET.items())) + ".")
+
+    try:
+        satellite_filter = filters.parse_filter(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    snapshot = snapshots.current()
+    if snapshot is None or snapshot.format != snapshots.SNAPSHOT_FORMAT:
+        return JsonResponse(
+            {'error': 'No dataset version is available yet.'}, status=503)
+
+    encoding = request_encoding(request)
+    if not (satellite_filter.attributes or any(
+            cat in snapshot.categories
+            for cat in satellite_filter.categories)):
+        body = snapshot.read('meta.json', encoding)
+    else:
+        body = facets.encode_meta(snapshot, satellite_filter)
+        if encoding is not None:
+            body = compression.compress(body, encoding)
+    return encoded_response(body, encoding, 'application/json', snapshot)
+
+
+@encoded_dataset_condition
+@dataset_cache_page(SATELLITES_CACHING_LENGTH)
+@api_view(['GET'])
+def catalog(request: HttpRequest):
+    """
+    Endpoint for fetching the satellites as a binary catalogue (see
+    binary_catalog.py) with the numeric orbital elements of every
+    satellite. Takes the same 'filter' parameter as the main endpoint.
+    """
+    filter = request.GET.get('filter', '')
+    filter_elements = [element.strip() for element in filter.split(',')]
+
+    views_logger.info("Endpoint 'catalog' was called with filter elements "
+                      + str(filter_elements) + ".")
+
+    mask = binary_catalog.category_mask(filter_elements)
+
+    # Snapshots of an older format may have no binary catalogue
+    snapshot = snapshots.current()
+    if (snapshot is not None
+            and snapshot.format == snapshots.SNAPSHOT_FORMAT):
+        encoding = request_encoding(request)
+        if not mask:
+            data = snapshot.read('catalog.bin', encoding)
+        else:
+            data = binary_catalog.select(snapshot.read('catalog.bin'), mask)
+            if encoding is not None:
+                data = compression.compress(data, encoding)
+        return encoded_response(data, encoding, 'application/octet-stream',
+                                snapshot)
+
+    builder = binary_catalog.CatalogBuilder()
+    for sat, sat_categories in snapshots.iter_satellites(
+            Satellite.objects.order_by('satellite_catalog_number')):
+        builder.add(sat, sat_categories)
+    data = builder.pack(0)
+    if mask:
+        data = binary_catalog.select(data, mask)
+
+    return HttpResponse(data, content_type='application/octet-stream')
+
+
+@encoded_dataset_condition
+@dataset_cache_page(STANDARD_CACHING_LENGTH)
+@api_view(['GET'])
+def changes(request: HttpRequest):
+    """
+    Endpoint for fetching the satellites that were added, changed or
+    removed since the dataset version given in the 'since' parameter.
+    When the changes since that version are no longer known, the whole
+    catalogue is returned instead.
+    """
+    since = request.GET.get('since', '')
+
+    views_logger.info("Endpoint 'changes' was called with since='"
+                      + since + "'.")
+
+    try:
+        since = int(since)
+    except ValueError:
+        return JsonResponse(
+            {'error': "Parameter 'since' must be a dataset version."},
+            status=400)
+
+    snapshot = snapshots.current()
+    if snapshot is None:
+        return JsonResponse(
+            {'error': 'No dataset version is available yet.'}, status=503)
+
+    delta = snapshots.changes_since(since)
+    if delta is None:
+        body = snapshots.encode_full(snapshot)
+    else:
+        body = snapshots.encode_changes(snapshot, *delta)
+
+    encoding = request_encoding(request)
+    if encoding is not None:
+        body = compression.compress(body, encoding)
+    return encoded_response(body, encoding, 'application/json', snapshot)
+
+
+@api_view(['GET'])
+def positions(request: HttpRequest):
+    """
+    Endpoint for fetching the positions and speeds of the satellites at
+    the time given in the 'time' parameter (ISO 8601, UTC by default),
+    or now. It allows for filtering on categories. The satellites are
+    propagated on the server, and returned in the packed layout of the
+    web workers, ordered by catalog number.
+    """
+    filter_elements = category_filter(request)
+    time = request.GET.get('time', '')
+
+    views_logger.info("Endpoint 'positions' was called with filter elements "
+                      + str(filter_elements) + " and time='" + time + "'.")
+
+    try:
+        timestamp = propagation.parse_time(time)
+    except ValueError:
+        return JsonResponse(
+            {'error': "Parameter 'time' must be an ISO 8601 time."},
+            status=400)
+
+    propagator, snapshot = propagation.current()
+    propagator = propagator.subset(
+        binary_catalog.category_mask(filter_elements))
+
+    headers = {'X-Satellite-Count': str(len(propagator))}
+    if snapshot is not None:
+        headers['X-Dataset-Version'] = str(snapshot.version)
+    return HttpResponse(propagator.positions(timestamp),
+                        content_type='application/octet-stream',
+                        headers=headers)
+
+
+@api_view(['GET'])
+def ephemeris_range(request: HttpRequest):
+    """
+    Endpoint for fetching the precomputed positions of the satellites
+    between the times in the 'start' and 'end' parameters (ISO 8601, UTC
+    by default). 'start' defaults to now and 'end' to an hour later. The
+    satellites can be selected with a list of catalog numbers in the
+    'satellites' parameter, or else filtered on categories.
+    """
+    filter_elements = category_filter(request)
+    selection = request.GET.get('satellites', '')
+    start = request.GET.get('start', '')
+    end = request.GET.get('end', '')
+
+    views_logger.info("Endpoint 'ephemeris' was called with filter elements "
+                      + str(filter_elements) + ", satellites='" + selection
+                      + "', start='" + start + "' and end='" + end + "'.")
+
+    try:
+        start = propagation.parse_time(start)
+        end = propagation.parse_time(end) if end else start + 3600
+        selection = [int(number) for number in selection.split(',')
+                     if number]
+    except ValueError:
+        return JsonResponse(
+            {'error': "Parameters 'start' and 'end' must be ISO 8601 times"
+                      " and 'satellites' a list of catalog numbers."},
+            status=400)
+
+    snapshot = snapshots.current()
+    grid = ephemeris.find(snapshot) if snapshot is not None else None
+    if grid is None:
+        return JsonResponse(
+            {'error': 'No ephemeris is available yet.'}, status=503)
+
+    window = grid.window(start, end)
+    if window is None:
+        return JsonResponse(
+            {'error': 'The ephemeris only covers '
+                      + datetime.fromtimestamp(grid.start, timezone.utc)
+                      .isoformat() + ' to '
+                      + datetime.fromtimestamp(grid.end, timezone.utc)
+                      .isoformat() + '.'},
+            status=404)
+
+    if selection:
+        rows = grid.indices(selection)
+    else:
+        mask = binary_catalog.category_mask(filter_elements)
+        rows = (None if not mask else np.flatnonzero(
+            binary_catalog.unpack(snapshot.read('catalog.bin'))[1]
+            ['category_mask'] & mask))
+    row_count = len(grid.catalog_numbers) if rows is None else len(rows)
+    if row_count * (window[1] - window[0]) > ephemeris.EPHEMERIS_MAX_SAMPLES:
+        return JsonResponse(
+            {'error': 'At most ' + str(ephemeris.EPHEMERIS_MAX_SAMPLES)
+                      + ' samples can be requested at once.'},
+            status=400)
+    positions = grid.slice(rows, *window)
+
+    headers = {
+        'X-Dataset-Version': str(snapshot.version),
+        'X-Satellite-Count': str(positions.shape[0]),
+        'X-Sample-Count': str(positions.shape[1]),
+        'X-Ephemeris-Start': str(grid.start + window[0] * grid.step),
+        'X-Ephemeris-Step': str(grid.step),
+    }
+    if selection:
+        headers['X-Catalog-Numbers'] = ','.join(
+            str(number) for number in grid.catalog_numbers[rows].tolist())
+    return HttpResponse(positions.tobytes(),
+                        content_type='application/octet-stream',
+                        headers=headers)
+
+
+def track_response(request: HttpRequest, catalog_numbers):
+    """
+    Returns the response of the track endpoints for the satellites with the
+    given catalog numbers, sampled according to the 'start', 'end' and
+    'step' parameters. The tracks are streamed one satellite at a time.
+    """
+    try:
+        timestamps = tracks.sample_times(request.GET.get('start', ''),
+                                         request.GET.get('end', ''),
+                                         request.GET.get('step', ''))
+    except ValueError as e:
+        return JsonResponse(
+            {'error': "Parameters 'start' and 'end' must be ISO 8601 times"
+                      " and 'step' a positive number of seconds. "
+                      + str(e) + '.'},
+            status=400)
+    if len(catalog_numbers) * len(timestamps) > tracks.TRACK_MAX_SAMPLES:
+        return JsonResponse(
+            {'error': 'At most ' + str(tracks.TRACK_MAX_SAMPLES)
+                      + ' samples can be requested at once.'},
+            status=400)
+
+    propagator, snapshot = propagation.current()
+    version = snapshot.version if snapshot is not None else None
+    found, computed = tracks.compute_tracks(
+        propagator, version, catalog_numbers, timestamps,
+        SATELLITES_CACHING_LENGTH)
+    if not found:
+        return JsonResponse({'error': 'No such satellite.'}, status=404)
+
+    headers = {
+        'X-Satellite-Count': str(len(found)),
+        'X-Sample-Count': str(len(timestamps)),
+        'X-Track-Start': repr(float(timestamps[0])),
+        'X-Track-Step': repr(float(timestamps[1] - timestamps[0])
+                             if len(timestamps) > 1 else 0.0),
+        'X-Catalog-Numbers': ','.join(str(number) for number in found),
+    }
+    if version is not None:
+        headers['X-Dataset-Version'] = str(version)
+    return StreamingHttpResponse(
+        (computed[number] for number in found),
+        content_type='application/octet-stream',
+        headers=headers)
+
+
+@api_view(['GET'])
+def track(request: HttpRequest, catalog_number: int):
+    """
+    Endpoint for fetching the orbit path and ground track of a
+    satellite, from 'start' to 'end' (ISO 8601, UTC by default) every
+    'step' seconds.
+    """
+    views_logger.info("Endpoint 'track' was called for satellite "
+                      + str(catalog_number) + " with parameters "
+                      + str(dict(request.GET.items())) + ".")
+    return track_response(request, [catalog_number])
+
+
+@api_view(['GET'])
+def multiple_tracks(request: HttpRequest):
+    """
+    Endpoint for fetching the orbit paths and ground tracks of the
+    satellites in the 'satellites' parameter (a list of catalog numbers),
+    from 'start' to 'end' (ISO 8601, UTC by default) every 'step' seconds.
+    """
+    selection = request.GET.get('satellites', '')
+    views_logger.info("Endpoint 'tracks' was called with parameters "
+                      + str(dict(request.GET.items())) + ".")
+
+    try:
+        catalog_numbers = sorted(set(
+            int(number) for number in selection.split(',') if number))
+    except ValueError:
+        catalog_numbers = []
+    if not catalog_numbers:
+        return JsonResponse(
+            {'error': "Parameter 'satellites' must be a list of catalog"
+                      " numbers."},
+            status=400)
+    return track_response(request, catalog_numbers)
+
+
+# Limits of the spatial queries
+MAX_NEARBY_RADIUS = 100000
+MAX_NEAREST_COUNT = 1000
+
+
+def spatial_query(request: HttpRequest):
+    """
+    Reads the common parameters of the spatial endpoints: the time, the
+    category filter and the queried point, which is either the satellite
+    in the 'satellite' parameter or the 'lat', 'lng' and 'alt' (km,
+    default 0) parameters. Returns the spatial index, the snapshot, the
+    Earth-fixed point and the row of the queried satellite (or None).
+    Raises a ValueError with a message for the client if the parameters
+    can't be used.
+    """
+    try:
+        timestamp = propagation.parse_time(request.GET.get('time', ''))
+    except ValueError:
+        raise ValueError("Parameter 'time' must be an ISO 8601 time.")
+    mask = binary_catalog.category_mask(category_filter(request))
+
+    if 'satellite' in request.GET:
+        try:
+            catalog_number = int(request.GET['satellite'])
+        except ValueError:
+            raise ValueError("Parameter 'satellite' must be a catalog number.")
+        # The satellite itself is looked up among all satellites
+        index, snapshot = spatial.index_at(timestamp)
+        row = index.row(catalog_number)
+        if row is None:
+            raise LookupError('No such satellite, or it has no position.')
+        point = index.positions[row]
+        if mask:
+            index, snapshot = spatial.index_at(timestamp, mask)
+            row = index.row(catalog_number)
+        return index, snapshot, point, row
+
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lng'])
+        altitude = float(request.GET.get('alt', 0))
+    except (KeyError, ValueError):
+        raise ValueError("Parameters 'lat' and 'lng' (and optionally 'alt')"
+                         " or 'satellite' must be given.")
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError("Parameters 'lat' and 'lng' must be in degrees.")
+    index, snapshot = spatial.index_at(timestamp, mask)
+    point = propagation.geodetic_to_ecef(latitude, longitude, altitude)
+    return index, snapshot, point, None
+
+
+def spatial_response(index, snapshot, catalog_numbers, distances):
+    """
+    Returns the response of the spatial endpoints for the found
+    satellites and their distances (km).
+    """
+    headers = {}
+    if snapshot is not None:
+        headers['X-Dataset-Version'] = str(snapshot.version)
+    return JsonResponse({
+        'time': datetime.fromtimestamp(index.timestamp,
+                                       timezone.utc).isoformat(),
+        'satellites': [
+            {'catalog_number': number, 'distance': round(distance, 3)}
+            for number, distance in zip(catalog_numbers.tolist(),
+                                        distances.tolist())],
+    }, headers=headers)
+
+
+@api_view(['GET'])
+def nearby(request: HttpRequest):
+    """
+    Endpoint for fetching the satellites within 'radius' km of a point or
+    a satellite at a given time, nearest first. It allows for filtering
+    on categories.
+    """
+    views_logger.info("Endpoint 'nearby' was called with parameters "
+                      + str(dict(request.GET.items())) + ".")
+
+    try:
+        radius = float(request.GET.get('radius', ''))
+        if not 0 <= radius <= MAX_NEARBY_RADIUS:
+            raise ValueError
+    except ValueError:
+        return JsonResponse(
+            {'error': "Parameter 'radius' must be a distance in km of at"
+                      " most " + str(MAX_NEARBY_RADIUS) + "."},
+            status=400)
+
+    try:
+        index, snapshot, point, row = spatial_query(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except LookupError as e:
+        return JsonResponse({'error': str(e)}, status=404)
+
+    return spatial_response(index, snapshot,
+                            *index.within(point, radius, exclude=row))
+
+
+@api_view(['GET'])
+def nearest(request: HttpRequest):
+    """
+    Endpoint for fetching the 'k' (default 10) satellites nearest to a
+    point or a satellite at a given time, nearest first. It allows for
+    filtering on categories.
+    """
+    views_logger.info("Endpoint 'nearest' was called with parameters "
+                      + str(dict(request.GET.items())) + ".")
+
+    try:
+        k = int(request.GET.get('k', 10))
+        if not 1 <= k <= MAX_NEAREST_COUNT:
+            raise ValueError
+    except ValueError:
+        return JsonResponse(
+            {'error': "Parameter 'k' must be a number from 1 to "
+                      + str(MAX_NEAREST_COUNT) + "."},
+            status=400)
+
+    try:
+        index, snapshot, point, row = spatial_query(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except LookupError as e:
+        return JsonResponse({'error': str(e)}, status=404)
+
+    return spatial_response(index, snapshot,
+                            *index.nearest(point, k, exclude=row))
+
+
+def route_end(request: HttpRequest, graph, end):
+    """
+    Returns the row in the link graph of one end ('from' or 'to') of a
+    route: the satellite in the '<end>_satellite' parameter, or the
+    satellite nearest to the '<end>_lat', '<end>_lng' and '<end>_alt'
+    (km, default 0) parameters. Raises a ValueError for unusable
+    parameters and a LookupError if there is no such satellite.
+    """
+    if end + '_satellite' in request.GET:
+        try:
+            catalog_number = int(request.GET[end + '_satellite'])
+        except ValueError:
+            raise ValueError("Parameter '" + end + "_satellite' must be a"
+                             " catalog number.")
+        rows = np.flatnonzero(graph.catalog_numbers == catalog_number)
+        if len(rows) == 0 or not np.isfinite(graph.positions[rows[0]]).all():
+            raise LookupError('No such satellite (in the filtered'
+                              ' categories), or it has no position.')
+        return int(rows[0])
+
+    try:
+        latitude = float(request.GET[end + '_lat'])
+        longitude = float(request.GET[end + '_lng'])
+        altitude = float(request.GET.get(end + '_alt', 0))
+    except (KeyError, ValueError):
+        raise ValueError("Parameters '" + end + "_lat' and '" + end
+                         + "_lng' or '" + end + "_satellite' must be given.")
+    row = graph.nearest(propagation.geodetic_to_ecef(
+        latitude, longitude, altitude))
+    if row is None:
+        raise LookupError('There are no satellites to route over.')
+    return row
+
+
+@api_view(['GET'])
+def route(request: HttpRequest):
+    """
+    Endpoint for fetching the shortest route between two satellites, or
+    between the satellites nearest to two points, over the links between
+    satellites at a given time. It allows for filtering on categories.
+    """
+    views_logger.info("Endpoint 'route' was called with parameters "
+                      + str(dict(request.GET.items())) + ".")
+
+    try:
+        timestamp = propagation.parse_time(request.GET.get('time', ''))
+    except ValueError:
+        return JsonResponse(
+            {'error': "Parameter 'time' must be an ISO 8601 time."},
+            status=400)
+    mask = binary_catalog.category_mask(category_filter(request))
+
+    graph, snapshot = links.graph_at(timestamp, mask)
+    try:
+        source = route_end(request, graph, 'from')
+        goal = route_end(request, graph, 'to')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except LookupError as e:
+        return JsonResponse({'error': str(e)}, status=404)
+
+    found = graph.shortest_path(source, goal)
+    if found is None:
+        return JsonResponse(
+            {'error': 'The satellites are not connected by links.'},
+            status=404)
+    rows, distance = found
+
+    # The positions are Earth-fixed, so no rotation is needed
+    latitude, longitude, altitude = propagation.teme_to_geodetic(
+        graph.positions[rows], 0.0)
+    headers = {}
+    if snapshot is not None:
+        headers['X-Dataset-Version'] = str(snapshot.version)
+    return JsonResponse({
+        'time': datetime.fromtimestamp(graph.timestamp,
+                                       timezone.utc).isoformat(),
+        'distance': round(distance, 3),
+        'path': [{'catalog_number': number, 'lat': round(lat, 5),
+                  'lng': round(lng, 5), 'alt': round(alt, 3)}
+                 for number, lat, lng, alt in zip(
+                     graph.catalog_numbers[rows].tolist(),
+                     latitude.tolist(), longitude.tolist(),
+                     altitude.tolist())],
+    }, headers=headers)
+
+
+def pass_time(timestamp):
+    """
+    Returns a time of a pass as an ISO 8601 time, or None.
+    """
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(round(timestamp), timezone.utc).isoformat()
+
+
+@api_view(['GET'])
+def satellite_passes(request: HttpRequest):
+    """
+    Endpoint for fetching the passes of satellites over the location in the
+    'lat', 'lng' and 'alt' (km, default 0) parameters, from 'start' (ISO
+    8601, default now) for 'days' days: the times at which they rise above
+    'min_elevation' degrees, culminate and set again. The satellites can be
+    selected with a list of catalog numbers in the 'satellites' parameter,
+    or else filtered on categories.
+    """
+    views_logger.info("Endpoint 'passes' was called with parameters "
+                      + str(dict(request.GET.items())) + ".")
+
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lng'])
+        altitude = float(request.GET.get('alt', 0))
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError
+    except (KeyError, ValueError):
+        return JsonResponse(
+            {'error': "Parameters 'lat' and 'lng' (and optionally 'alt')"
+                      " must be given, in degrees."},
+            status=400)
+
+    try:
+        start = propagation.parse_time(request.GET.get('start', ''))
+        days = int(request.GET.get('days', passes.DEFAULT_PASS_DAYS))
+        min_elevation = float(request.GET.get(
+            'min_elevation', passes.DEFAULT_MIN_ELEVATION))
+        selection = sorted(set(
+            int(number) for number in
+            request.GET.get('satellites', '').split(',') if number))
+        if not (1 <= days <= passes.MAX_PASS_DAYS
+                and -90 <= min_elevation <= 90):
+            raise ValueError
+    except ValueError:
+        return JsonResponse(
+            {'error': "Parameter 'start' must be an ISO 8601 time, 'days' a"
+                      " number from 1 to " + str(passes.MAX_PASS_DAYS)
+                      + ", 'min_elevation' an elevation in degrees and"
+                      " 'satellites' a list of catalog numbers."},
+            status=400)
+
+    propagator, snapshot = propagation.current()
+    if selection:
+        propagator = propagator.select(selection)
+    else:
+        selection = binary_catalog.category_mask(category_filter(request))
+        propagator = propagator.subset(selection)
+    if (len(propagator.catalog_numbers) * days
+            > passes.PASS_MAX_SATELLITE_DAYS):
+        return JsonResponse(
+            {'error': 'At most ' + str(passes.PASS_MAX_SATELLITE_DAYS)
+                      + ' satellites times days can be requested at once.'},
+            status=400)
+
+    found = passes.cached_passes(
+        propagator, snapshot.version if snapshot is not None else None,
+        latitude, longitude, altitude, start, days, min_elevation, selection)
+
+    headers = {}
+    if snapshot is not None:
+        headers['X-Dataset-Version'] = str(snapshot.version)
+    return JsonResponse({
+        'passes': [{'catalog_number': item['catalog_number'],
+                    'rise': pass_time(item['rise']),
+                    'culmination': pass_time(item['culmination']),
+                    'set': pass_time(item['set']),
+                    'max_elevation': round(item['max_elevation'], 2)}
+                   for item in found],
+    }, headers=headers)
+
+
+# Default and maximum number of conjunctions in a response
+DEFAULT_CONJUNCTION_COUNT = 100
+MAX_CONJUNCTION_COUNT = 1000
+
+
+@api_view(['GET'])
+def conjunctions(request: HttpRequest):
+    """
+    Endpoint for fetching the conjunctions (close approaches between two
+    satellites) found by the last screening, ordered by time. They can be
+    limited to those of the satellite in the 'satellite' parameter,
+    between the times in the 'start' and 'end' parameters (ISO 8601, UTC
+    by default) and closer than 'max_distance' km. At most 'limit'
+    conjunctions are returned.
+    """
+    views_logger.info("Endpoint 'conjunctions' was called with parameters "
+                      + str(dict(request.GET.items())) + ".")
+
+    found = Conjunction.objects.order_by('time', 'first_catalog_number',
+                                         'second_catalog_number')
+    try:
+        if request.GET.get('satellite'):
+            catalog_number = int(request.GET['satellite'])
+            found = found.filter(
+                Q(first_catalog_number=catalog_number)
+                | Q(second_catalog_number=catalog_number))
+        if request.GET.get('start'):
+            found = found.filter(time__gte=datetime.fromtimestamp(
+                propagation.parse_time(request.GET['start']), timezone.utc))
+        if request.GET.get('end'):
+            found = found.filter(time__lte=datetime.fromtimestamp(
+                propagation.parse_time(request.GET['end']), timezone.utc))
+        if request.GET.get('max_distance'):
+            found = found.filter(
+                distance__lte=float(request.GET['max_distance']))
+        limit = int(request.GET.get('limit', DEFAULT_CONJUNCTION_COUNT))
+        if not 1 <= limit <= MAX_CONJUNCTION_COUNT:
+            raise ValueError
+    except ValueError:
+        return JsonResponse(
+            {'error': "Parameter 'satellite' must be a catalog number,"
+                      " 'start' and 'end' ISO 8601 times, 'max_distance' a"
+                      " distance in km and 'limit' a number from 1 to "
+                      + str(MAX_CONJUNCTION_COUNT) + "."},
+            status=400)
+
+    found = list(found[:limit])
+    headers = {}
+    if found:
+        headers['X-Dataset-Version'] = str(found[0].version_id)
+    return JsonResponse({
+        'conjunctions': [{
+            'first_catalog_number': conjunction.first_catalog_number,
+            'second_catalog_number': conjunction.second_catalog_number,
+            'time': conjunction.time.isoformat(),
+            'distance': round(conjunction.distance, 3),
+            'relative_speed': round(conjunction.relative_speed, 3),
+        } for conjunction in found],
+    }, headers=headers)
+
+
+@api_view(['GET'])
+def satellite_search(request: HttpRequest):
+    """
+    Endpoint for finding satellites by (a part of) their name or catalog
+    number, best matches first (see search.py). Meant for typeahead, so
+    it is answered from an index in memory instead of the database.
+    """
+    query = request.GET.get('q', '')
+
+    views_logger.info("Endpoint 'search' was called with parameters "
+                      + str(dict(request.GET.items())) + ".")
+
+    try:
+        limit = int(request.GET.get('limit', search.DEFAULT_SEARCH_COUNT))
+        if not 1 <= limit <= search.MAX_SEARCH_COUNT:
+            raise ValueError
+    except ValueError:
+        return JsonResponse(
+            {'error': "Parameter 'limit' must be a number from 1 to "
+                      + str(search.MAX_SEARCH_COUNT) + "."},
+            status=400)
+
+    snapshot = snapshots.current()
+    index = search.index_for(snapshot)
+    rows = index.search(query, limit)
+
+    headers = {}
+    if snapshot is not None:
+        headers['X-Dataset-Version'] = str(snapshot.version)
+    return JsonResponse({
+        'satellites': [
+            {'catalog_number': int(index.catalog_numbers[row]),
+             'name': index.names[row]} for row in rows],
+    }, headers=headers)